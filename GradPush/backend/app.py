@@ -6,27 +6,43 @@ Flask应用主入口文件
 是整个后端应用的启动点和核心配置文件。
 """
 
-from flask import Flask, request, jsonify, send_from_directory, make_response
+from flask import Flask, request, jsonify, make_response
 from flask_cors import CORS
 from flask_migrate import Migrate
 import os
-import logging
-from logging.handlers import RotatingFileHandler
+from werkzeug.exceptions import NotFound
 from werkzeug.utils import safe_join
-from urllib.parse import quote
-from extensions import db, session
+from extensions import (
+    db,
+    session,
+    job_runner,
+    password_hasher,
+    request_metrics,
+    resumable_uploads,
+    thumbnails,
+)
+from utils.logging_setup import configure_logging
+from utils.metrics import init_app_metrics
+from utils.password_hasher import BUSY_MESSAGE, PasswordHasherBusy
+from utils.static_files import send_upload
+from utils.streaming_upload import StreamingUploadRequest
 import datetime
 import pytz
+import click
 
 # 创建应用实例
 app = Flask(__name__)
 
+# 上传文件在解析multipart时直接写入临时文件，并按视图设置的大小限制中止
+app.request_class = StreamingUploadRequest
+
 # 配置CORS，支持跨域请求
 CORS(
     app,
     origins="*",
     supports_credentials=True,
-    allow_headers=["Content-Type", "Authorization", "X-Requested-With"],
+    allow_headers=["Content-Type", "Authorization", "X-Requested-With", "Upload-Offset"],
+    expose_headers=["X-Captcha-Token", "X-Request-ID", "Upload-Offset"],
     methods=["GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS"],
 )
 
@@ -39,32 +55,9 @@ app.config["JSONIFY_MIMETYPE"] = "application/json; charset=utf-8"  # 设置响
 
 # 配置日志
 LOG_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs')
-os.makedirs(LOG_FOLDER, exist_ok=True)
-
-# 设置日志格式
-log_formatter = logging.Formatter(
-    '%(asctime)s [%(levelname)s] [%(module)s:%(funcName)s:%(lineno)d] - %(message)s'
-)
-
-# 配置文件日志
-file_handler = RotatingFileHandler(
-    os.path.join(LOG_FOLDER, 'app.log'),
-    maxBytes=10 * 1024 * 1024,  # 10MB
-    backupCount=5,
-    encoding='utf-8'  # 设置文件编码为UTF-8，解决中文乱码问题
-)
-file_handler.setFormatter(log_formatter)
-file_handler.setLevel(logging.INFO)
 
-# 配置控制台日志
-console_handler = logging.StreamHandler()
-console_handler.setFormatter(log_formatter)
-console_handler.setLevel(logging.DEBUG)
-
-# 添加日志处理器
-app.logger.addHandler(file_handler)
-app.logger.addHandler(console_handler)
-app.logger.setLevel(logging.DEBUG)
+# 配置异步日志（JSON格式的日志文件、按模块的日志级别、请求ID）
+configure_logging(app, LOG_FOLDER)
 
 # 记录应用启动信息
 app.logger.info("应用启动，日志系统已配置")
@@ -76,6 +69,24 @@ migrate = Migrate(app, db)
 # 初始化session
 session.init_app(app)
 
+# 初始化后台任务执行器
+job_runner.init_app(app)
+
+# 初始化密码哈希服务
+password_hasher.init_app(app)
+
+# 初始化请求耗时和SQL查询统计
+request_metrics.init_app(app)
+
+# 初始化断点续传会话存储
+resumable_uploads.init_app(app)
+
+# 初始化缩略图缓存
+thumbnails.init_app(app)
+
+# 注册采集时读取的运行指标（连接池、后台任务、验证码池）
+init_app_metrics(app, db, job_runner)
+
 # 先创建数据库对象，再导入模型
 from models import User, Application, Rule
 
@@ -89,158 +100,96 @@ from blueprints.public_bp import public_bp
 from blueprints.organization_bp import organization_bp
 from blueprints.score_bp import score_bp
 from blueprints.system_bp import system_bp
+from blueprints.job_bp import job_bp
+from blueprints.upload_bp import upload_bp
 from routes import main_bp
 
 
 # 配置推免文件的静态服务
 @app.route("/uploads/graduate-files/<path:filename>")
 def uploaded_graduate_file(filename):
-    print(f"===== 下载推免文件 =====")
-    print(f"请求的文件名: {filename}")
-
     from models import GraduateFile
 
-    # 先打印配置信息
-    print(f"GRADUATE_FILES_FOLDER配置: {app.config['GRADUATE_FILES_FOLDER']}")
-
-    # 检查文件是否存在
-    file_path = os.path.join(app.config["GRADUATE_FILES_FOLDER"], filename)
-    print(f"检查文件是否存在: {file_path}")
-    print(f"文件是否存在: {os.path.exists(file_path)}")
-
-    if not os.path.exists(file_path):
-        return jsonify({"error": "文件不存在"}), 404
+    # 按文件系统中的文件名（唯一索引）查找原始文件名用于下载
+    graduate_file = GraduateFile.query.filter_by(stored_name=filename).first()
+    if graduate_file:
+        download_filename = graduate_file.filename
+        app.logger.debug("下载推免文件 %s，原始文件名: %s", filename, download_filename)
+    else:
+        download_filename = filename  # 没有数据库记录时使用传入的文件名
+        app.logger.debug("未找到推免文件 %s 的数据库记录，使用默认文件名", filename)
 
-    # 尝试发送文件
     try:
-        # 使用传入的filename作为文件系统中的文件名
-        response = send_from_directory(app.config["GRADUATE_FILES_FOLDER"], filename)
-
-        # 尝试从数据库获取原始文件名用于下载
-        # 优化查询逻辑，使用更可靠的方式匹配文件名
-        graduate_file = GraduateFile.query.filter(
-            GraduateFile.filepath.contains(filename)
-        ).first()
-
-        # 如果第一种方式失败，尝试更精确的匹配方式
-        if not graduate_file:
-            # 构建一个更精确的查询条件，确保只匹配完整的文件名部分
-            from sqlalchemy import or_
-
-            graduate_file = GraduateFile.query.filter(
-                or_(
-                    GraduateFile.filepath.endswith(
-                        f"\\{filename}"
-                    ),  # Windows路径分隔符
-                    GraduateFile.filepath.endswith(f"/{filename}"),  # Linux路径分隔符
-                    GraduateFile.filepath == filename,  # 直接匹配
-                )
-            ).first()
-        # 直接使用send_from_directory的as_attachment参数和download_name参数
-        # 这样可以确保使用原始文件名进行下载
-        download_filename = filename  # 默认使用传入的文件名
-
-        if graduate_file:
-            download_filename = graduate_file.filename  # 使用原始文件名
-            print(f"找到原始文件名: {download_filename}")
-        else:
-            print(f"未找到数据库记录，使用默认文件名: {download_filename}")
-
-        # 重新构建响应，确保使用正确的下载文件名
-        response = send_from_directory(
+        return send_upload(
             app.config["GRADUATE_FILES_FOLDER"],
             filename,
+            "graduate-files",
             as_attachment=True,
             download_name=download_filename,
         )
-
-        # 保持正确的Content-Type
-        if filename.lower().endswith(".pdf"):
-            response.headers["Content-Type"] = "application/pdf"
-        elif filename.lower().endswith(".txt"):
-            response.headers["Content-Type"] = "text/plain; charset=utf-8"
-        elif filename.lower().endswith(".doc"):
-            response.headers["Content-Type"] = "application/msword"
-        elif filename.lower().endswith(".docx"):
-            response.headers["Content-Type"] = (
-                "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-            )
-        elif filename.lower().endswith(".xls"):
-            response.headers["Content-Type"] = "application/vnd.ms-excel"
-        elif filename.lower().endswith(".xlsx"):
-            response.headers["Content-Type"] = (
-                "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            )
-        elif filename.lower().endswith(".ppt"):
-            response.headers["Content-Type"] = "application/vnd.ms-powerpoint"
-        elif filename.lower().endswith(".pptx"):
-            response.headers["Content-Type"] = (
-                "application/vnd.openxmlformats-officedocument.presentationml.presentation"
-            )
-
-        return response
+    except NotFound:
+        app.logger.debug("下载推免文件不存在: %s", filename)
+        return jsonify({"error": "文件不存在"}), 404
     except Exception as e:
-        print(f"发送文件时出错: {str(e)}")
+        app.logger.error(f"发送文件时出错: {str(e)}")
         return jsonify({"error": "文件下载失败"}), 500
 
 
 # 配置静态文件服务
 @app.route("/uploads/<path:filename>")
 def uploaded_file(filename):
-    response = send_from_directory(app.config["UPLOAD_FOLDER"], filename)
-    # 使用安全的方式处理中文文件名
-    response.headers["Content-Disposition"] = (
-        f"attachment; filename*=UTF-8" "={quote(filename)}"
+    return send_upload(
+        app.config["UPLOAD_FOLDER"], filename, "default", as_attachment=True
     )
-    return response
 
 
 # 配置头像文件的静态服务
 @app.route("/uploads/avatars/<path:filename>")
 def uploaded_avatar(filename):
-    response = send_from_directory(app.config["AVATAR_FOLDER"], filename)
     # 头像图片直接显示在浏览器中
-    response.headers["Content-Disposition"] = (
-        f"inline; filename*=UTF-8" "={quote(filename)}"
+    return send_upload(
+        app.config["AVATAR_FOLDER"], filename, "avatars", as_attachment=False
     )
-    return response
 
 
 # 配置普通文件的静态服务
 @app.route("/uploads/files/<path:filename>")
 def uploaded_app_file(filename):
-    # 检查文件是否是图片或PDF
-    is_image = filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.webp'))
-    is_pdf = filename.lower().endswith(".pdf")
-    response = send_from_directory(app.config["FILE_FOLDER"], filename)
-
-    if is_image or is_pdf:
-        # 图片和PDF文件设置为内联显示
-        response.headers["Content-Disposition"] = (
-            f"inline; filename*=UTF-8" "={quote(filename)}"
-        )
-        # 根据文件类型设置正确的Content-Type
-        if is_image:
-            # 根据文件扩展名设置对应的图片Content-Type
-            if filename.lower().endswith('.png'):
-                response.headers["Content-Type"] = "image/png"
-            elif filename.lower().endswith('.jpg') or filename.lower().endswith('.jpeg'):
-                response.headers["Content-Type"] = "image/jpeg"
-            elif filename.lower().endswith('.gif'):
-                response.headers["Content-Type"] = "image/gif"
-            elif filename.lower().endswith('.webp'):
-                response.headers["Content-Type"] = "image/webp"
-            else:
-                # 默认图片类型
-                response.headers["Content-Type"] = "image/jpeg"
-        elif is_pdf:
-            response.headers["Content-Type"] = "application/pdf"
-    else:
-        # 其他文件设置为附件下载
-        response.headers["Content-Disposition"] = (
-            f"attachment; filename*=UTF-8" "={quote(filename)}"
-        )
+    # 图片和PDF文件内联显示，其他文件作为附件下载
+    return send_upload(app.config["FILE_FOLDER"], filename, "files")
+
+
+# 配置证明材料缩略图服务（审核页面预览图片时使用，preset见 THUMBNAIL_PRESETS）
+@app.route("/uploads/thumbnails/<preset>/<path:filename>")
+def uploaded_app_file_thumbnail(preset, filename):
+    from utils.blob_store import content_sha256
 
+    if preset not in thumbnails.presets or not thumbnails.supports(filename):
+        return jsonify({"error": "不支持的缩略图"}), 404
+    source_path = safe_join(app.config["FILE_FOLDER"], filename)
+    if source_path is None or not os.path.isfile(source_path):
+        return jsonify({"error": "文件不存在"}), 404
+
+    # 内容寻址的附件以文件名中的sha256作为缓存键
+    fmt = thumbnails.choose_format(request.accept_mimetypes)
+    content_hash = content_sha256(os.path.basename(source_path))
+    thumbnail_path = thumbnails.get(source_path, preset, fmt, content_hash)
+    if thumbnail_path is None:
+        if filename.lower().endswith(".pdf"):
+            return jsonify({"error": "无法生成PDF预览"}), 404
+        # 图片无法生成缩略图时返回原图
+        return uploaded_app_file(filename)
+
+    # 缩略图文件的修改时间随访问更新，ETag由缓存键生成
+    response = send_upload(
+        os.path.dirname(thumbnail_path),
+        os.path.basename(thumbnail_path),
+        "immutable" if content_hash else "files",
+        as_attachment=False,
+        mimetype=thumbnails.mimetype(fmt),
+        etag=os.path.splitext(os.path.basename(thumbnail_path))[0] + "-" + fmt,
+    )
+    response.vary.add("Accept")
     return response
 
 
@@ -254,8 +203,48 @@ app.register_blueprint(admin_bp)
 app.register_blueprint(score_bp)  # score_bp 已经在定义时设置了 url_prefix='/api'
 app.register_blueprint(organization_bp)  # organization_bp 已经在定义时设置了 url_prefix='/api/organization'
 app.register_blueprint(system_bp)  # system_bp 已经在定义时设置了 url_prefix='/api/system'
+app.register_blueprint(job_bp)  # job_bp 已经在定义时设置了 url_prefix='/api/jobs'
+app.register_blueprint(upload_bp)  # upload_bp 已经在定义时设置了 url_prefix='/api/uploads'
 app.register_blueprint(main_bp, url_prefix='/api')
 
+
+# 密码哈希排队任务过多（登录高峰）时，所有设置或校验密码的接口都返回503
+@app.errorhandler(PasswordHasherBusy)
+def password_hasher_busy(e):
+    return jsonify({"message": BUSY_MESSAGE}), 503
+
+
+# 定期核对学生成绩汇总（可由cron调用：flask --app app reconcile-scores --fix）
+@app.cli.command("reconcile-scores")
+@click.option("--fix", is_flag=True, help="重新汇总存在偏差的学生")
+def reconcile_scores_command(fix):
+    from utils.score_aggregator import reconcile_student_scores
+
+    report = reconcile_student_scores(fix=fix)
+    if fix:
+        db.session.commit()
+    for drift in report["drifts"]:
+        app.logger.warning(f"学生成绩汇总偏差: {drift}")
+    click.echo(
+        f"核对学生{report['checked_students']}名，偏差{report['drifted_students']}名，"
+        f"已修复{report['fixed_students']}名；排名不一致{report['stale_rankings']}名，"
+        f"已重建{report['rebuilt_majors']}个专业"
+    )
+
+
+# 将旧附件迁移到内容寻址存储并核对引用计数（flask --app app dedupe-files）
+@app.cli.command("dedupe-files")
+def dedupe_files_command():
+    from utils.blob_store import dedupe_application_files
+
+    report = dedupe_application_files()
+    db.session.commit()
+    click.echo(
+        f"迁移旧附件{report['migrated_files']}个，修正引用计数{report['fixed_blobs']}个，"
+        f"清理未引用文件{report['orphaned_files']}个，缺失文件{report['missing_files']}个"
+    )
+
+
 # 根路径路由，解决直接访问/返回404的问题
 @app.route("/", methods=["GET"])
 def root_index():
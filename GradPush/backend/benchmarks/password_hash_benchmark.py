@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+密码校验（登录）基准测试
+
+在不同的bcrypt计算强度下，用多个并发线程模拟登录时的密码校验，统计：
+- 单次校验耗时
+- 每秒可完成的登录数
+- 校验期间其他请求的延迟（模拟轻量接口，在校验线程池饱和时是否仍能及时响应）
+
+不需要数据库连接。
+
+用法：
+    cd backend
+    python benchmarks/password_hash_benchmark.py --rounds 10 11 12 --concurrency 16 --logins 64
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from utils.password_hasher import PasswordHasher
+
+PASSWORD = "benchmark-password"
+
+
+def create_hasher(rounds, workers):
+    app = Flask(__name__)
+    app.config.update(
+        BCRYPT_ROUNDS=rounds,
+        PASSWORD_HASH_WORKERS=workers,
+        PASSWORD_HASH_MAX_PENDING=1_000_000,
+    )
+    return PasswordHasher(app)
+
+
+def measure_light_requests(stop, latencies):
+    """
+    模拟轻量接口：每10毫秒执行一次，记录实际延迟
+    """
+    while not stop.is_set():
+        start = time.perf_counter()
+        sum(range(1000))
+        latencies.append(time.perf_counter() - start)
+        time.sleep(0.01)
+
+
+def run(rounds_list, workers, concurrency, logins):
+    print(
+        f"{'强度':>4} {'单次校验(ms)':>14} {'登录/秒':>10} {'轻量请求最大延迟(ms)':>22}"
+    )
+    for rounds in rounds_list:
+        hasher = create_hasher(rounds, workers)
+        hashed = hasher.hash(PASSWORD)
+
+        start = time.perf_counter()
+        assert hasher.verify(PASSWORD, hashed)
+        single = time.perf_counter() - start
+
+        stop = threading.Event()
+        latencies = []
+        probe = threading.Thread(target=measure_light_requests, args=(stop, latencies))
+        probe.start()
+
+        # 并发的请求线程，每个线程都通过哈希服务校验密码
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as requests:
+            results = list(
+                requests.map(lambda _: hasher.verify(PASSWORD, hashed), range(logins))
+            )
+        elapsed = time.perf_counter() - start
+
+        stop.set()
+        probe.join()
+        assert all(results)
+
+        print(
+            f"{rounds:>4} {single * 1000:>14.1f} {logins / elapsed:>10.1f} "
+            f"{max(latencies) * 1000:>22.2f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="密码校验（登录）基准测试")
+    parser.add_argument(
+        "--rounds",
+        type=int,
+        nargs="+",
+        default=[10, 11, 12],
+        help="bcrypt计算强度列表",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=max(1, (os.cpu_count() or 2) // 2),
+        help="哈希服务线程数（PASSWORD_HASH_WORKERS）",
+    )
+    parser.add_argument("--concurrency", type=int, default=16, help="并发登录请求数")
+    parser.add_argument("--logins", type=int, default=64, help="每种强度的登录次数")
+    args = parser.parse_args()
+
+    print(f"哈希服务线程数: {args.workers}, 并发登录请求数: {args.concurrency}")
+    run(args.rounds, args.workers, args.concurrency, args.logins)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+学生排名接口基准测试
+
+在内存SQLite数据库中构造不同规模的学生和申请数据，调用
+GET /api/students/ranking，统计每次请求的SQL查询次数和耗时，
+用于验证查询次数不随学生人数增长。
+
+用法：
+    cd backend
+    python benchmarks/ranking_benchmark.py --sizes 100 1000 5000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+# 使用内存数据库，必须在导入app之前设置
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+from app import app
+from extensions import db
+from models import Faculty, Department, Major, Student, Application
+
+
+def seed_data(student_count, applications_per_student=4, majors=5):
+    """
+    构造测试数据
+    """
+    db.drop_all()
+    db.create_all()
+
+    faculty = Faculty(name="基准测试学院")
+    db.session.add(faculty)
+    db.session.flush()
+    department = Department(name="基准测试系", faculty_id=faculty.id)
+    db.session.add(department)
+    db.session.flush()
+    major_ids = []
+    for i in range(majors):
+        major = Major(name=f"专业{i}", department_id=department.id)
+        db.session.add(major)
+        db.session.flush()
+        major_ids.append(major.id)
+
+    students = []
+    applications = []
+    for i in range(student_count):
+        student_id = f"S{i:07d}"
+        students.append(
+            {
+                "student_id": student_id,
+                "student_name": f"学生{i}",
+                "faculty_id": faculty.id,
+                "department_id": department.id,
+                "major_id": major_ids[i % majors],
+                "academic_score": 60 + (i * 7) % 40,
+                "academic_specialty_total": (i % 15) * 1.0,
+                "comprehensive_performance_total": (i % 5) * 1.0,
+                "comprehensive_score": round(48 + (i * 7) % 32 + i % 20, 4),
+            }
+        )
+        for j in range(applications_per_student):
+            applications.append(
+                {
+                    "student_id": student_id,
+                    "student_name": f"学生{i}",
+                    "faculty_id": faculty.id,
+                    "department_id": department.id,
+                    "major_id": major_ids[i % majors],
+                    "application_type": "academic" if j % 2 else "comprehensive",
+                    "status": "approved" if j < 3 else "pending",
+                    "project_name": f"项目{j}",
+                    "final_score": 1.0,
+                }
+            )
+
+    db.session.execute(db.insert(Student), students)
+    db.session.execute(db.insert(Application), applications)
+    db.session.commit()
+
+
+def run(sizes):
+    counter = {"queries": 0}
+
+    def count_query(conn, cursor, statement, parameters, context, executemany):
+        counter["queries"] += 1
+
+    with app.app_context():
+        event.listen(db.engine, "before_cursor_execute", count_query)
+        client = app.test_client()
+
+        print(f"{'学生人数':>10} {'查询次数':>10} {'耗时(ms)':>12}")
+        for size in sizes:
+            seed_data(size)
+            db.session.remove()
+
+            counter["queries"] = 0
+            started = time.perf_counter()
+            response = client.get("/api/students/ranking")
+            elapsed = (time.perf_counter() - started) * 1000
+
+            assert response.status_code == 200, response.get_json()
+            assert response.get_json()["total"] == size
+            print(f"{size:>10} {counter['queries']:>10} {elapsed:>12.1f}")
+
+        event.remove(db.engine, "before_cursor_execute", count_query)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="学生排名接口基准测试")
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[100, 1000, 5000],
+        help="测试的学生人数规模",
+    )
+    args = parser.parse_args()
+    run(args.sizes)
+
+
+if __name__ == "__main__":
+    main()
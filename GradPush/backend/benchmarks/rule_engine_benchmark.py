@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+规则树计分基准测试
+
+构造不同规模的规则树，对比：
+- 未缓存：每次计分都重新编译规则树（等价于每次解析参数并遍历树）
+- 已缓存：使用按 (rule_id, 版本) 缓存的编译结果，计分为单次字典查找
+
+不需要数据库连接。
+
+用法：
+    cd backend
+    python benchmarks/rule_engine_benchmark.py --branching 4 6 8 --depth 4
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import RuleCalculation
+from utils.rule_engine import compile_rule_tree, get_compiled_tree
+
+
+def build_tree(branching, depth):
+    """
+    构造完全树，返回 (树参数, 全部叶子路径)
+    """
+    paths = []
+
+    def build_node(prefix, level, index):
+        name = f"维度 {level}-{index}"
+        path = prefix + [name]
+        node = {"dimension": {"name": name}, "score": float(level)}
+        if level < depth:
+            node["children"] = [
+                build_node(path, level + 1, i) for i in range(branching)
+            ]
+        else:
+            paths.append(path)
+        return node
+
+    root_children = [build_node([], 1, i) for i in range(2)]
+    params = {"tree": {"structure": {"root": {"children": root_children}}}}
+    return params, paths
+
+
+def run(branchings, depth, lookups):
+    print(
+        f"{'分支数':>8} {'叶子数':>10} {'未缓存(us/次)':>16} {'已缓存(us/次)':>16} {'加速比':>8}"
+    )
+    for rule_id, branching in enumerate(branchings, start=1):
+        params, paths = build_tree(branching, depth)
+        calculation = RuleCalculation(
+            id=rule_id,
+            rule_id=rule_id,
+            calculation_type="tree",
+            parameters=params,
+            max_score=10.0,
+        )
+        calculation.updated_at = datetime(2025, 1, 1)
+        random.seed(rule_id)
+        samples = [random.choice(paths) for _ in range(lookups)]
+
+        # 未缓存：每次重新编译
+        uncached_count = max(1, lookups // 100)
+        started = time.perf_counter()
+        for path in samples[:uncached_count]:
+            compile_rule_tree(calculation).score(path)
+        uncached = (time.perf_counter() - started) / uncached_count * 1e6
+
+        # 已缓存：编译一次后按路径查找
+        get_compiled_tree(calculation)
+        started = time.perf_counter()
+        for path in samples:
+            get_compiled_tree(calculation).score(path)
+        cached = (time.perf_counter() - started) / lookups * 1e6
+
+        print(
+            f"{branching:>8} {len(paths):>10} {uncached:>16.2f} {cached:>16.2f} {uncached / cached:>8.0f}x"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="规则树计分基准测试")
+    parser.add_argument(
+        "--branching", type=int, nargs="+", default=[4, 6, 8], help="每层分支数"
+    )
+    parser.add_argument("--depth", type=int, default=4, help="树深度")
+    parser.add_argument("--lookups", type=int, default=20000, help="计分次数")
+    args = parser.parse_args()
+    run(args.branching, args.depth, args.lookups)
+
+
+if __name__ == "__main__":
+    main()
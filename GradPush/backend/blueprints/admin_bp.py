@@ -34,6 +34,9 @@ from models import (
 )
 from datetime import datetime
 from extensions import db
+from utils.blob_store import release_application_files
+from utils.org_cache import invalidate_org_cache
+from utils.streaming_upload import UploadPolicy, limit_uploads, store_upload
 
 # 引入组织信息管理模块
 from .organization_bp import (
@@ -72,6 +75,7 @@ def create_faculty():
 
     db.session.add(new_faculty)
     db.session.commit()
+    invalidate_org_cache()
 
     # 创建默认的学院成绩比例设置
     default_settings = FacultyScoreSettings(faculty_id=new_faculty.id)
@@ -115,6 +119,7 @@ def update_faculty(faculty_id):
     faculty.description = data.get("description", "")
 
     db.session.commit()
+    invalidate_org_cache()
 
     return (
         jsonify(
@@ -156,22 +161,8 @@ def delete_faculty(faculty_id):
     applications = Application.query.filter_by(faculty_id=faculty.id).all()
     current_app.logger.info(f"将删除{len(applications)}个关联的推免申请")
     for application in applications:
-        # 删除申请关联的文件
-        if application.files:
-            for file in application.files:
-                try:
-                    if "path" in file and file["path"]:
-                        filename = os.path.basename(file["path"])
-                        file_path = os.path.join(
-                            current_app.config["FILE_FOLDER"], filename
-                        )
-                        if os.path.exists(file_path):
-                            os.remove(file_path)
-                            current_app.logger.info(f"删除推免申请附件: {file_path}")
-                except Exception as e:
-                    error_msg = f"删除文件失败: {str(e)}"
-                    current_app.logger.error(error_msg)
-                    print(error_msg)
+        # 释放申请的附件引用，不再被其他申请引用的文件在提交后删除
+        release_application_files(application.files)
         db.session.delete(application)
 
     # 2. 再获取所有关联的学生，通过直接关联的方式
@@ -218,6 +209,7 @@ def delete_faculty(faculty_id):
 
     try:
         db.session.commit()
+        invalidate_org_cache()
         current_app.logger.info(f"学院删除成功: {faculty_id}")
         return jsonify({"message": "学院删除成功"}), 200
     except Exception as e:
@@ -271,6 +263,7 @@ def create_department():
 
     db.session.add(new_department)
     db.session.commit()
+    invalidate_org_cache()
 
     return (
         jsonify(
@@ -311,6 +304,7 @@ def update_department(department_id):
     department.description = data.get("description", "")
 
     db.session.commit()
+    invalidate_org_cache()
 
     return (
         jsonify(
@@ -342,19 +336,8 @@ def delete_department(department_id):
     # 1. 先获取所有关联的申请记录
     applications = Application.query.filter_by(department_id=department.id).all()
     for application in applications:
-        # 删除申请关联的文件
-        if application.files:
-            for file in application.files:
-                try:
-                    if "path" in file and file["path"]:
-                        filename = os.path.basename(file["path"])
-                        file_path = os.path.join(
-                            current_app.config["FILE_FOLDER"], filename
-                        )
-                        if os.path.exists(file_path):
-                            os.remove(file_path)
-                except Exception as e:
-                    print(f"删除文件失败: {str(e)}")
+        # 释放申请的附件引用，不再被其他申请引用的文件在提交后删除
+        release_application_files(application.files)
         db.session.delete(application)
 
     # 2. 再获取所有关联的学生
@@ -376,6 +359,7 @@ def delete_department(department_id):
 
     try:
         db.session.commit()
+        invalidate_org_cache()
         return jsonify({"message": "系删除成功"}), 200
     except Exception as e:
         db.session.rollback()
@@ -419,6 +403,7 @@ def create_major():
 
     db.session.add(new_major)
     db.session.commit()
+    invalidate_org_cache()
 
     return (
         jsonify(
@@ -459,6 +444,7 @@ def update_major(major_id):
     major.description = data.get("description", "")
 
     db.session.commit()
+    invalidate_org_cache()
 
     return (
         jsonify(
@@ -490,19 +476,8 @@ def delete_major(major_id):
     # 1. 先获取所有关联的申请记录
     applications = Application.query.filter_by(major_id=major.id).all()
     for application in applications:
-        # 删除申请关联的文件
-        if application.files:
-            for file in application.files:
-                try:
-                    if "path" in file and file["path"]:
-                        filename = os.path.basename(file["path"])
-                        file_path = os.path.join(
-                            current_app.config["FILE_FOLDER"], filename
-                        )
-                        if os.path.exists(file_path):
-                            os.remove(file_path)
-                except Exception as e:
-                    print(f"删除文件失败: {str(e)}")
+        # 释放申请的附件引用，不再被其他申请引用的文件在提交后删除
+        release_application_files(application.files)
         db.session.delete(application)
 
     # 2. 再获取所有关联的学生
@@ -519,6 +494,7 @@ def delete_major(major_id):
 
     try:
         db.session.commit()
+        invalidate_org_cache()
         return jsonify({"message": "专业删除成功"}), 200
     except Exception as e:
         db.session.rollback()
@@ -763,6 +739,9 @@ def update_faculty_score_setting(faculty_id):
 def upload_graduate_file():
     from flask import current_app  # 使用current_app代替直接导入app实例
 
+    # 解析表单时文件直接写入临时文件并计算sha256
+    limit_uploads(UploadPolicy())
+
     # 检查是否有文件部分
     if "file" not in request.files:
         return jsonify({"message": "没有文件部分"}), 400
@@ -791,11 +770,11 @@ def upload_graduate_file():
         if not os.path.exists(GRADUATE_FILES_FOLDER):
             os.makedirs(GRADUATE_FILES_FOLDER)
 
-        # 保存文件
+        # 保存文件（临时文件原子重命名到目标路径）
         file_path = os.path.join(GRADUATE_FILES_FOLDER, unique_filename)
-        file.save(file_path)
+        stored = store_upload(file, file_path)
         current_app.logger.info(
-            f"管理员上传推免文件: {original_filename} 大小: {os.path.getsize(file_path)} bytes"
+            f"管理员上传推免文件: {original_filename} 大小: {stored['size']} bytes"
         )
 
         # 从请求中获取其他信息
@@ -814,7 +793,8 @@ def upload_graduate_file():
         graduate_file = GraduateFile(
             filename=original_filename,  # 只存储原始文件名
             filepath=file_path,
-            file_size=os.path.getsize(file_path),
+            stored_name=unique_filename,
+            file_size=stored["size"],
             file_type=file.mimetype,
             uploader=uploader,
             description=description,
@@ -860,9 +840,6 @@ def get_graduate_files():
     # 转换为JSON格式
     files_data = []
     for file in graduate_files:
-        # 从filepath中提取文件系统中的文件名用于下载链接
-        file_system_filename = os.path.basename(file.filepath)
-
         # 学院信息
         faculty_info = (
             {"id": file.faculty.id, "name": file.faculty.name} if file.faculty else None
@@ -872,7 +849,7 @@ def get_graduate_files():
             {
                 "id": file.id,
                 "filename": file.filename,  # 原始文件名（用于显示和下载）
-                "file_url": f"/uploads/graduate-files/{file_system_filename}",  # 下载链接
+                "file_url": f"/uploads/graduate-files/{file.stored_name}",  # 下载链接
                 "file_size": file.file_size,
                 "file_type": file.file_type,
                 "upload_time": file.upload_time.isoformat(),
@@ -910,7 +887,6 @@ def delete_graduate_file(file_id):
     except Exception as e:
         error_msg = f"删除文件失败: {str(e)}"
         current_app.logger.error(error_msg)
-        print(error_msg)
 
     # 删除数据库记录
     from extensions import db
@@ -941,9 +917,6 @@ def get_public_graduate_files():
     # 转换为JSON格式
     files_data = []
     for file in graduate_files:
-        # 从filepath中提取文件系统中的文件名用于下载链接
-        file_system_filename = os.path.basename(file.filepath)
-
         # 学院信息
         faculty_info = (
             {"id": file.faculty.id, "name": file.faculty.name} if file.faculty else None
@@ -953,7 +926,7 @@ def get_public_graduate_files():
             {
                 "id": file.id,
                 "filename": file.filename,  # 原始文件名（用于显示和下载）
-                "file_url": f"/uploads/graduate-files/{file_system_filename}",  # 下载链接
+                "file_url": f"/uploads/graduate-files/{file.stored_name}",  # 下载链接
                 "file_size": file.file_size,
                 "file_type": file.file_type,
                 "upload_time": file.upload_time.isoformat(),
@@ -12,37 +12,72 @@
 - 获取待审核申请
 """
 
-from flask import Blueprint, request, jsonify, current_app
+from flask import (
+    Blueprint,
+    request,
+    jsonify,
+    current_app,
+    Response,
+    session,
+    stream_with_context,
+)
+from werkzeug.exceptions import RequestEntityTooLarge
 from models import Application, Student, Rule, Department, Major, SystemSettings
 from datetime import datetime
 import pytz
 import json
 import os
 import traceback
-import uuid
-from extensions import db
-from blueprints.score_bp import update_student_statistics
+from extensions import db, resumable_uploads, thumbnails
+from blueprints.upload_bp import allowed_file_types, application_upload_policy
+from utils.score_aggregator import (
+    application_state,
+    apply_application_transition,
+    apply_application_transitions,
+)
+from utils.blob_store import (
+    content_sha256,
+    entry_filename,
+    release_application_files,
+    save_resumable_upload,
+    save_upload,
+    sync_file_refs,
+)
+from utils.streaming_upload import UploadError, limit_uploads
+from utils.pagination import (
+    MAX_PAGE_SIZE,
+    encode_cursor,
+    decode_cursor,
+    parse_page_size,
+    keyset_order,
+    keyset_after,
+    iter_keyset_batches,
+    iter_id_batches,
+)
 
 # 创建蓝图实例
 application_bp = Blueprint("application", __name__, url_prefix="/api")
 
 
-# 获取所有申请
-@application_bp.route("/applications", methods=["GET"])
-def get_applications():
-    # 获取查询参数
-    student_id = request.args.get("studentId")
-    student_name = request.args.get("studentName")
-    status = request.args.get("status")
-    application_type = request.args.get("applicationType")
-    reviewed_by = request.args.get("reviewedBy")
-    reviewed_start_date = request.args.get("reviewedStartDate")
-    reviewed_end_date = request.args.get("reviewedEndDate")
-    faculty_id = request.args.get("facultyId")
-    department_id = request.args.get("departmentId")
-    major_id = request.args.get("majorId")
-    department_name = request.args.get("department")
-    major_name = request.args.get("major")
+# 根据请求参数构建申请查询（不含排序）
+def _build_applications_query(args):
+    """
+    根据查询参数构建申请筛选查询
+    :param args: 请求参数
+    :return: 已应用筛选条件的查询
+    """
+    student_id = args.get("studentId")
+    student_name = args.get("studentName")
+    status = args.get("status")
+    application_type = args.get("applicationType")
+    reviewed_by = args.get("reviewedBy")
+    reviewed_start_date = args.get("reviewedStartDate")
+    reviewed_end_date = args.get("reviewedEndDate")
+    faculty_id = args.get("facultyId")
+    department_id = args.get("departmentId")
+    major_id = args.get("majorId")
+    department_name = args.get("department")
+    major_name = args.get("major")
 
     # 构建查询
     query = Application.query
@@ -112,8 +147,54 @@ def get_applications():
             # 如果日期格式无效，忽略该筛选条件
             pass
 
-    applications = query.all()
-    app_list = []
+    return query
+
+
+# 转换申请文件路径格式
+def _process_application_files(files):
+    """
+    将申请文件列表中的本地绝对路径转换为相对URL
+    """
+    processed_files = []
+    if files:
+        for file in files:
+            # 确保processed_file是字典类型以便处理
+            if isinstance(file, dict):
+                processed_file = file.copy()
+                # 保留原文件的size字段
+                if "size" in file:
+                    processed_file["size"] = file["size"]
+
+                # 如果是本地绝对路径，转换为相对URL
+                if "path" in processed_file and os.path.isabs(processed_file["path"]):
+                    # 从绝对路径中提取文件名和子文件夹
+                    filename = os.path.basename(processed_file["path"])
+                    # 判断文件应该属于哪个子文件夹
+                    if "avatars" in processed_file["path"]:
+                        processed_file["path"] = f"/uploads/avatars/{filename}"
+                    else:
+                        # 默认将其他文件归类到files文件夹
+                        processed_file["path"] = f"/uploads/files/{filename}"
+            else:
+                # 如果file不是字典类型，尝试将其转换为字典
+                try:
+                    processed_file = dict(file)
+                except:
+                    # 如果转换失败，使用默认空字典
+                    processed_file = {}
+            processed_files.append(processed_file)
+    return processed_files
+
+
+# 将一批申请转换为响应数据
+def _serialize_applications(applications):
+    """
+    批量序列化申请，关联的系、专业和规则信息按批次一次性查询
+    :param applications: 申请列表
+    :return: 申请数据字典列表
+    """
+    if not applications:
+        return []
 
     # 获取所有相关系、专业和规则信息以避免N+1查询问题
 
@@ -127,14 +208,16 @@ def get_applications():
 
     # 获取所有规则信息
     rule_ids = {app.rule_id for app in applications if app.rule_id}
-    rules = Rule.query.filter(Rule.id.in_(rule_ids)).all()
+    rules = Rule.query.filter(Rule.id.in_(rule_ids)).all() if rule_ids else []
 
     # 获取所有规则的计算配置
     from models import RuleCalculation
 
-    rule_calculations = RuleCalculation.query.filter(
-        RuleCalculation.rule_id.in_(rule_ids)
-    ).all()
+    rule_calculations = (
+        RuleCalculation.query.filter(RuleCalculation.rule_id.in_(rule_ids)).all()
+        if rule_ids
+        else []
+    )
     calculation_dict = {calc.rule_id: calc for calc in rule_calculations}
 
     rule_dict = {
@@ -159,39 +242,8 @@ def get_applications():
         for r in rules
     }
 
+    app_list = []
     for app in applications:
-        # 转换文件路径格式
-        processed_files = []
-        if app.files:
-            for file in app.files:
-                # 确保processed_file是字典类型以便处理
-                if isinstance(file, dict):
-                    processed_file = file.copy()
-                    # 保留原文件的size字段
-                    if "size" in file:
-                        processed_file["size"] = file["size"]
-
-                    # 如果是本地绝对路径，转换为相对URL
-                    if "path" in processed_file and os.path.isabs(
-                        processed_file["path"]
-                    ):
-                        # 从绝对路径中提取文件名和子文件夹
-                        filename = os.path.basename(processed_file["path"])
-                        # 判断文件应该属于哪个子文件夹
-                        if "avatars" in processed_file["path"]:
-                            processed_file["path"] = f"/uploads/avatars/{filename}"
-                        else:
-                            # 默认将其他文件归类到files文件夹
-                            processed_file["path"] = f"/uploads/files/{filename}"
-                else:
-                    # 如果file不是字典类型，尝试将其转换为字典
-                    try:
-                        processed_file = dict(file)
-                    except:
-                        # 如果转换失败，使用默认空字典
-                        processed_file = {}
-                processed_files.append(processed_file)
-
         app_data = {
             "id": app.id,
             "studentId": app.student_id,
@@ -212,11 +264,7 @@ def get_applications():
             "projectName": app.project_name,
             "awardDate": app.award_date.isoformat() if app.award_date else None,
             "description": app.description,
-            "files": processed_files,
-            "finalScore": app.final_score,
-            "reviewComment": app.review_comment,
-            "reviewedAt": app.reviewed_at.isoformat() if app.reviewed_at else None,
-            "reviewedBy": app.reviewed_by,
+            "files": _process_application_files(app.files),
             # 规则相关字段
             "ruleId": app.rule_id,
             "rule": rule_dict.get(app.rule_id) if app.rule_id else None,
@@ -225,7 +273,111 @@ def get_applications():
         }
         app_list.append(app_data)
 
-    return jsonify(app_list), 200
+    return app_list
+
+
+# 获取所有申请
+@application_bp.route("/applications", methods=["GET"])
+def get_applications():
+    """
+    获取申请列表，支持三种响应模式：
+    - 默认：与旧版一致按ID升序返回全部匹配申请的JSON数组，按ID分批查询并流式输出。
+      第一批在发送响应头之前查询和序列化，出错时返回500；之后的批次出错时记录日志并
+      中断输出，客户端收到的是无法解析的不完整JSON，而不是缺少部分申请的合法数组
+    - 分页：传入limit或cursor参数时，按 (applied_at, id) 降序进行键集分页，
+      返回 {"applications": [...], "nextCursor": ..., "hasMore": ...}
+    - 流式：format=ndjson时按批次查询并逐行输出NDJSON，内存占用与数据总量无关
+    """
+    query = _build_applications_query(request.args)
+
+    cursor = request.args.get("cursor")
+    limit = request.args.get("limit")
+    response_format = request.args.get("format")
+
+    after = None
+    if cursor:
+        try:
+            after = decode_cursor(cursor)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+    # 流式NDJSON模式
+    if response_format == "ndjson":
+        batch_size = parse_page_size(limit, default=MAX_PAGE_SIZE)
+
+        def generate():
+            for batch in iter_keyset_batches(
+                query, Application.applied_at, Application.id, batch_size, after
+            ):
+                lines = [
+                    json.dumps(item, ensure_ascii=False)
+                    for item in _serialize_applications(batch)
+                ]
+                yield "\n".join(lines) + "\n"
+                # 释放已输出批次占用的对象，保持每个请求的内存上限
+                db.session.expunge_all()
+
+        return Response(
+            stream_with_context(generate()), mimetype="application/x-ndjson"
+        )
+
+    # 键集分页模式
+    if limit is not None or cursor:
+        page_size = parse_page_size(limit)
+        if after is not None:
+            query = query.filter(
+                keyset_after(Application.applied_at, Application.id, *after)
+            )
+        applications = (
+            query.order_by(*keyset_order(Application.applied_at, Application.id))
+            .limit(page_size + 1)
+            .all()
+        )
+        has_more = len(applications) > page_size
+        applications = applications[:page_size]
+        next_cursor = (
+            encode_cursor(applications[-1].applied_at, applications[-1].id)
+            if has_more
+            else None
+        )
+        return (
+            jsonify(
+                {
+                    "applications": _serialize_applications(applications),
+                    "nextCursor": next_cursor,
+                    "hasMore": has_more,
+                }
+            ),
+            200,
+        )
+
+    # 默认模式：按批次查询并流式输出JSON数组，内存占用同样与数据总量无关
+    batches = iter_id_batches(query, Application.id, MAX_PAGE_SIZE)
+    first_items = _serialize_applications(next(batches, []))
+    db.session.expunge_all()
+
+    def generate_array():
+        items = first_items
+        separator = "["
+        try:
+            while True:
+                for item in items:
+                    yield separator + json.dumps(item, ensure_ascii=False)
+                    separator = ","
+                batch = next(batches, None)
+                if batch is None:
+                    break
+                items = _serialize_applications(batch)
+                db.session.expunge_all()
+        except Exception:
+            # 响应头已发送，无法再返回错误状态码，不输出结尾使客户端解析失败
+            current_app.logger.exception("流式输出申请列表失败")
+            return
+        yield "[]" if separator == "[" else "]"
+
+    return Response(
+        stream_with_context(generate_array()), mimetype="application/json"
+    )
 
 
 # 获取单个申请
@@ -329,10 +481,68 @@ def get_application(id):
     return jsonify(app_data), 200
 
 
+# 保存申请附件（随表单上传的文件和断点续传的文件）
+def _save_application_files(uploaded_files, upload_ids, settings):
+    """
+    随表单上传的文件在解析时已写入临时文件（超过大小限制即中止），断点续传的文件
+    按 uploadIds 从上传会话中取出，都按sha256保存到 FILE_FOLDER（见 utils/blob_store.py）。
+
+    Returns:
+        list: 文件信息（name、path、size、type、sha256）
+
+    Raises:
+        UploadError: 文件类型不允许或上传会话无效
+        UploadTooLarge: 超过单个文件或总大小限制
+    """
+    allowed_types_list = allowed_file_types(settings)
+    policy = request.upload_policy or application_upload_policy(settings)
+    owner = session.get("user_id")
+
+    # 先检查所有文件，避免部分文件已保存后才发现不合法
+    uploaded_files = [file for file in uploaded_files if file and file.filename]
+    sessions = [resumable_uploads.load(upload_id, owner) for upload_id in upload_ids]
+    filenames = [file.filename for file in uploaded_files]
+    filenames += [meta["filename"] for meta in sessions]
+    for filename in filenames:
+        if os.path.splitext(filename)[1].lower() not in allowed_types_list:
+            raise UploadError(
+                f"文件类型不允许: {filename}，仅支持{settings.allowed_file_types}"
+            )
+    for meta in sessions:
+        if not meta["sha256"]:
+            raise UploadError(f"文件尚未上传完成: {meta['filename']}", 409)
+        policy.consume(meta["filename"], meta["size"], meta["size"])
+
+    os.makedirs(current_app.config["FILE_FOLDER"], exist_ok=True)
+
+    # 按内容保存（相同内容只保存一份），引用计数在保存申请时由 sync_file_refs 增加
+    files = [save_upload(file) for file in uploaded_files]
+    files += [save_resumable_upload(meta, owner) for meta in sessions]
+    return files
+
+
+# 预先生成附件的缩略图（审核页面预览时直接使用）
+def _warm_thumbnails(files):
+    file_folder = current_app.config["FILE_FOLDER"]
+    sources = []
+    for entry in files:
+        filename = entry_filename(entry)
+        if filename:
+            sources.append(
+                (os.path.join(file_folder, filename), content_sha256(filename))
+            )
+    thumbnails.warm(sources)
+
+
 # 创建申请
 @application_bp.route("/applications", methods=["POST"])
 def create_application():
     try:
+        # 获取系统设置中的文件大小限制，解析表单时超限的文件立即中止接收
+        settings = SystemSettings.query.first()
+        if settings and request.mimetype == "multipart/form-data":
+            limit_uploads(application_upload_policy(settings))
+
         # 解析申请数据
         if "application" in request.form:
             data = json.loads(request.form["application"])
@@ -360,6 +570,7 @@ def create_application():
             "createdAt": "created_at",
             "updatedAt": "updated_at",
             "dynamicCoefficients": "dynamic_coefficients",
+            "uploadIds": "upload_ids",
         }
 
         # 转换数据字段
@@ -381,112 +592,15 @@ def create_application():
         if "project_name" in data and (len(data["project_name"]) < 2 or len(data["project_name"]) > 50):
             return jsonify({"error": "项目名称长度必须在2-50个字符之间"}), 400
 
-        # 处理文件上传
+        # 保存随表单上传的文件和已完成的断点续传文件
         files = []
-        if request.files:
-            # 获取系统设置中的文件大小限制和允许的文件类型
-            settings = SystemSettings.query.first()
+        upload_ids = data.get("upload_ids") or []
+        if request.files or upload_ids:
             if not settings:
                 return jsonify({"error": "系统设置未配置"}), 500
-
-            single_file_size_limit = (
-                settings.single_file_size_limit * 1024 * 1024
-            )  # 转换为字节
-            total_file_size_limit = (
-                settings.total_file_size_limit * 1024 * 1024
-            )  # 转换为字节
-            allowed_file_types = settings.allowed_file_types
-
-            # 创建上传目录（如果不存在）
-            if not os.path.exists(current_app.config["UPLOAD_FOLDER"]):
-                os.makedirs(current_app.config["UPLOAD_FOLDER"])
-
-            # 确保文件上传目录存在
-            if not os.path.exists(current_app.config["FILE_FOLDER"]):
-                os.makedirs(current_app.config["FILE_FOLDER"])
-
-            total_upload_size = 0
-            # 保存文件并记录信息
-            for file in request.files.getlist("files"):
-                if file and file.filename:
-                    # 检查文件类型
-                    file_ext = os.path.splitext(file.filename)[1].lower()
-                    # 将允许的文件类型字符串转换为列表
-                    allowed_types_list = [
-                        ext.strip().lower() for ext in allowed_file_types.split(",")
-                    ]
-                    if file_ext not in allowed_types_list:
-                        return (
-                            jsonify(
-                                {
-                                    "error": f"文件类型不允许: {file.filename}，仅支持{allowed_file_types}"
-                                }
-                            ),
-                            400,
-                        )
-
-                    # 检查单个文件大小
-                    file.seek(0, 2)  # 移动到文件末尾
-                    file_size = file.tell()  # 获取文件大小
-                    file.seek(0)  # 重置文件指针到开头
-
-                    if file_size > single_file_size_limit:
-                        return (
-                            jsonify(
-                                {
-                                    "error": f"单个文件大小超过限制: {file.filename}，最大允许{settings.single_file_size_limit}MB"
-                                }
-                            ),
-                            400,
-                        )
-
-                    # 检查总文件大小
-                    total_upload_size += file_size
-                    if total_upload_size > total_file_size_limit:
-                        return (
-                            jsonify(
-                                {
-                                    "error": f"总文件大小超过限制，最大允许{settings.total_file_size_limit}MB"
-                                }
-                            ),
-                            400,
-                        )
-
-                    # 生成安全且保留中文的文件名
-                    def generate_safe_filename(original_filename):
-                        """
-                        生成安全的文件名，保留中文等非ASCII字符，确保唯一性
-                        """
-                        # 分离文件名和扩展名
-                        name, ext = os.path.splitext(original_filename)
-                        # 生成唯一标识符
-                        unique_id = uuid.uuid4().hex[:8]
-                        # 使用时间戳和唯一ID确保文件名唯一性
-                        timestamp = datetime.now(
-                            pytz.timezone("Asia/Shanghai")
-                        ).strftime("%Y%m%d%H%M%S")
-                        # 保留原始文件名，仅移除路径分隔符防止目录遍历
-                        safe_name = name.replace("/", "").replace("\\", "")
-                        # 构建最终文件名
-                        return f"{safe_name}_{timestamp}_{unique_id}{ext}"
-
-                    # 使用自定义函数生成文件名
-                    filename = generate_safe_filename(file.filename)
-                    filepath = os.path.join(current_app.config["FILE_FOLDER"], filename)
-                    file.save(filepath)
-
-                    # 获取实际文件大小（比file.content_length更可靠）
-                    actual_size = os.path.getsize(filepath)
-
-                    # 记录文件信息（存储相对URL而不是本地路径）
-                    files.append(
-                        {
-                            "name": filename,
-                            "path": f"/uploads/files/{filename}",
-                            "size": actual_size,
-                            "type": file.content_type,
-                        }
-                    )
+            files = _save_application_files(
+                request.files.getlist("files"), upload_ids, settings
+            )
 
         # 处理日期字段，允许为空
         award_date_value = None
@@ -512,8 +626,12 @@ def create_application():
         )
 
         db.session.add(new_application)
+        sync_file_refs([], files)
         db.session.commit()
 
+        # 后台预先生成图片附件的缩略图
+        _warm_thumbnails(files)
+
         # 构建完整的响应数据
         app_data = {
             "id": new_application.id,
@@ -545,6 +663,10 @@ def create_application():
         }
 
         return jsonify(app_data), 201
+    except RequestEntityTooLarge as e:
+        return jsonify({"error": e.description}), 413
+    except UploadError as e:
+        return jsonify({"error": e.message}), e.status
     except json.JSONDecodeError as e:
         return jsonify({"error": "无效的JSON格式", "details": str(e)}), 400
     except KeyError as e:
@@ -554,11 +676,10 @@ def create_application():
     except Exception as e:
         error_msg = f"发生未预期的错误: {str(e)}"
         traceback_str = traceback.format_exc()
-        print(error_msg)
-        print("详细错误堆栈:")
-        print(traceback_str)
-        print("请求数据:")
-        print(json.dumps(data, ensure_ascii=False, indent=2))
+        current_app.logger.error(
+            f"{error_msg}\n详细错误堆栈:\n{traceback_str}"
+            f"请求数据: {json.dumps(data, ensure_ascii=False)}"
+        )
         return (
             jsonify(
                 {
@@ -575,7 +696,19 @@ def create_application():
 @application_bp.route("/applications/<int:id>", methods=["PUT"])
 def update_application(id):
     try:
-        application = Application.query.get_or_404(id)
+        # 锁定申请记录，避免并发修改读到相同的修改前状态
+        application = (
+            Application.query.filter_by(id=id).with_for_update().first_or_404()
+        )
+        # 记录修改前影响学生统计的学生、状态和附件列表
+        old_student_id = application.student_id
+        old_state = application_state(application)
+        old_files = application.files or []
+
+        # 获取系统设置中的文件大小限制，解析表单时超限的文件立即中止接收
+        settings = SystemSettings.query.first()
+        if settings and request.mimetype == "multipart/form-data":
+            limit_uploads(application_upload_policy(settings))
 
         # 解析申请数据
         if "application" in request.form:
@@ -603,6 +736,7 @@ def update_application(id):
             "appliedAt": "applied_at",
             "createdAt": "created_at",
             "updatedAt": "updated_at",
+            "uploadIds": "upload_ids",
         }
 
         # 转换数据字段
@@ -624,112 +758,15 @@ def update_application(id):
         if "project_name" in data and (len(data["project_name"]) < 2 or len(data["project_name"]) > 50):
             return jsonify({"error": "项目名称长度必须在2-50个字符之间"}), 400
 
-        # 处理文件上传
+        # 保存随表单上传的文件和已完成的断点续传文件
         files = []
-        if request.files:
-            # 获取系统设置中的文件大小限制和允许的文件类型
-            settings = SystemSettings.query.first()
+        upload_ids = data.get("upload_ids") or []
+        if request.files or upload_ids:
             if not settings:
                 return jsonify({"error": "系统设置未配置"}), 500
-
-            single_file_size_limit = (
-                settings.single_file_size_limit * 1024 * 1024
-            )  # 转换为字节
-            total_file_size_limit = (
-                settings.total_file_size_limit * 1024 * 1024
-            )  # 转换为字节
-            allowed_file_types = settings.allowed_file_types
-
-            # 创建上传目录（如果不存在）
-            if not os.path.exists(current_app.config["UPLOAD_FOLDER"]):
-                os.makedirs(current_app.config["UPLOAD_FOLDER"])
-
-            # 确保文件上传目录存在
-            if not os.path.exists(current_app.config["FILE_FOLDER"]):
-                os.makedirs(current_app.config["FILE_FOLDER"])
-
-            total_upload_size = 0
-            # 保存文件并记录信息
-            for key, file in request.files.items():
-                if file and file.filename:
-                    # 检查文件类型
-                    file_ext = os.path.splitext(file.filename)[1].lower()
-                    # 将允许的文件类型字符串转换为列表
-                    allowed_types_list = [
-                        ext.strip().lower() for ext in allowed_file_types.split(",")
-                    ]
-                    if file_ext not in allowed_types_list:
-                        return (
-                            jsonify(
-                                {
-                                    "error": f"文件类型不允许: {file.filename}，仅支持{allowed_file_types}"
-                                }
-                            ),
-                            400,
-                        )
-
-                    # 检查单个文件大小
-                    file.seek(0, 2)  # 移动到文件末尾
-                    file_size = file.tell()  # 获取文件大小
-                    file.seek(0)  # 重置文件指针到开头
-
-                    if file_size > single_file_size_limit:
-                        return (
-                            jsonify(
-                                {
-                                    "error": f"单个文件大小超过限制: {file.filename}，最大允许{settings.single_file_size_limit}MB"
-                                }
-                            ),
-                            400,
-                        )
-
-                    # 检查总文件大小
-                    total_upload_size += file_size
-                    if total_upload_size > total_file_size_limit:
-                        return (
-                            jsonify(
-                                {
-                                    "error": f"总文件大小超过限制，最大允许{settings.total_file_size_limit}MB"
-                                }
-                            ),
-                            400,
-                        )
-
-                    # 生成安全且保留中文的文件名
-                    def generate_safe_filename(original_filename):
-                        """
-                        生成安全的文件名，保留中文等非ASCII字符，确保唯一性
-                        """
-                        # 分离文件名和扩展名
-                        name, ext = os.path.splitext(original_filename)
-                        # 生成唯一标识符
-                        unique_id = uuid.uuid4().hex[:8]
-                        # 使用时间戳和唯一ID确保文件名唯一性
-                        timestamp = datetime.now(
-                            pytz.timezone("Asia/Shanghai")
-                        ).strftime("%Y%m%d%H%M%S")
-                        # 保留原始文件名，仅移除路径分隔符防止目录遍历
-                        safe_name = name.replace("/", "").replace("\\", "")
-                        # 构建最终文件名
-                        return f"{safe_name}_{timestamp}_{unique_id}{ext}"
-
-                    # 使用自定义函数生成文件名
-                    filename = generate_safe_filename(file.filename)
-                    filepath = os.path.join(current_app.config["FILE_FOLDER"], filename)
-                    file.save(filepath)
-
-                    # 获取实际文件大小（比file.content_length更可靠）
-                    actual_size = os.path.getsize(filepath)
-
-                    # 记录文件信息（存储相对URL而不是本地路径）
-                    files.append(
-                        {
-                            "name": filename,
-                            "path": f"/uploads/files/{filename}",
-                            "size": actual_size,
-                            "type": file.content_type,
-                        }
-                    )
+            files = _save_application_files(
+                list(request.files.values()), upload_ids, settings
+            )
 
         # 更新基本信息
         application.self_score = data.get("self_score", application.self_score)
@@ -788,16 +825,34 @@ def update_application(id):
 
             application.files = updated_files
 
+        # 按附件列表的变化调整引用计数，不再被引用的文件在提交后删除
+        sync_file_refs(old_files, application.files)
+
+        # 在同一事务中增量更新学生的统计数据（申请改属其他学生时，
+        # 从原学生中减去、计入新学生；学生未变时两项增量合并）
+        apply_application_transitions(
+            [
+                (old_student_id, old_state, None),
+                (application.student_id, None, application_state(application)),
+            ]
+        )
+
         db.session.commit()
 
+        # 后台预先生成新上传图片的缩略图
+        _warm_thumbnails(files)
+
         return jsonify({"message": "申请更新成功"}), 200
+    except RequestEntityTooLarge as e:
+        return jsonify({"error": e.description}), 413
+    except UploadError as e:
+        return jsonify({"error": e.message}), e.status
     except Exception as e:
         # 记录详细错误信息
         traceback_str = traceback.format_exc()
-        print("更新申请时发生错误:")
-        print(str(e))
-        print("详细错误堆栈:")
-        print(traceback_str)
+        current_app.logger.error(
+            f"更新申请时发生错误: {str(e)}\n详细错误堆栈:\n{traceback_str}"
+        )
         return (
             jsonify(
                 {
@@ -813,9 +868,13 @@ def update_application(id):
 # 审核申请
 @application_bp.route("/applications/<int:id>/review", methods=["POST"])
 def review_application(id):
-    application = Application.query.get_or_404(id)
+    # 锁定申请记录，两位教师同时审核时后提交者读到先提交者的审核结果
+    application = Application.query.filter_by(id=id).with_for_update().first_or_404()
     data = request.get_json()
 
+    # 记录审核前影响学生统计的状态
+    old_state = application_state(application)
+
     application.status = data["status"]
 
     # 获取教师输入的分数，如果有的话优先使用
@@ -895,10 +954,12 @@ def review_application(id):
     application.reviewed_at = datetime.now(pytz.timezone("Asia/Shanghai"))
     application.reviewed_by = data.get("reviewedBy")
 
-    db.session.commit()
+    # 在同一事务中增量更新学生的统计数据
+    apply_application_transition(
+        application.student_id, old_state, application_state(application)
+    )
 
-    # 更新学生的统计数据
-    update_student_statistics(application.student_id)
+    db.session.commit()
 
     return jsonify({"message": "申请审核成功"}), 200
 
@@ -906,35 +967,22 @@ def review_application(id):
 # 删除申请
 @application_bp.route("/applications/<int:id>", methods=["DELETE"])
 def delete_application(id):
-    application = Application.query.get_or_404(id)
+    # 锁定申请记录，避免与并发审核重复调整学生统计
+    application = Application.query.filter_by(id=id).with_for_update().first_or_404()
 
-    # 获取学生ID，用于后续更新统计数据
+    # 获取学生ID和申请状态，用于后续更新统计数据
     student_id = application.student_id
+    old_state = application_state(application)
 
-    # 删除相关物理文件
-    if application.files:
-        for file in application.files:
-            try:
-                # 从文件路径中提取文件名
-                if "path" in file and file["path"]:
-                    # 获取文件名（从URL中提取）
-                    filename = os.path.basename(file["path"])
-                    # 构建完整的文件路径
-                    file_path = os.path.join(
-                        current_app.config["FILE_FOLDER"], filename
-                    )
-                    # 检查文件是否存在并删除
-                    if os.path.exists(file_path):
-                        os.remove(file_path)
-            except Exception as e:
-                # 记录错误但不中断删除流程
-                print(f"删除文件失败: {str(e)}")
+    # 释放附件引用，不再被其他申请引用的文件在提交后删除
+    release_application_files(application.files)
 
     db.session.delete(application)
-    db.session.commit()
 
-    # 更新学生的统计数据
-    update_student_statistics(student_id)
+    # 在同一事务中增量更新学生的统计数据
+    apply_application_transition(student_id, old_state, None)
+
+    db.session.commit()
 
     return jsonify({"message": "申请删除成功"}), 200
 
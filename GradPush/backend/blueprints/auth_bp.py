@@ -11,15 +11,16 @@
 - 用户登出、登录状态检查
 """
 
-from flask import Blueprint, request, jsonify, make_response, session
-from models import User, Faculty, Department, Major, Student, Captcha
-from datetime import datetime, timedelta
+from flask import Blueprint, request, jsonify, make_response, session, current_app
+from models import User, Faculty, Department, Major, Student
+from datetime import datetime
 import pytz
-from extensions import db
-from utils.captcha import generate_captcha
+from extensions import db, password_hasher
+from utils.captcha_pool import get_captcha_pool
+from utils.captcha_store import get_captcha_store
+from utils.password_hasher import BUSY_MESSAGE, PasswordHasherBusy
+from utils.ranking_engine import update_student_ranking
 import base64
-from io import BytesIO
-import uuid
 import hashlib
 
 # 引入组织信息管理模块
@@ -32,16 +33,6 @@ from .organization_bp import (
 )
 
 
-# 清理过期验证码的函数
-def cleanup_expired_captchas():
-    current_time = datetime.now(pytz.timezone("Asia/Shanghai"))
-    # 从数据库中删除所有过期的验证码
-    expired_count = Captcha.query.filter(Captcha.expired_at < current_time).delete()
-    db.session.commit()
-    if expired_count:
-        print(f"清理了{expired_count}个过期验证码")
-
-
 # 验证码验证函数
 def validate_captcha(captcha_input, captcha_token):
     """
@@ -54,40 +45,29 @@ def validate_captcha(captcha_input, captcha_token):
     Returns:
         tuple: (是否验证成功, 错误消息)
     """
-    # 验证验证码
-    print(f"验证验证码: 输入={captcha_input.lower()}, token={captcha_token}")
+    store = get_captcha_store()
+
+    # 从验证码存储中获取验证码
+    captcha = store.get(captcha_token)
 
-    # 从数据库中获取验证码
-    captcha = Captcha.query.filter_by(token=captcha_token).first()
-    
     # 检查验证码是否存在
     if not captcha:
-        print("验证码验证失败：未找到对应的验证码")
         return False, "验证码不存在，请刷新页面获取验证码"
 
     # 检查验证码是否过期
-    current_time = datetime.now(pytz.timezone("Asia/Shanghai"))
-    # 确保比较的是同类型的datetime对象（带时区的）
-    # 如果expired_at不带时区，将其转换为带上海时区的datetime
-    if captcha.expired_at.tzinfo is None:
-        captcha.expired_at = pytz.timezone("Asia/Shanghai").localize(captcha.expired_at)
-    if current_time > captcha.expired_at:
-        print("验证码已过期")
+    if captcha.expired:
         # 清除过期的验证码
-        db.session.delete(captcha)
-        db.session.commit()
+        store.discard(captcha_token)
         return False, "验证码已过期，请刷新页面获取新验证码"
 
     # 验证验证码内容
     if captcha_input.lower() != captcha.text:
-        print(f"验证码不匹配：输入={captcha_input.lower()}, 存储={captcha.text}")
         return False, "验证码错误"
 
-    # 验证成功后删除验证码
-    db.session.delete(captcha)
-    db.session.commit()
+    # 验证成功后删除验证码（并发请求中只有一个能删除成功，保证验证码只能使用一次）
+    if not store.discard(captcha_token):
+        return False, "验证码不存在，请刷新页面获取验证码"
 
-    print("验证码验证成功")
     return True, None
 
 
@@ -99,82 +79,32 @@ auth_bp = Blueprint("auth", __name__, url_prefix="/api")
 @auth_bp.route("/generate-captcha", methods=["GET"])
 def get_captcha():
     try:
-        # 先清理过期的验证码
-        cleanup_expired_captchas()
-        
         # 生成用户标识符（IP地址 + User-Agent的哈希值）
-        ip_address = request.remote_addr
+        ip_address = request.remote_addr or ''
         user_agent = request.headers.get('User-Agent', '')
         # 创建用户标识符（哈希处理以保护隐私）
         user_identifier = hashlib.sha256((ip_address + user_agent).encode()).hexdigest()[:32]
-        
-        # 删除同一用户的旧验证码
-        current_time = datetime.now(pytz.timezone("Asia/Shanghai"))
-        old_captchas = Captcha.query.filter(
-            Captcha.user_identifier == user_identifier,
-            Captcha.expired_at > current_time
-        ).all()
-        
-        if old_captchas:
-            for captcha in old_captchas:
-                db.session.delete(captcha)
-            db.session.commit()
-            print(f"删除了用户{user_identifier[:8]}的{len(old_captchas)}个旧验证码")
-        
-        # 限制未过期验证码的数量，生产环境最多保留1000个
-        # 可根据实际并发量调整此值
-        MAX_ACTIVE_CAPTCHAS = 1000
-        
-        # 获取当前未过期的验证码数量
-        active_captchas = Captcha.query.filter(Captcha.expired_at > current_time).count()
-        
-        # 如果未过期验证码数量超过限制，删除最旧的验证码
-        if active_captchas >= MAX_ACTIVE_CAPTCHAS:
-            # 查询最旧的未过期验证码
-            oldest_captchas = Captcha.query.filter(Captcha.expired_at > current_time) \
-                                           .order_by(Captcha.created_at.asc()) \
-                                           .limit(active_captchas - (MAX_ACTIVE_CAPTCHAS - 1)) \
-                                           .all()
-            
-            # 删除这些旧验证码
-            for captcha in oldest_captchas:
-                db.session.delete(captcha)
-            db.session.commit()
-            print(f"删除了{len(oldest_captchas)}个旧验证码，保持未过期验证码数量在合理范围内")
-
-        # 生成验证码图片和文本
-        # 注意：根据captcha.py的实现，返回值顺序是 (captcha_image, captcha_text)
-        captcha_image, captcha_text = generate_captcha()
-
-        print(f"生成验证码: {captcha_text}")
-
-        # 生成唯一的token
-        captcha_token = str(uuid.uuid4())
-
-        # 计算过期时间（5分钟后）
-        current_time = datetime.now(pytz.timezone("Asia/Shanghai"))
-        expired_time = current_time + timedelta(minutes=5)
-
-        # 创建验证码记录并存储到数据库
-        captcha = Captcha(
-            token=captcha_token,
-            text=captcha_text.lower(),
-            expired_at=expired_time,
-            user_identifier=user_identifier
-        )
-        db.session.add(captcha)
-        db.session.commit()
-        print(f"验证码已存储到数据库，token: {captcha_token}, 用户标识符: {user_identifier[:8]}")
+
+        # 从预生成池中取出验证码（PNG图片已编码）
+        captcha_text, captcha_png = get_captcha_pool().get()
+
+        # 保存验证码（同一用户的旧验证码会被替换，过期验证码由存储自动淘汰）
+        captcha_token = get_captcha_store().issue(user_identifier, captcha_text.lower())
+
+        # format=png时直接返回PNG图片，token放在响应头中，避免base64编码的体积膨胀
+        if request.args.get("format") == "png":
+            response = make_response(captcha_png)
+            response.headers["Content-Type"] = "image/png"
+            response.headers["Cache-Control"] = "no-store"
+            response.headers["X-Captcha-Token"] = captcha_token
+            return response
 
         # 将图片转换为base64字符串
-        buffer = BytesIO()
-        captcha_image.save(buffer, format="PNG")
-        buffer.seek(0)
-        img_str = base64.b64encode(buffer.getvalue()).decode("utf-8")
+        img_str = base64.b64encode(captcha_png).decode("utf-8")
 
         return jsonify({"image": img_str, "token": captcha_token}), 200
     except Exception as e:
-        print(f"验证码生成错误: {str(e)}")
+        current_app.logger.error(f"验证码生成错误: {str(e)}")
         return jsonify({"message": "验证码生成失败"}), 500
 
 
@@ -208,7 +138,7 @@ def login():
     if not captcha_valid:
         return jsonify({"message": error_message}), 400
 
-    print("验证码验证成功")
+    current_app.logger.debug("验证码验证成功")
 
     # 查找用户
     user = User.query.filter_by(username=username).first()
@@ -220,8 +150,15 @@ def login():
         return jsonify({"message": "账户已被禁用"}), 401
 
     # 验证密码
-    if not user.check_password(password):
-        return jsonify({"message": "密码错误"}), 401
+    try:
+        if not user.check_password(password):
+            return jsonify({"message": "密码错误"}), 401
+
+        # 密码哈希的计算强度与配置不一致时按新强度重新哈希（随登录时间一起提交）
+        if password_hasher.needs_rehash(user.password):
+            user.set_password(password)
+    except PasswordHasherBusy:
+        return jsonify({"message": BUSY_MESSAGE}), 503
 
     # 验证码已在验证成功后删除
 
@@ -234,7 +171,9 @@ def login():
     session["username"] = user.username
     session["role"] = user.role
     session["logged_in"] = True
-    print(f"已设置会话信息: 用户ID={user.id}, 用户名={user.username}")
+    current_app.logger.debug(
+        "已设置会话信息: 用户ID=%s, 用户名=%s", user.id, user.username
+    )
 
     # 获取学院、系和专业名称
 
@@ -303,7 +242,7 @@ def register():
     if not captcha_valid:
         return jsonify({"message": error_message}), 400
 
-    print("验证码验证成功")
+    current_app.logger.debug("验证码验证成功")
 
     required_fields = ["username", "name", "role", "password"]
     for field in required_fields:
@@ -364,6 +303,8 @@ def register():
                 )
                 db.session.add(new_student)
                 db.session.flush()  # 立即刷新以确保学生记录已创建
+                # 新学生加入专业排名
+                update_student_ranking(new_student)
             student_id = data["username"]
 
         # 创建新用户
@@ -390,6 +331,10 @@ def register():
         db.session.commit()
 
         return jsonify({"message": "注册成功"}), 201
+    except PasswordHasherBusy:
+        # 由应用统一返回503
+        db.session.rollback()
+        raise
     except Exception as e:
         # 发生异常时回滚事务
         db.session.rollback()
@@ -416,7 +361,7 @@ def reset_password():
     if not captcha_valid:
         return jsonify({"message": error_message}), 400
 
-    print("验证码验证成功")
+    current_app.logger.debug("验证码验证成功")
 
     username = data.get("username")
     new_password = data.get("newPassword")
@@ -475,7 +420,7 @@ def get_majors_by_faculty(faculty_id):
         majors = get_majors_by_faculty_id(faculty_id)
         return jsonify({"success": True, "majors": majors}), 200
     except Exception as e:
-        print(f"根据学院获取专业列表时出错: {str(e)}")
+        current_app.logger.error(f"根据学院获取专业列表时出错: {str(e)}")
         return jsonify({"success": False, "message": "获取专业列表失败"}), 500
 
 
@@ -489,14 +434,14 @@ def logout():
 
         # 获取用户名用于日志记录
         username = session.get("username", "未知用户")
-        print(f"用户{username}登出系统")
+        current_app.logger.info(f"用户{username}登出系统")
 
         # 清除所有会话变量
         session.clear()
 
         return jsonify({"success": True, "message": "登出成功"}), 200
     except Exception as e:
-        print(f"用户登出时出错: {str(e)}")
+        current_app.logger.error(f"用户登出时出错: {str(e)}")
         return jsonify({"success": False, "message": "登出失败"}), 500
 
 
@@ -523,5 +468,5 @@ def session_check():
         else:
             return jsonify({"success": True, "logged_in": False}), 200
     except Exception as e:
-        print(f"会话检查时出错: {str(e)}")
+        current_app.logger.error(f"会话检查时出错: {str(e)}")
         return jsonify({"success": False, "message": "会话检查失败"}), 500
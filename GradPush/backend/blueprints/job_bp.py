@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+后台任务蓝图
+
+该文件负责处理后台任务相关的API端点，包括：
+- 按类型提交已注册的后台任务
+- 查询任务列表和任务进度
+- 取消任务
+
+导入、备份、恢复、成绩重算等接口提交任务后返回202和任务ID，
+前端通过 GET /api/jobs/<job_id> 轮询任务状态和结果。
+"""
+
+from flask import Blueprint, request, jsonify, session
+from extensions import job_runner
+from utils.job_runner import JobConflict
+
+# 创建蓝图实例
+job_bp = Blueprint("job", __name__, url_prefix="/api/jobs")
+
+
+# 辅助函数：检查当前用户是否为管理员
+def _is_admin():
+    return session.get("role") == "admin"
+
+
+def job_accepted(job, message):
+    """
+    任务提交成功的响应（供各蓝图共用）
+    """
+    return (
+        jsonify({"success": True, "message": message, "jobId": job["id"], "job": job}),
+        202,
+    )
+
+
+def job_conflict(error):
+    """
+    同类任务正在执行的响应（供各蓝图共用）
+    """
+    return (
+        jsonify(
+            {
+                "success": False,
+                "message": "已有同类任务正在执行，请等待完成",
+                "jobId": error.job["id"],
+                "job": error.job,
+            }
+        ),
+        409,
+    )
+
+
+# 获取任务列表
+@job_bp.route("", methods=["GET"])
+def get_jobs():
+    if not _is_admin():
+        return jsonify({"message": "权限不足"}), 403
+
+    job_type = request.args.get("type")
+    limit = request.args.get("limit", 50, type=int)
+    return jsonify({"jobs": job_runner.list(job_type, max(1, min(limit, 200)))}), 200
+
+
+# 获取可提交的任务类型
+@job_bp.route("/types", methods=["GET"])
+def get_job_types():
+    if not _is_admin():
+        return jsonify({"message": "权限不足"}), 403
+
+    types = [
+        {"type": job_type, "description": info["description"]}
+        for job_type, info in job_runner.job_types.items()
+    ]
+    return jsonify({"types": types}), 200
+
+
+# 按类型提交任务
+@job_bp.route("", methods=["POST"])
+def submit_job():
+    """
+    请求体：{"type": 任务类型, "params": 任务参数}
+    """
+    if not _is_admin():
+        return jsonify({"message": "权限不足"}), 403
+
+    data = request.get_json(silent=True) or {}
+    job_type = data.get("type")
+    params = data.get("params") or {}
+    job_info = job_runner.job_types.get(job_type)
+    if not job_info:
+        return jsonify({"message": f"不支持的任务类型: {job_type}"}), 400
+    if not isinstance(params, dict):
+        return jsonify({"message": "任务参数必须为对象"}), 400
+
+    try:
+        job = job_runner.submit(
+            job_type,
+            job_info["func"],
+            params,
+            description=job_info["description"],
+            created_by=session.get("username"),
+            unique=True,
+        )
+    except JobConflict as e:
+        return job_conflict(e)
+    return job_accepted(job, "任务已提交")
+
+
+# 获取任务状态
+@job_bp.route("/<job_id>", methods=["GET"])
+def get_job(job_id):
+    if not _is_admin():
+        return jsonify({"message": "权限不足"}), 403
+
+    job = job_runner.get(job_id)
+    if not job:
+        return jsonify({"message": "任务不存在"}), 404
+    return jsonify({"job": job}), 200
+
+
+# 取消任务
+@job_bp.route("/<job_id>/cancel", methods=["POST"])
+def cancel_job(job_id):
+    if not _is_admin():
+        return jsonify({"message": "权限不足"}), 403
+
+    job = job_runner.cancel(job_id)
+    if not job:
+        return jsonify({"message": "任务不存在"}), 404
+    return jsonify({"message": "已请求取消任务", "job": job}), 200
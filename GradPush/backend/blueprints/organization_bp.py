@@ -6,12 +6,15 @@
 提供可被其他蓝图共享的组织信息查询功能。
 """
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, session
 import os
 import uuid
 import openpyxl
 from werkzeug.utils import secure_filename
 from models import Faculty, Department, Major
+from extensions import db, job_runner
+from utils.org_cache import invalidate_org_cache
+from blueprints.job_bp import job_accepted
 
 # 创建蓝图实例
 organization_bp = Blueprint("organization", __name__, url_prefix="/api/organization")
@@ -327,8 +330,28 @@ def import_organizations():
         if ext not in allowed_extensions:
             return jsonify({"message": "只支持Excel文件(.xlsx, .xls)"}), 400
 
+        # 保存上传文件后在后台任务中导入，立即返回任务ID
+        file_path = job_runner.stage_upload(file)
+        job = job_runner.submit(
+            "import-organizations",
+            _run_import_organizations,
+            file_path,
+            description=f"导入组织数据：{file.filename}",
+            created_by=session.get("username"),
+        )
+        return job_accepted(job, "组织数据导入任务已提交")
+
+    except Exception as e:
+        return jsonify({"message": str(e)}), 500
+
+
+def _run_import_organizations(job, file_path):
+    """
+    后台任务：从已保存的Excel文件导入学院、系和专业
+    """
+    try:
         # 读取Excel文件
-        workbook = openpyxl.load_workbook(file, data_only=True)
+        workbook = openpyxl.load_workbook(file_path, data_only=True)
 
         # 定义各表的数据
         faculty_data = []
@@ -349,15 +372,12 @@ def import_organizations():
         required_headers = ["学院名称"]
         missing_headers = [h for h in required_headers if h not in headers]
         if missing_headers:
-            return (
-                jsonify(
-                    {"message": f"工作表缺少必填表头：{','.join(missing_headers)}"}
-                ),
-                400,
-            )
+            raise ValueError(f"工作表缺少必填表头：{','.join(missing_headers)}")
 
         # 读取数据行
         for row in range(2, target_sheet.max_row + 1):
+            job.progress(row - 1, target_sheet.max_row - 1, "读取组织数据")
+
             # 学院信息
             faculty_name = target_sheet.cell(row=row, column=headers["学院名称"]).value
             faculty_description = (
@@ -450,8 +470,6 @@ def import_organizations():
         major_data = list(unique_majors.values())
 
         # 导入数据到数据库
-        from extensions import db
-
         errors = []
 
         # 导入学院
@@ -560,19 +578,19 @@ def import_organizations():
 
         # 提交事务
         db.session.commit()
+        invalidate_org_cache()
+
+        return {
+            "message": "导入成功",
+            "faculty_count": len(faculty_data),
+            "department_count": len(department_data),
+            "major_count": len(major_data),
+            "errors": errors,
+        }
 
-        return (
-            jsonify(
-                {
-                    "message": "导入成功",
-                    "faculty_count": len(faculty_data),
-                    "department_count": len(department_data),
-                    "major_count": len(major_data),
-                    "errors": errors,
-                }
-            ),
-            200,
-        )
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        os.remove(file_path)
 
-    except Exception as e:
-        return jsonify({"message": str(e)}), 500
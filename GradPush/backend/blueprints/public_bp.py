@@ -85,7 +85,7 @@ def get_system_info():
 
     except Exception as e:
         # 记录错误日志
-        print(f"获取系统信息异常: {str(e)}")
+        current_app.logger.error(f"获取系统信息异常: {str(e)}")
         return jsonify(
             {"code": 500, "message": f"获取系统信息失败: {str(e)}", "data": None}
         )
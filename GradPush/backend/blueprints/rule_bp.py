@@ -10,14 +10,15 @@
 - 删除规则
 - 切换规则状态（启用/禁用）
 - 根据申请信息匹配规则
+- 批量计算申请/学生数据的规则分数
 """
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from models import Rule, RuleCalculation, Application
 from extensions import db
-import traceback
 import json
-from utils.rule_engine import RuleEngine
+from utils.rule_engine import rule_engine, invalidate_rule_cache
+from sqlalchemy.orm import joinedload
 import sys
 
 # 设置默认编码为UTF-8
@@ -135,13 +136,12 @@ def get_rule(rule_id):
 def create_rule():
     try:
         data = request.get_json()
-        print(f"Received data for creating rule: {data}")
+        current_app.logger.debug("创建规则请求数据: %s", data)
 
         # 验证必填字段
         required_fields = ["name", "type", "score"]
         for field in required_fields:
             if field not in data:
-                print(f"Missing required field: {field}")
                 return jsonify({"error": f"Missing required field: {field}"}), 400
 
         # 处理JSON字段，确保它们是有效的JSON对象
@@ -169,9 +169,8 @@ def create_rule():
         )
 
         db.session.add(new_rule)
-        print("Added new rule to session")
         db.session.commit()
-        print("Committed new rule to database")
+        current_app.logger.debug("已创建规则: id=%s", new_rule.id)
 
         # 处理规则计算
         calculation_data = data.get("calculation")
@@ -229,8 +228,7 @@ def create_rule():
         )
 
     except Exception as e:
-        print(f"Error creating rule: {type(e).__name__}: {e}")
-        traceback.print_exc()
+        current_app.logger.exception("创建规则失败")
         return (
             jsonify({"error": f"Failed to create rule: {type(e).__name__}: {e}"}),
             500,
@@ -316,6 +314,8 @@ def update_rule(rule_id):
                 db.session.add(new_calculation)
 
         db.session.commit()
+        # 规则计算已变更，清除编译缓存
+        invalidate_rule_cache(rule_id)
 
         return (
             jsonify(
@@ -345,7 +345,7 @@ def update_rule(rule_id):
         )
 
     except Exception as e:
-        traceback.print_exc()
+        current_app.logger.exception("更新规则失败")
         return jsonify({"error": str(e)}), 400
 
 
@@ -361,11 +361,12 @@ def delete_rule(rule_id):
         # 删除规则
         db.session.delete(rule)
         db.session.commit()
+        invalidate_rule_cache(rule_id)
 
         return jsonify({"message": "Rule deleted successfully"}), 200
 
     except Exception as e:
-        traceback.print_exc()
+        current_app.logger.exception("删除规则失败")
         return jsonify({"error": "Failed to delete rule"}), 500
 
 
@@ -392,11 +393,13 @@ def batch_delete_rules():
         # 然后删除规则
         Rule.query.filter(Rule.id.in_(rule_ids)).delete(synchronize_session=False)
         db.session.commit()
+        for rule_id in rule_ids:
+            invalidate_rule_cache(rule_id)
 
         return jsonify({"message": "Rules deleted successfully"}), 200
 
     except Exception as e:
-        traceback.print_exc()
+        current_app.logger.exception("批量删除规则失败")
         return jsonify({"error": "Failed to delete rules"}), 500
 
 
@@ -425,7 +428,7 @@ def get_rule_calculation(rule_id):
             200,
         )
     except Exception as e:
-        traceback.print_exc()
+        current_app.logger.exception("获取规则计算配置失败")
         return jsonify({"code": 500, "message": str(e)}), 500
 
 
@@ -460,6 +463,7 @@ def create_calculation(rule_id):
 
         db.session.add(new_calculation)
         db.session.commit()
+        invalidate_rule_cache(rule_id)
 
         return (
             jsonify(
@@ -479,7 +483,7 @@ def create_calculation(rule_id):
             201,
         )
     except Exception as e:
-        traceback.print_exc()
+        current_app.logger.exception("创建规则计算配置失败")
         return jsonify({"code": 500, "message": str(e)}), 500
 
 
@@ -498,6 +502,8 @@ def update_calculation(calculation_id):
         calculation.max_score = data.get("max_score", calculation.max_score)
 
         db.session.commit()
+        # 规则计算已变更，清除编译缓存
+        invalidate_rule_cache(calculation.rule_id)
 
         return (
             jsonify(
@@ -517,7 +523,7 @@ def update_calculation(calculation_id):
             200,
         )
     except Exception as e:
-        traceback.print_exc()
+        current_app.logger.exception("更新规则计算配置失败")
         return jsonify({"code": 500, "message": str(e)}), 500
 
 
@@ -525,15 +531,17 @@ def update_calculation(calculation_id):
 def delete_calculation(calculation_id):
     try:
         calculation = RuleCalculation.query.get_or_404(calculation_id)
+        rule_id = calculation.rule_id
         db.session.delete(calculation)
         db.session.commit()
+        invalidate_rule_cache(rule_id)
 
         return (
             jsonify({"code": 200, "message": "Calculation deleted successfully"}),
             200,
         )
     except Exception as e:
-        traceback.print_exc()
+        current_app.logger.exception("删除规则计算配置失败")
         return jsonify({"code": 500, "message": str(e)}), 500
 
 
@@ -549,18 +557,19 @@ def match_rules():
         if not student_data:
             return jsonify({"code": 400, "message": "Student data is required"}), 400
 
-        # 初始化规则引擎
-        rule_engine = RuleEngine()
-
-        # 获取该学院的所有有效规则
-        rules = Rule.query.filter_by(faculty_id=faculty_id, status="active").all()
+        # 获取该学院的所有有效规则（同时加载计算配置）
+        rules = (
+            Rule.query.options(joinedload(Rule.calculation))
+            .filter_by(faculty_id=faculty_id, status="active")
+            .all()
+        )
 
         # 匹配规则并计算分数
         result = rule_engine.match_and_calculate(rules, student_data)
 
         return jsonify({"code": 200, "message": "Success", "data": result}), 200
     except Exception as e:
-        traceback.print_exc()
+        current_app.logger.exception("匹配规则失败")
         return jsonify({"code": 500, "message": str(e)}), 500
 
 
@@ -578,24 +587,22 @@ def calculate_rule_score(rule_id):
         if not rule:
             return jsonify({"code": 404, "message": "Rule not found"}), 404
 
-        # 调试信息
-        print(f"[DEBUG] API调用: rule_id={rule_id}, student_data={student_data}")
-        print(f"[DEBUG] Rule对象: id={rule.id}, name={rule.name}")
-
-        # 初始化规则引擎
-        rule_engine = RuleEngine()
+        # 调试信息（未开启DEBUG级别时不格式化参数）
+        current_app.logger.debug(
+            "计算规则分数: rule_id=%s, name=%s, student_data=%s",
+            rule.id,
+            rule.name,
+            student_data,
+        )
 
         # 计算单个规则的分数
         # 注意：这里直接传递字典而不是对象，因为calculate_score方法已经支持处理字典
         score = rule_engine.calculate_score(rule, student_data)
 
-        # 调试信息
-        print(f"[DEBUG] 计算结果: score={score}")
+        current_app.logger.debug("规则 %s 计算结果: score=%s", rule.id, score)
 
         # 获取RuleCalculation对象以获取max_score
-        from models import RuleCalculation
-
-        calculation = RuleCalculation.query.filter_by(rule_id=rule.id).first()
+        calculation = rule.calculation
         max_score = calculation.max_score if calculation else None
 
         return (
@@ -614,7 +621,89 @@ def calculate_rule_score(rule_id):
             200,
         )
     except Exception as e:
-        traceback.print_exc()
+        current_app.logger.exception("计算规则分数失败")
+        return jsonify({"code": 500, "message": str(e)}), 500
+
+
+@rule_bp.route("/rules/batch-calculate", methods=["POST"])
+def batch_calculate_scores():
+    """
+    批量计算规则分数
+
+    请求体：
+    - items: 计分项列表，每项为 {"application_id", "rule_id"(可选)} 或 {"student_data", "rule_id"}
+    - 未提供items时按筛选条件选择申请：faculty_id、rule_id（可选）、
+      status（默认pending）、application_type（默认academic）
+    - write_back: 为true时将分数批量写回申请的final_score
+    """
+    try:
+        data = request.get_json() or {}
+        items = data.get("items")
+        write_back = bool(data.get("write_back", False))
+
+        if items is None:
+            # 按筛选条件选择需要重新计分的申请
+            faculty_id = data.get("faculty_id")
+            if not faculty_id:
+                return (
+                    jsonify(
+                        {"code": 400, "message": "items or faculty_id is required"}
+                    ),
+                    400,
+                )
+            query = db.session.query(Application.id).filter(
+                Application.faculty_id == faculty_id,
+                Application.status == data.get("status", "pending"),
+                Application.application_type
+                == data.get("application_type", "academic"),
+                Application.rule_id.isnot(None),
+            )
+            if data.get("rule_id"):
+                query = query.filter(Application.rule_id == data["rule_id"])
+            items = [
+                {"application_id": row.id} for row in query.order_by(Application.id)
+            ]
+        elif not isinstance(items, list) or not all(
+            isinstance(item, dict) for item in items
+        ):
+            return (
+                jsonify({"code": 400, "message": "items must be a list of objects"}),
+                400,
+            )
+        elif not all(
+            isinstance(item.get("application_id"), (int, type(None))) for item in items
+        ):
+            return (
+                jsonify({"code": 400, "message": "application_id must be an integer"}),
+                400,
+            )
+
+        results = rule_engine.batch_calculate(items)
+
+        updated_count = 0
+        if write_back:
+            # 分数与已通过申请的学生统计数据在同一事务中提交
+            updated_count = rule_engine.write_back_scores(results)
+            db.session.commit()
+
+        return (
+            jsonify(
+                {
+                    "code": 200,
+                    "message": "Success",
+                    "data": {
+                        "results": results,
+                        "total": len(results),
+                        "failed": sum(1 for r in results if r["error"] is not None),
+                        "updated": updated_count,
+                    },
+                }
+            ),
+            200,
+        )
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.exception("批量计算分数失败")
         return jsonify({"code": 500, "message": str(e)}), 500
 
 
@@ -636,5 +725,5 @@ def toggle_rule_status(rule_id):
             200,
         )
     except Exception as e:
-        traceback.print_exc()
+        current_app.logger.exception("切换规则状态失败")
         return jsonify({"error": str(e)}), 400
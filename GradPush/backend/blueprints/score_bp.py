@@ -12,15 +12,27 @@
 from flask import Blueprint, request, jsonify, current_app
 from models import (
     User,
-    Faculty,
-    Department,
-    Major,
     Student,
     Application,
     SystemSettings,
     FacultyScoreSettings,
 )
-from extensions import db
+from extensions import db, job_runner
+from sqlalchemy import Float, Numeric, case, cast, func, or_, select, update
+from utils.ranking_engine import (
+    build_student_ranking,
+    rebuild_major_ranking,
+    update_student_ranking,
+    get_student_ranking,
+)
+from utils.score_aggregator import (
+    DRIFT_TOLERANCE,
+    recompute_student_scores,
+    reconcile_student_scores,
+)
+from utils.org_cache import get_org_snapshot
+from utils.job_runner import JobConflict
+from blueprints.job_bp import job_accepted, job_conflict
 
 # 创建蓝图实例
 score_bp = Blueprint("score", __name__, url_prefix="/api")
@@ -29,87 +41,178 @@ score_bp = Blueprint("score", __name__, url_prefix="/api")
 # 辅助函数：更新学生的统计数据
 def update_student_statistics(student_id):
     """
-    根据学生的已通过申请更新其统计数据
+    根据学生的已通过申请全量重新汇总其统计数据并提交
+    （单个申请状态变化请使用 apply_application_transition 增量更新）
     :param student_id: 学生ID
     :return: 更新后的统计数据
     """
-    # 查询学生的所有已通过申请
-    applications = Application.query.filter_by(
-        student_id=student_id, status="approved"
-    ).all()
-
-    # 按申请类型分类统计
-    academic_score_calculated = sum(
-        app.final_score
-        for app in applications
-        if app.final_score is not None and app.application_type == "academic"
-    )
-    comprehensive_score = sum(
-        app.final_score
-        for app in applications
-        if app.final_score is not None and app.application_type == "comprehensive"
-    )
-
     # 获取学生对象
     student = Student.query.filter_by(student_id=student_id).first()
     if not student:
         return None
 
-    # 获取学生所在学院的成绩设置
-    faculty_score_settings = FacultyScoreSettings.query.filter_by(
-        faculty_id=student.faculty_id
-    ).first()
+    # 汇总已通过申请并应用满分限制，更新综合成绩和专业排名
+    recompute_student_scores(student)
 
-    # 应用满分限制
-    if faculty_score_settings:
-        academic_score_calculated = min(
-            academic_score_calculated, faculty_score_settings.specialty_max_score
-        )
-        comprehensive_score = min(
-            comprehensive_score, faculty_score_settings.performance_max_score
-        )
-    else:
-        # 如果没有学院成绩设置，使用默认值
-        academic_score_calculated = min(
-            academic_score_calculated, 15.0
-        )  # 默认学术专长满分15分
-        comprehensive_score = min(comprehensive_score, 5.0)  # 默认综合表现满分5分
-
-    # 更新学生统计数据
-    student.academic_specialty_total = (
-        academic_score_calculated  # 学术专长总分（已应用满分限制）
+    # 保存更改到数据库
+    db.session.commit()
+
+    return {
+        "academic_specialty_total": student.academic_specialty_total,
+        "comprehensive_performance_total": student.comprehensive_performance_total,
+        "comprehensive_score": student.comprehensive_score,
+    }
+
+
+# 综合成绩默认设置（学院未配置成绩设置时使用）
+DEFAULT_ACADEMIC_SCORE_WEIGHT = 80.0  # 学业成绩权重（%）
+DEFAULT_SPECIALTY_MAX_SCORE = 15.0  # 学术专长满分
+DEFAULT_PERFORMANCE_MAX_SCORE = 5.0  # 综合表现满分
+
+# 综合成绩重算后台任务的说明
+RECALCULATION_JOB_DESCRIPTION = "重新计算综合成绩"
+
+
+def _capped(value, max_score):
+    """
+    SQL表达式：min(value, max_score)
+    """
+    return case((value > max_score, max_score), else_=value)
+
+
+def _recalculation_subquery(faculty_id=None):
+    """
+    构建综合成绩重算子查询（学生左连接学院成绩设置，缺省值使用80/15/5）
+
+    每行包含学生ID、当前值以及重算后的学术专长总分、综合表现总分和综合成绩
+    """
+    weight = func.coalesce(
+        FacultyScoreSettings.academic_score_weight, DEFAULT_ACADEMIC_SCORE_WEIGHT
     )
-    student.comprehensive_performance_total = (
-        comprehensive_score  # 综合表现总分（已应用满分限制）
+    specialty_max = func.coalesce(
+        FacultyScoreSettings.specialty_max_score, DEFAULT_SPECIALTY_MAX_SCORE
+    )
+    performance_max = func.coalesce(
+        FacultyScoreSettings.performance_max_score, DEFAULT_PERFORMANCE_MAX_SCORE
     )
 
-    # 计算综合成绩：学业成绩 * 学业成绩权重 / 100 + 学术专长总分 + 综合表现总分
-    academic_score = student.academic_score or 0.0
-    specialty_total = student.academic_specialty_total or 0.0
-    performance_total = student.comprehensive_performance_total or 0.0
+    # 与 score_aggregator 一致，按未应用满分限制的原始分数之和计算；
+    # 原始分数尚未初始化的学生使用当前总分
+    new_specialty = _capped(
+        func.coalesce(
+            Student.academic_specialty_raw, Student.academic_specialty_total, 0.0
+        ),
+        specialty_max,
+    )
+    new_performance = _capped(
+        func.coalesce(
+            Student.comprehensive_performance_raw,
+            Student.comprehensive_performance_total,
+            0.0,
+        ),
+        performance_max,
+    )
+    # 综合成绩：学业成绩 * 学业成绩权重 / 100 + 学术专长总分 + 综合表现总分，保留四位小数
+    new_score = func.round(
+        cast(
+            func.coalesce(Student.academic_score, 0.0) * weight / 100
+            + new_specialty
+            + new_performance,
+            Numeric,
+        ),
+        4,
+    )
 
-    if faculty_score_settings:
-        calculated_score = (
-            (academic_score * faculty_score_settings.academic_score_weight / 100)
-            + specialty_total
-            + performance_total
-        )
-    else:
-        # 如果没有学院成绩设置，使用默认权重80%
-        calculated_score = (
-            (academic_score * 80.0 / 100) + specialty_total + performance_total
-        )
+    query = select(
+        Student.id.label("id"),
+        Student.student_id.label("student_id"),
+        Student.major_id.label("major_id"),
+        Student.academic_specialty_total.label("old_specialty"),
+        Student.comprehensive_performance_total.label("old_performance"),
+        Student.comprehensive_score.label("old_score"),
+        new_specialty.label("new_specialty"),
+        new_performance.label("new_performance"),
+        cast(new_score, Float).label("new_score"),
+    ).outerjoin(
+        FacultyScoreSettings, FacultyScoreSettings.faculty_id == Student.faculty_id
+    )
+    if faculty_id is not None:
+        query = query.where(Student.faculty_id == faculty_id)
+    return query.subquery("recalculated")
 
-    # 更新综合成绩，保留四位小数
-    student.comprehensive_score = round(calculated_score, 4)
 
-    # 保存更改到数据库
-    db.session.commit()
+def _differs(old_value, new_value):
+    """
+    SQL条件：当前值为空或与重算值之差超过浮点误差
+
+    当前值由Python计算并四舍五入，重算值由数据库计算，二者可能只差浮点误差
+    """
+    return or_(old_value.is_(None), func.abs(old_value - new_value) > DRIFT_TOLERANCE)
+
+
+def _recalculation_changed(calc):
+    """
+    重算结果与当前值不一致的条件
+    """
+    return or_(
+        _differs(calc.c.old_specialty, calc.c.new_specialty),
+        _differs(calc.c.old_performance, calc.c.new_performance),
+        _differs(calc.c.old_score, calc.c.new_score),
+    )
+
+
+def _recalculation_diff_summary(calc, sample_size=20):
+    """
+    试运行：汇总重算将产生的变化，不修改数据
+    """
+    changed = _recalculation_changed(calc)
+    score_delta = func.abs(
+        calc.c.new_score - func.coalesce(calc.c.old_score, 0.0)
+    ).label("score_delta")
+
+    summary = db.session.execute(
+        select(
+            func.count().label("total_students"),
+            func.count().filter(changed).label("changed_students"),
+            func.count()
+            .filter(_differs(calc.c.old_specialty, calc.c.new_specialty))
+            .label("specialty_changed"),
+            func.count()
+            .filter(_differs(calc.c.old_performance, calc.c.new_performance))
+            .label("performance_changed"),
+            func.count()
+            .filter(_differs(calc.c.old_score, calc.c.new_score))
+            .label("score_changed"),
+            func.max(score_delta).label("max_score_delta"),
+        ).select_from(calc)
+    ).one()
+
+    samples = db.session.execute(
+        select(calc, score_delta)
+        .where(changed)
+        .order_by(score_delta.desc(), calc.c.id)
+        .limit(sample_size)
+    ).all()
 
     return {
-        "academic_specialty_total": student.academic_specialty_total,
-        "comprehensive_performance_total": student.comprehensive_performance_total,
-        "comprehensive_score": student.comprehensive_score,
+        "total_students": summary.total_students,
+        "changed_students": summary.changed_students,
+        "specialty_changed": summary.specialty_changed,
+        "performance_changed": summary.performance_changed,
+        "score_changed": summary.score_changed,
+        "max_score_delta": summary.max_score_delta or 0.0,
+        "samples": [
+            {
+                "student_id": row.student_id,
+                "academic_specialty_total": [row.old_specialty, row.new_specialty],
+                "comprehensive_performance_total": [
+                    row.old_performance,
+                    row.new_performance,
+                ],
+                "comprehensive_score": [row.old_score, row.new_score],
+            }
+            for row in samples
+        ],
     }
 
 
@@ -119,10 +222,13 @@ def recalculate_comprehensive_scores():
     """
     重新计算所有学生的综合成绩
     仅允许管理员访问
-    """
-    from extensions import db
-    from models import SystemSettings, Student, User, FacultyScoreSettings
 
+    查询参数：
+    - facultyId: 仅重算指定学院的学生（可选）
+    - dryRun: 为true时只返回变化汇总，不修改数据
+
+    实际重算在后台任务中执行，接口返回202和任务ID
+    """
     # 检查权限 - 仅管理员可以执行此操作
     username = request.args.get("username")
     if not username:
@@ -132,259 +238,158 @@ def recalculate_comprehensive_scores():
     if not user or user.role != "admin":
         return jsonify({"error": "无权限执行此操作"}), 403
 
+    faculty_id = request.args.get("facultyId", type=int)
+    dry_run = request.args.get("dryRun", "false").lower() in ("true", "1", "yes")
+
+    try:
+        if dry_run:
+            calc = _recalculation_subquery(faculty_id)
+            return (
+                jsonify(
+                    {
+                        "message": "综合成绩重算试运行完成，未修改数据",
+                        "dry_run": True,
+                        "diff": _recalculation_diff_summary(calc),
+                    }
+                ),
+                200,
+            )
+
+        job = job_runner.submit(
+            "recalculate-scores",
+            _run_recalculation,
+            {"facultyId": faculty_id},
+            description=RECALCULATION_JOB_DESCRIPTION,
+            created_by=username,
+            unique=True,
+        )
+        return job_accepted(job, "综合成绩重新计算任务已提交")
+
+    except JobConflict as e:
+        return job_conflict(e)
+    except Exception as e:
+        current_app.logger.error(f"提交综合成绩重算任务时出错: {str(e)}")
+        return jsonify({"error": "重新计算失败", "details": str(e)}), 500
+
+
+@job_runner.register("recalculate-scores", RECALCULATION_JOB_DESCRIPTION)
+def _run_recalculation(job, params):
+    """
+    后台任务：重新计算综合成绩
+
+    参数：
+    - facultyId: 仅重算指定学院的学生（可选）
+    """
+    faculty_id = params.get("facultyId")
     try:
-        # 获取所有学生
-        students = Student.query.all()
-
-        # 重新计算每个学生的综合成绩
-        updated_count = 0
-        for student in students:
-            # 获取学生的学术专长总分和综合表现总分
-            academic_score = student.academic_score or 0.0
-            specialty_total = student.academic_specialty_total or 0.0
-            performance_total = student.comprehensive_performance_total or 0.0
-
-            # 获取学生所在学院的成绩设置
-            faculty_score_settings = FacultyScoreSettings.query.filter_by(
-                faculty_id=student.faculty_id
-            ).first()
-
-            # 应用满分限制
-            if faculty_score_settings:
-                specialty_total = min(
-                    specialty_total, faculty_score_settings.specialty_max_score
-                )
-                performance_total = min(
-                    performance_total, faculty_score_settings.performance_max_score
-                )
-            else:
-                # 如果没有学院成绩设置，使用默认值
-                specialty_total = min(specialty_total, 15.0)  # 默认学术专长满分15分
-                performance_total = min(performance_total, 5.0)  # 默认综合表现满分5分
-
-            # 计算综合成绩：学业成绩 * 学业成绩权重 / 100 + 学术专长总分 + 综合表现总分
-            if faculty_score_settings:
-                calculated_score = (
-                    (
-                        academic_score
-                        * faculty_score_settings.academic_score_weight
-                        / 100
-                    )
-                    + specialty_total
-                    + performance_total
-                )
-            else:
-                # 如果没有学院成绩设置，使用默认权重80%
-                calculated_score = (
-                    (academic_score * 80.0 / 100) + specialty_total + performance_total
-                )
-
-            # 同时更新数据库中的学术专长总分和综合表现总分，确保它们不超过满分
-            student.academic_specialty_total = specialty_total
-            student.comprehensive_performance_total = performance_total
-
-            # 更新学生的综合成绩，保留四位小数
-            student.comprehensive_score = round(calculated_score, 4)
-            updated_count += 1
+        calc = _recalculation_subquery(faculty_id)
+
+        # 受影响的专业（用于重建专业排名表）
+        major_ids = [
+            row.major_id
+            for row in db.session.execute(
+                select(calc.c.major_id).where(_recalculation_changed(calc)).distinct()
+            )
+        ]
+        job.progress(0, len(major_ids) + 1, "更新综合成绩")
+
+        # 一条 UPDATE ... FROM 语句完成重算，只更新结果有变化的学生
+        result = db.session.execute(
+            update(Student)
+            .where(Student.id == calc.c.id, _recalculation_changed(calc))
+            .values(
+                academic_specialty_total=calc.c.new_specialty,
+                comprehensive_performance_total=calc.c.new_performance,
+                comprehensive_score=calc.c.new_score,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        updated_count = result.rowcount
+
+        # 重建受影响专业的排名
+        for index, major_id in enumerate(major_ids, start=1):
+            job.progress(index, len(major_ids) + 1, "重建专业排名")
+            if major_id is not None:
+                rebuild_major_ranking(major_id)
 
         # 保存所有更改到数据库
         db.session.commit()
 
-        return (
-            jsonify(
-                {
-                    "message": "综合成绩重新计算完成",
-                    "updated_students": updated_count,
-                }
-            ),
-            200,
-        )
+        return {
+            "message": "综合成绩重新计算完成",
+            "updated_students": updated_count,
+        }
 
     except Exception as e:
-        # 发生错误时回滚事务
+        # 发生错误或任务被取消时回滚事务
         db.session.rollback()
         current_app.logger.error(f"重新计算综合成绩时出错: {str(e)}")
-        return jsonify({"error": "重新计算失败", "details": str(e)}), 500
+        raise
 
 
-# 获取学生推免成绩排名API
-@score_bp.route("/students/ranking", methods=["GET"])
-def get_students_ranking():
+# 核对学生成绩汇总
+@score_bp.route("/students/reconcile-scores", methods=["POST"])
+def reconcile_scores():
+    """
+    全量核对增量维护的学生成绩汇总是否与已通过申请一致
+    仅允许管理员访问
+
+    查询参数：
+    - fix: 为true时重新汇总存在偏差的学生，并重建排名表不一致的专业
+    """
+    username = request.args.get("username")
+    if not username:
+        return jsonify({"error": "缺少用户名参数"}), 400
+
+    user = User.query.filter_by(username=username).first()
+    if not user or user.role != "admin":
+        return jsonify({"error": "无权限执行此操作"}), 403
+
+    fix = request.args.get("fix", "false").lower() in ("true", "1", "yes")
+
     try:
-        # 获取查询参数
-        faculty_id = request.args.get("facultyId")
-        department_id = request.args.get("departmentId")
-        major_id = request.args.get("majorId")
-
-        # 构建查询条件 - 使用合并后的Student模型
-        query = Student.query
-
-        # 应用筛选条件 - 添加类型检查和转换
-        if faculty_id and faculty_id != "all":
-            try:
-                faculty_id = int(faculty_id)
-                query = query.filter_by(faculty_id=faculty_id)
-            except ValueError:
-                # 如果参数不是有效整数，忽略该筛选条件
-                pass
-
-        if department_id and department_id != "all":
-            try:
-                department_id = int(department_id)
-                query = query.filter_by(department_id=department_id)
-            except ValueError:
-                # 如果参数不是有效整数，忽略该筛选条件
-                pass
-
-        if major_id and major_id != "all":
-            try:
-                major_id = int(major_id)
-                query = query.filter_by(major_id=major_id)
-            except ValueError:
-                # 如果参数不是有效整数，忽略该筛选条件
-                pass
-
-        # 获取所有符合条件的学生数据
-        students = query.all()
-
-        # 按专业分组学生
-        students_by_major = {}
-        for student in students:
-            major_id = student.major_id
-            if major_id not in students_by_major:
-                students_by_major[major_id] = []
-            students_by_major[major_id].append(student)
-
-        # 计算每个专业内学生的排名
-        for major_id, major_students in students_by_major.items():
-            # 按综合成绩降序排序
-            major_students.sort(
-                key=lambda s: s.comprehensive_score or 0.0, reverse=True
+        report = reconcile_student_scores(fix=fix)
+        if fix:
+            db.session.commit()
+        if report["drifted_students"]:
+            current_app.logger.warning(
+                f"学生成绩汇总存在偏差: {report['drifted_students']}名学生，"
+                f"已修复{report['fixed_students']}名"
             )
+        if report["stale_rankings"]:
+            current_app.logger.warning(
+                f"专业排名表与学生数据不一致: {report['stale_rankings']}名学生，"
+                f"已重建{report['rebuilt_majors']}个专业"
+            )
+        return jsonify(report), 200
 
-            # 设置排名和总人数
-            total_students = len(major_students)
-            for i, student in enumerate(major_students):
-                # 计算排名（处理并列情况）
-                if (
-                    i > 0
-                    and student.comprehensive_score
-                    == major_students[i - 1].comprehensive_score
-                ):
-                    student.major_ranking = major_students[i - 1].major_ranking
-                else:
-                    student.major_ranking = i + 1
-                student.total_students = total_students
-
-        # 获取所有学生的加分申请
-        student_applications = {}
-        for student in students:
-            # 获取该学生通过的学术专长申请
-            academic_applications = Application.query.filter_by(
-                student_id=student.student_id,
-                application_type="academic",
-                status="approved",
-            ).all()
-
-            # 获取该学生通过的综合表现申请
-            comprehensive_applications = Application.query.filter_by(
-                student_id=student.student_id,
-                application_type="comprehensive",
-                status="approved",
-            ).all()
-
-            student_applications[student.id] = {
-                "academic": academic_applications,
-                "comprehensive": comprehensive_applications,
-            }
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"核对学生成绩汇总时出错: {str(e)}")
+        return jsonify({"error": "核对失败", "details": str(e)}), 500
 
-        # 按学生ID分组统计
-        student_stats = {}
-
-        # 从Student模型获取基本数据
-        for student in students:
-            student_id = student.id
-
-            # 构建学生基本信息
-            student_info = {
-                "id": student.id,  # 添加主键ID字段
-                "student_id": student.student_id,
-                "student_name": student.student_name,
-                "departmentId": student.department_id,
-                "department": (
-                    student.department.name if student.department else "未知系别"
-                ),
-                "majorId": student.major_id,
-                "major": student.major.name if student.major else "未知专业",
-                "facultyId": student.faculty_id,  # 添加学院ID
-                "faculty": (
-                    student.faculty.name if student.faculty else "未知学院"
-                ),  # 添加学院名称，处理空值情况
-                "gender": student.gender,
-                "cet4_score": student.cet4_score,
-                "cet6_score": student.cet6_score,
-                "gpa": student.gpa,
-                "academic_score": student.academic_score,
-                "academic_specialty_total": student.academic_specialty_total or 0.0,
-                "comprehensive_performance_total": student.comprehensive_performance_total
-                or 0.0,
-                # 保持向后兼容，total_score使用comprehensive_score的值
-                "total_score": student.comprehensive_score or 0.0,
-                "major_ranking": student.major_ranking,
-                "major_total_students": student.total_students,
-                "specialty_score": student.academic_specialty_total or 0.0,
-                "comprehensive_score": student.comprehensive_score or 0.0,
-                # 考核综合成绩总分（学术专长分 + 综合表现分）
-                "total_comprehensive_score": (student.academic_specialty_total or 0.0)
-                + (student.comprehensive_performance_total or 0.0),
-                # 综合成绩（学业成绩*权重 + 学术专长分 + 综合表现分）
-                "final_comprehensive_score": student.comprehensive_score or 0.0,
-                # 向前端提供final_score字段，用于显示综合成绩
-                "final_score": student.comprehensive_score or 0.0,
-                "sequence": 0,
-                # 添加加分项目信息
-                "academicItems": [],
-                "comprehensiveItems": [],
-            }
 
-            # 添加学术专长申请数据
-            for app in student_applications[student_id]["academic"]:
-                academic_item = {
-                    "project_name": app.project_name,
-                    "award_time": (
-                        app.award_date.isoformat() if app.award_date else None
-                    ),
-                    "self_eval_score": app.self_score,
-                    "score_basis": app.description,
-                    "college_approved_score": app.final_score,
-                    "total_score": app.final_score,
-                }
-                student_info["academicItems"].append(academic_item)
-
-            # 添加综合表现申请数据
-            for app in student_applications[student_id]["comprehensive"]:
-                comprehensive_item = {
-                    "project_name": app.project_name,
-                    "award_time": (
-                        app.award_date.isoformat() if app.award_date else None
-                    ),
-                    "self_eval_score": app.self_score,
-                    "score_basis": app.description,
-                    "college_approved_score": app.final_score,
-                    "total_score": app.final_score,
-                }
-                student_info["comprehensiveItems"].append(comprehensive_item)
-
-            student_stats[student_id] = student_info
-
-        # 转换为列表并按最终综合成绩排序
-        sorted_students = sorted(
-            student_stats.values(), key=lambda x: x["final_score"], reverse=True
-        )
+# 获取学生推免成绩排名API
+@score_bp.route("/students/ranking", methods=["GET"])
+def get_students_ranking():
+    try:
+        # 获取查询参数
+        filters = {}
+        for param, key in (
+            ("facultyId", "faculty_id"),
+            ("departmentId", "department_id"),
+            ("majorId", "major_id"),
+        ):
+            value = request.args.get(param)
+            if value and value != "all":
+                try:
+                    filters[key] = int(value)
+                except ValueError:
+                    # 如果参数不是有效整数，忽略该筛选条件
+                    pass
 
-        # 设置全局排名
-        for i, student in enumerate(sorted_students):
-            student["sequence"] = i + 1
+        # 使用排名引擎一次性计算排名并加载加分项目，避免逐个学生查询
+        sorted_students = build_student_ranking(**filters)
 
         return (
             jsonify({"students": sorted_students, "total": len(sorted_students)}),
@@ -419,17 +424,13 @@ def get_all_students():
     students = pagination.items
 
     student_list = []
+    # 从组织架构缓存中获取名称，避免逐行查询
+    org = get_org_snapshot()
     for student in students:
         # 获取学院、系和专业名称
-        faculty_name = (
-            Faculty.query.get(student.faculty_id).name if student.faculty_id else ""
-        )
-        department_name = (
-            Department.query.get(student.department_id).name
-            if student.department_id
-            else ""
-        )
-        major_name = Major.query.get(student.major_id).name if student.major_id else ""
+        faculty_name = org.faculty_name(student.faculty_id)
+        department_name = org.department_name(student.department_id)
+        major_name = org.major_name(student.major_id)
 
         student_data = {
             "id": student.id,
@@ -570,6 +571,10 @@ def update_student(student_id):
     if "total_students" in data:
         student.total_students = data["total_students"]
 
+    # 专业或综合成绩可能已变化，同步专业排名表
+    db.session.flush()
+    update_student_ranking(student)
+
     db.session.commit()
 
     return jsonify({"message": "学生信息更新成功"}), 200
@@ -596,41 +601,10 @@ def get_student_statistics():
         # 保持向后兼容，total_score使用comprehensive_score的值
         total_score = comprehensive_score
 
-        # 确保排名和专业内人数已计算
-        if student.major_id and (
-            student.major_ranking is None or student.total_students is None
-        ):
-            # 获取该专业的所有学生
-            major_students = Student.query.filter_by(major_id=student.major_id).all()
-            total_students = len(major_students)
-
-            # 按综合成绩降序排序
-            major_students.sort(
-                key=lambda s: s.comprehensive_score or 0.0, reverse=True
-            )
-
-            # 计算排名（处理并列情况）
-            for i, s in enumerate(major_students):
-                if (
-                    i > 0
-                    and s.comprehensive_score
-                    == major_students[i - 1].comprehensive_score
-                ):
-                    s.major_ranking = major_students[i - 1].major_ranking
-                else:
-                    s.major_ranking = i + 1
-                s.total_students = total_students
-
-            # 保存更改到数据库
-            db.session.commit()
-
-        ranking = student.major_ranking or "-"
-        # 计算专业内人数
-        major_total_students = student.total_students or (
-            Student.query.filter_by(major_id=student.major_id).count()
-            if student.major_id
-            else 0
-        )
+        # 从物化排名表读取专业排名和专业内人数
+        ranking_entry = get_student_ranking(student)
+        ranking = ranking_entry.ranking if ranking_entry else "-"
+        major_total_students = ranking_entry.total_students if ranking_entry else 0
     else:
         # 如果Student模型中没有数据，初始化默认值
         academic_score = 0.0
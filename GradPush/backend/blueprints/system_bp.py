@@ -3,56 +3,47 @@
 系统维护蓝图
 
 该文件负责处理系统维护相关的API端点，包括：
-- 数据库备份
+- 数据库备份与恢复（在后台任务中执行）
+- 上传文件增量备份快照的查看与恢复
 - 系统日志查看
 - 缓存清理
+- 验证码预生成池统计
+- 请求耗时和SQL查询统计
+- Prometheus格式的运行指标
 """
 
 import os
 import sys
 import shutil
+import hmac
+import logging
 from flask import (
+    Response,
     Blueprint,
     request,
     jsonify,
     send_from_directory,
     current_app,
-    send_file,
+    session,
 )
 from datetime import datetime
-from extensions import db
+from extensions import db, job_runner, request_metrics
 from models import SystemSettings
-from psycopg2 import connect, OperationalError
-from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
-from psycopg2.extensions import cursor
 
 # 导入数据库备份模块
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from db_backup import backup_database_python, restore_database_python, restore_uploads
-
-
-# 获取数据库连接
-def get_db_connection():
-    """
-    获取数据库连接
-    """
-    from config import Config
-    from urllib.parse import urlparse
-
-    try:
-        # 从SQLALCHEMY_DATABASE_URI解析数据库配置
-        db_url = urlparse(Config.SQLALCHEMY_DATABASE_URI)
-        conn = connect(
-            dbname=db_url.path[1:],  # 去除开头的'/'
-            user=db_url.username,
-            password=db_url.password,
-            host=db_url.hostname,
-            port=db_url.port,
-        )
-        return conn
-    except OperationalError as e:
-        current_app.logger.error(f"无法连接到数据库: {str(e)}")
-        raise e
+from db_backup import (
+    restore_database_python,
+    upload_store,
+)
+from utils.job_runner import JobConflict
+from utils.upload_store import UploadStoreError
+from utils.backup_engine import dump_database, database_dsn, is_backup_archive
+from blueprints.job_bp import job_accepted, job_conflict
+from utils.captcha_pool import get_captcha_pool
+from utils.log_index import LogFilter, parse_log_time, query_log
+from utils.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, metrics
+from utils.org_cache import invalidate_org_cache
 
 
 # 创建蓝图实例
@@ -68,25 +59,52 @@ LOG_FOLDER = os.path.join(
 CACHE_FOLDER = os.path.join(
     os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache"
 )
+UPLOADS_FOLDER = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "uploads"
+)
+
+# 日志查询每次最多返回的记录数
+MAX_LOG_RECORDS = 1000
 
 # 确保备份文件夹存在
 os.makedirs(BACKUP_FOLDER, exist_ok=True)
 os.makedirs(LOG_FOLDER, exist_ok=True)
 
+# 数据库备份后台任务的说明
+BACKUP_JOB_DESCRIPTION = "备份数据库"
+
 
 # API端点：手动备份数据库
 @system_bp.route("/backup", methods=["POST"])
 def backup_database():
     """
     手动备份数据库
-    生成包含SQL文件和uploads.zip的单个ZIP文件
+    生成包含SQL文件和uploads.zip的单个ZIP文件（在后台任务中执行，返回202和任务ID）
     """
     try:
-        import zipfile
-        import io
-        import tempfile
-        import json
+        job = job_runner.submit(
+            "backup",
+            _run_backup,
+            {},
+            description=BACKUP_JOB_DESCRIPTION,
+            created_by=session.get("username"),
+            unique=True,
+        )
+        current_app.logger.info(f"管理员提交数据库备份任务: {job['id']}")
+        return job_accepted(job, "数据库备份任务已提交")
+    except JobConflict as e:
+        return job_conflict(e)
+    except Exception as e:
+        current_app.logger.error(f"提交数据库备份任务失败: {str(e)}")
+        return jsonify({"success": False, "message": f"数据库备份失败: {str(e)}"}), 500
+
 
+@job_runner.register("backup", BACKUP_JOB_DESCRIPTION)
+def _run_backup(job, params):
+    """
+    后台任务：备份数据库和uploads目录
+    """
+    try:
         # 记录备份开始
         current_app.logger.info("管理员开始执行数据库备份操作")
 
@@ -94,189 +112,21 @@ def backup_database():
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         current_app.logger.info(f"备份时间戳: {timestamp}")
 
-        # 创建临时SQL文件
-        with tempfile.NamedTemporaryFile(suffix=".sql", delete=False) as temp_sql:
-            temp_sql_path = temp_sql.name
-        current_app.logger.info(f"创建临时SQL文件: {temp_sql_path}")
-
-        # 创建临时uploads.zip文件
-        with tempfile.NamedTemporaryFile(
-            suffix="_uploads.zip", delete=False
-        ) as temp_zip:
-            temp_zip_path = temp_zip.name
-        current_app.logger.info(f"创建临时uploads.zip文件: {temp_zip_path}")
-
-        # 执行数据库备份到临时SQL文件
-        # 注意：我们直接调用备份功能，不使用会自动创建uploads.zip的函数
-        conn = get_db_connection()
-        conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
-        cursor = conn.cursor()
-
-        with open(temp_sql_path, "w", encoding="utf-8") as f:
-            # 备份所有序列
-            cursor.execute(
-                """
-                SELECT
-                    t.table_name,
-                    c.column_name,
-                    pg_get_serial_sequence(t.table_name::text, c.column_name::text) AS sequence_name
-                FROM
-                    information_schema.tables t
-                JOIN
-                    information_schema.columns c ON t.table_name = c.table_name AND t.table_schema = c.table_schema
-                WHERE
-                    t.table_schema = 'public' AND
-                    t.table_type = 'BASE TABLE' AND
-                    c.column_default LIKE '%nextval%'
-            """
-            )
-            serial_sequences = cursor.fetchall()
-
-            sequences = set()
-            for row in serial_sequences:
-                sequence_name = row[2]
-                if sequence_name:
-                    sequences.add(sequence_name)
-
-            # 也直接获取所有序列
-            cursor.execute(
-                "SELECT sequence_name FROM information_schema.sequences WHERE sequence_schema = 'public'"
-            )
-            direct_sequences = cursor.fetchall()
-            for seq in direct_sequences:
-                sequences.add(f"public.{seq[0]}")
-
-            if sequences:
-                for seq_name in sequences:
-                    f.write(f"-- 序列: {seq_name}\n")
-                    # 直接查询序列值，因为序列名已经过处理是安全的
-                    cursor.execute(f"SELECT last_value FROM {seq_name}")
-                    seq_info = cursor.fetchone()
-                    if seq_info:
-                        last_value = seq_info[0]
-                        # 转义序列名中的单引号
-                        escaped_seq_name = seq_name.replace("'", "''")
-                        f.write(
-                            f"SELECT setval('{escaped_seq_name}', {last_value}, true);\n"
-                        )
-                f.write("\n")
-
-            # 获取所有表
-            cursor.execute(
-                """
-                SELECT table_name 
-                FROM information_schema.tables 
-                WHERE table_schema = 'public' AND table_type = 'BASE TABLE'
-                ORDER BY table_name
-            """
-            )
-            tables = cursor.fetchall()
-
-            for (table_name,) in tables:
-                quoted_table_name = f'public."{table_name}"'
-
-                # 备份表结构
-                f.write(f"-- 表结构: {table_name}\n")
-                cursor.execute(
-                    f"SELECT column_name, data_type, column_default, is_nullable FROM information_schema.columns WHERE table_schema = 'public' AND table_name = %s ORDER BY ordinal_position",
-                    (table_name,),
-                )
-                columns = cursor.fetchall()
-
-                f.write(f"CREATE TABLE IF NOT EXISTS {quoted_table_name} (")
-                column_definitions = []
-
-                for col_name, data_type, col_default, is_nullable in columns:
-                    col_def = f'    "{col_name}" {data_type}'
-                    if col_default is not None:
-                        col_def += f" DEFAULT {col_default}"
-                    if is_nullable == "NO":
-                        col_def += " NOT NULL"
-                    column_definitions.append(col_def)
-
-                # 添加主键约束
-                cursor.execute(
-                    """
-                    SELECT constraint_name, column_name 
-                    FROM information_schema.key_column_usage 
-                    WHERE table_schema = 'public' AND table_name = %s AND constraint_name LIKE '%%_pkey'
-                """,
-                    (table_name,),
-                )
-                primary_keys = cursor.fetchall()
-                if primary_keys:
-                    pkey_cols = [pk[1] for pk in primary_keys]
-                    column_definitions.append(f'    PRIMARY KEY ("{pkey_cols[0]}")')
-
-                f.write(",\n".join(column_definitions))
-                f.write(f"\n);\n\n")
-
-                # 备份表数据
-                cursor.execute(f"SELECT * FROM {quoted_table_name}")
-                rows = cursor.fetchall()
-
-                if rows:
-                    f.write(f"-- 表数据: {table_name}\n")
-                    column_names = [desc[0] for desc in cursor.description]
-
-                    for row in rows:
-                        # 处理特殊字符
-                        values = []
-                        for value in row:
-                            if value is None:
-                                values.append("NULL")
-                            elif isinstance(value, str):
-                                # 转义单引号
-                                escaped_value = value.replace("'", "''")
-                                values.append(f"'{escaped_value}'")
-                            elif isinstance(value, datetime):
-                                values.append(f"'{value}'")
-                            elif isinstance(value, list):
-                                # 处理列表/数组类型，转换为JSON格式
-                                json_str = json.dumps(value)
-                                escaped_str = json_str.replace("'", "''")
-                                values.append(f"'{escaped_str}'")
-                            else:
-                                values.append(str(value))
-
-                        insert_sql = f"INSERT INTO {quoted_table_name} ({', '.join([f'\"{col}\"' for col in column_names])}) VALUES ({', '.join(values)});\n"
-                        f.write(insert_sql)
-                    f.write("\n")
-
-        cursor.close()
-        conn.close()
-
-        # 备份uploads目录到临时ZIP文件
-        uploads_dir = os.path.join(
-            os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "uploads"
-        )
-        with zipfile.ZipFile(temp_zip_path, "w", zipfile.ZIP_DEFLATED) as zipf:
-            if os.path.exists(uploads_dir):
-                for root, dirs, files in os.walk(uploads_dir):
-                    for file in files:
-                        file_path = os.path.join(root, file)
-                        arcname = os.path.relpath(file_path, uploads_dir)
-                        zipf.write(file_path, arcname)
-
-        # 创建最终的完整备份ZIP文件
+        # 流式备份数据库和uploads目录到ZIP文件
         final_backup_filename = f"gradpush_backup_{timestamp}.zip"
         final_backup_path = os.path.join(BACKUP_FOLDER, final_backup_filename)
-
-        with zipfile.ZipFile(final_backup_path, "w", zipfile.ZIP_DEFLATED) as final_zip:
-            # 添加SQL文件到ZIP根目录
-            sql_filename = os.path.basename(temp_sql_path)
-            final_zip.write(
-                temp_sql_path, sql_filename.replace(".sql", "_database.sql")
-            )
-
-            # 添加uploads.zip文件到ZIP根目录
-            uploads_zip_filename = os.path.basename(temp_zip_path)
-            final_zip.write(temp_zip_path, uploads_zip_filename)
-
-        # 删除临时文件
-        os.unlink(temp_sql_path)
-        os.unlink(temp_zip_path)
-        current_app.logger.info(f"删除临时文件，备份已保存到: {final_backup_filename}")
+        report = dump_database(
+            final_backup_path,
+            database_dsn(current_app.config["SQLALCHEMY_DATABASE_URI"]),
+            uploads_dir=UPLOADS_FOLDER,
+            workers=current_app.config.get("BACKUP_WORKERS", 4),
+            progress=job.progress,
+            upload_store=(
+                upload_store
+                if current_app.config.get("BACKUP_UPLOADS_MODE") == "incremental"
+                else None
+            ),
+        )
 
         # 更新系统设置中的最后备份时间
         settings = SystemSettings.query.first()
@@ -286,21 +136,21 @@ def backup_database():
             current_app.logger.info("系统设置中的最后备份时间已更新")
 
         current_app.logger.info(
-            f"数据库备份成功，生成备份文件: {final_backup_filename}"
-        )
-        return (
-            jsonify(
-                {
-                    "success": True,
-                    "message": "数据库备份成功",
-                    "backup_file": final_backup_filename,
-                }
-            ),
-            200,
+            f"数据库备份成功，生成备份文件: {final_backup_filename}，"
+            f"{report['tables']}个表/{report['rows']}行，"
+            f"{report['uploadFiles']}个上传文件（新增{report['uploadNewFiles']}个），"
+            f"备份文件{report['archiveBytes']}字节，"
+            f"耗时{report['seconds']}秒（{report['throughputMBps']}MB/s）"
         )
+        return {
+            "success": True,
+            "message": "数据库备份成功",
+            "backup_file": final_backup_filename,
+            "report": report,
+        }
     except Exception as e:
         current_app.logger.error(f"数据库备份失败: {str(e)}")
-        return jsonify({"success": False, "message": f"数据库备份失败: {str(e)}"}), 500
+        raise
 
 
 # API端点：获取备份列表
@@ -369,15 +219,81 @@ def download_backup(filename):
         )
 
 
+# 上传文件恢复后台任务的说明
+UPLOADS_RESTORE_JOB_DESCRIPTION = "恢复上传文件"
+
+
+# API端点：获取上传文件快照列表
+@system_bp.route("/uploads/snapshots", methods=["GET"])
+def get_upload_snapshots():
+    """
+    获取上传文件的增量备份快照列表（每次备份一份，最新的在前）
+    """
+    try:
+        return (
+            jsonify({"success": True, "snapshots": upload_store.list_snapshots()}),
+            200,
+        )
+    except Exception as e:
+        current_app.logger.error(f"获取上传文件快照列表失败: {str(e)}")
+        return (
+            jsonify({"success": False, "message": f"获取快照列表失败: {str(e)}"}),
+            500,
+        )
+
+
+# API端点：将上传文件恢复到指定快照
+@system_bp.route("/uploads/snapshots/<snapshot_id>/restore", methods=["POST"])
+def restore_upload_snapshot(snapshot_id):
+    """
+    将uploads目录恢复到指定快照时的状态，不影响数据库（在后台任务中执行，返回202和任务ID）
+    """
+    try:
+        upload_store.load_manifest(snapshot_id)
+    except UploadStoreError as e:
+        return jsonify({"success": False, "message": str(e)}), 404
+
+    try:
+        job = job_runner.submit(
+            "restore",
+            _run_uploads_restore,
+            snapshot_id,
+            description=f"{UPLOADS_RESTORE_JOB_DESCRIPTION}：{snapshot_id}",
+            created_by=session.get("username"),
+            unique=True,
+        )
+        return job_accepted(job, "上传文件恢复任务已提交")
+    except JobConflict as e:
+        return job_conflict(e)
+    except Exception as e:
+        current_app.logger.error(f"提交上传文件恢复任务失败: {str(e)}")
+        return jsonify({"success": False, "message": f"恢复失败: {str(e)}"}), 500
+
+
+def _run_uploads_restore(job, snapshot_id):
+    """
+    后台任务：按快照清单恢复uploads目录
+    """
+    manifest = upload_store.load_manifest(snapshot_id)
+    report = upload_store.restore(
+        manifest,
+        UPLOADS_FOLDER,
+        progress=lambda done, total: job.progress(done, total, "恢复上传文件"),
+    )
+    current_app.logger.info(
+        f"上传文件已恢复到快照 {snapshot_id}：共{report['files']}个文件，"
+        f"复制{report['copied']}个，删除{report['removed']}个"
+    )
+    return {"success": True, "message": "上传文件恢复成功", "report": report}
+
+
 # API端点：恢复数据库
 @system_bp.route("/restore", methods=["POST"])
 def restore_database():
     """
-    从备份文件恢复数据库
+    从备份文件恢复数据库（在后台任务中执行，返回202和任务ID）
     """
     try:
-        import os
-        
         current_app.logger.info("管理员开始执行数据库恢复操作")
 
         data = request.get_json()
@@ -395,39 +311,53 @@ def restore_database():
             current_app.logger.warning(f"备份文件不存在: {backup_file}")
             return jsonify({"success": False, "message": "备份文件不存在"}), 404
 
-        current_app.logger.info(f"开始从备份文件恢复: {backup_file}")
-        # 执行恢复
-        success = restore_database_python(backup_file)
-
-        if success:
-            current_app.logger.info(f"数据库恢复成功: {filename}")
-            return jsonify({"success": True, "message": "数据库恢复成功"}), 200
-        else:
-            current_app.logger.error(f"数据库恢复失败: {filename}")
-            return jsonify({"success": False, "message": "数据库恢复失败"}), 500
+        job = job_runner.submit(
+            "restore",
+            _run_restore,
+            backup_file,
+            filename,
+            description=f"恢复数据库：{filename}",
+            created_by=session.get("username"),
+            unique=True,
+        )
+        return job_accepted(job, "数据库恢复任务已提交")
+    except JobConflict as e:
+        return job_conflict(e)
     except Exception as e:
         current_app.logger.error(f"数据库恢复失败: {str(e)}")
         return jsonify({"success": False, "message": f"数据库恢复失败: {str(e)}"}), 500
 
 
+def _run_restore(job, backup_file, filename):
+    """
+    后台任务：从备份文件恢复数据库
+    """
+    current_app.logger.info(f"开始从备份文件恢复: {backup_file}")
+    job.progress(message="恢复数据库")
+    # 执行恢复（按已读取的备份数据字节数报告进度）
+    success = restore_database_python(backup_file, progress=job.progress)
+
+    if not success:
+        job.check_cancelled()
+        current_app.logger.error(f"数据库恢复失败: {filename}")
+        raise RuntimeError("数据库恢复失败")
+
+    # 各工作进程缓存的组织架构已过期
+    invalidate_org_cache()
+    current_app.logger.info(f"数据库恢复成功: {filename}")
+    return {"success": True, "message": "数据库恢复成功"}
+
+
 # API端点：上传并恢复备份文件
 @system_bp.route("/restore/upload", methods=["POST"])
 def upload_and_restore():
     """
     上传并恢复备份文件
-    直接从单个包含SQL和uploads.zip的ZIP文件中恢复
+    直接从单个包含SQL和uploads.zip的ZIP文件中恢复（保存文件后在后台任务中恢复，返回202和任务ID）
     """
     try:
-        from datetime import datetime
-        import os
-        import zipfile
-        import io
-
         current_app.logger.info("管理员开始执行上传并恢复数据库操作")
 
-        temp_sql_path = None
-        temp_zip_path = None
-
         # 检查是否有上传文件
         if "file" not in request.files or request.files["file"].filename == "":
             current_app.logger.warning("未上传任何备份文件")
@@ -446,6 +376,10 @@ def upload_and_restore():
                 400,
             )
 
+        active = job_runner.find_active("restore")
+        if active is not None:
+            return job_conflict(JobConflict(active))
+
         # 生成备份文件名
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         final_backup_filename = f"gradpush_backup_{timestamp}.zip"
@@ -456,106 +390,68 @@ def upload_and_restore():
         current_app.logger.info(f"上传的备份文件已保存: {final_backup_path}")
 
         try:
-            # 打开ZIP文件并寻找SQL和ZIP文件
+            job = job_runner.submit(
+                "restore",
+                _run_upload_restore,
+                final_backup_path,
+                final_backup_filename,
+                timestamp,
+                description=f"上传并恢复备份：{original_filename}",
+                created_by=session.get("username"),
+                unique=True,
+            )
+        except Exception:
+            if os.path.exists(final_backup_path):
+                os.remove(final_backup_path)
+            raise
+        return job_accepted(job, "备份恢复任务已提交")
+
+    except JobConflict as e:
+        return job_conflict(e)
+    except Exception as e:
+        current_app.logger.error(f"上传并恢复数据库失败: {str(e)}")
+        return jsonify({"success": False, "message": f"恢复失败: {str(e)}"}), 500
+
+
+def _run_upload_restore(job, final_backup_path, final_backup_filename, timestamp):
+    """
+    后台任务：从上传的备份ZIP文件中恢复数据库和uploads目录
+
+    备份文件中的SQL和uploads.zip直接从ZIP中流式读取，不再解压到临时文件
+    """
+    import zipfile
+
+    try:
+        # 旧格式的备份文件需包含SQL数据库备份文件
+        if not is_backup_archive(final_backup_path):
             with zipfile.ZipFile(final_backup_path, "r") as zipf:
                 current_app.logger.info(f"开始解析备份ZIP文件: {final_backup_filename}")
-
-                # 寻找SQL文件
-                sql_files = [name for name in zipf.namelist() if name.endswith(".sql")]
-                if not sql_files:
+                if not any(name.endswith(".sql") for name in zipf.namelist()):
                     current_app.logger.error("ZIP文件中未找到SQL数据库备份文件")
                     raise ValueError("ZIP文件中未找到SQL数据库备份文件")
 
-                # 使用第一个找到的SQL文件
-                sql_filename = sql_files[0]
-                current_app.logger.info(f"找到SQL备份文件: {sql_filename}")
-
-                # 提取SQL文件到临时路径
-                temp_sql_path = os.path.join(
-                    BACKUP_FOLDER, f"temp_restore_{timestamp}.sql"
-                )
-                with open(temp_sql_path, "wb") as sql_out:
-                    sql_out.write(zipf.read(sql_filename))
-                current_app.logger.info(f"已提取SQL文件到临时路径: {temp_sql_path}")
-
-                # 寻找uploads.zip文件
-                uploads_zip_files = [
-                    name for name in zipf.namelist() if "_uploads.zip" in name
-                ]
-
-                # 如果找到uploads.zip文件，提取它
-                if uploads_zip_files:
-                    uploads_zip_filename = uploads_zip_files[0]
-                    temp_zip_path = os.path.join(
-                        BACKUP_FOLDER, f"temp_restore_uploads_{timestamp}.zip"
-                    )
-                    with open(temp_zip_path, "wb") as zip_out:
-                        zip_out.write(zipf.read(uploads_zip_filename))
-                    current_app.logger.info(
-                        f"已提取uploads.zip文件到临时路径: {temp_zip_path}"
-                    )
-        except Exception as e:
-            # 如果解压失败，删除保存的备份文件
-            if os.path.exists(final_backup_path):
-                os.remove(final_backup_path)
-            raise e
-
-        try:
-            # 恢复数据库
-            current_app.logger.info(f"开始从SQL文件恢复数据库: {temp_sql_path}")
-            success = restore_database_python(temp_sql_path)
-
-            # 恢复uploads目录
-            if temp_zip_path and os.path.exists(temp_zip_path):
-                current_app.logger.info(f"开始恢复uploads目录: {temp_zip_path}")
-                restore_uploads(temp_zip_path)
-                current_app.logger.info("uploads目录恢复完成")
-
-            if success:
-                current_app.logger.info(f"数据库恢复成功: {final_backup_filename}")
-                # 恢复成功后，删除临时文件
-                if os.path.exists(temp_sql_path):
-                    os.remove(temp_sql_path)
-                    current_app.logger.info(f"删除临时SQL文件: {temp_sql_path}")
-                if temp_zip_path and os.path.exists(temp_zip_path):
-                    os.remove(temp_zip_path)
-                    current_app.logger.info(f"删除临时uploads.zip文件: {temp_zip_path}")
-
-                return (
-                    jsonify(
-                        {
-                            "success": True,
-                            "message": "备份恢复成功",
-                            "backup_file": final_backup_filename,
-                        }
-                    ),
-                    200,
-                )
-            else:
-                current_app.logger.error(f"数据库恢复失败: {final_backup_filename}")
-                # 恢复失败，删除临时文件和保存的备份文件
-                if os.path.exists(temp_sql_path):
-                    os.remove(temp_sql_path)
-                if temp_zip_path and os.path.exists(temp_zip_path):
-                    os.remove(temp_zip_path)
-                if os.path.exists(final_backup_path):
-                    os.remove(final_backup_path)
-                return jsonify({"success": False, "message": "备份恢复失败"}), 500
-
-        except Exception as e:
-            current_app.logger.error(f"恢复过程中发生错误: {str(e)}")
-            # 恢复失败，删除临时文件和保存的备份文件
-            if os.path.exists(temp_sql_path):
-                os.remove(temp_sql_path)
-            if temp_zip_path and os.path.exists(temp_zip_path):
-                os.remove(temp_zip_path)
-            if os.path.exists(final_backup_path):
-                os.remove(final_backup_path)
-            raise e
+        job.progress(message="恢复数据库")
+        success = restore_database_python(final_backup_path, progress=job.progress)
+        if not success:
+            job.check_cancelled()
+            current_app.logger.error(f"数据库恢复失败: {final_backup_filename}")
+            raise RuntimeError("备份恢复失败")
+
+        # 各工作进程缓存的组织架构已过期
+        invalidate_org_cache()
+        current_app.logger.info(f"数据库恢复成功: {final_backup_filename}")
+        return {
+            "success": True,
+            "message": "备份恢复成功",
+            "backup_file": final_backup_filename,
+        }
 
     except Exception as e:
-        current_app.logger.error(f"上传并恢复数据库失败: {str(e)}")
-        return jsonify({"success": False, "message": f"恢复失败: {str(e)}"}), 500
+        current_app.logger.error(f"恢复过程中发生错误: {str(e)}")
+        # 恢复失败，删除保存的备份文件
+        if os.path.exists(final_backup_path):
+            os.remove(final_backup_path)
+        raise
 
 
 # API端点：删除备份
@@ -600,6 +496,14 @@ def delete_backup(filename):
                 f"已同步删除对应的uploads备份文件: {uploads_backup_filename}"
             )
 
+        # 删除对应的上传文件快照，并清理不再被引用的文件对象
+        upload_store.delete_snapshot(os.path.splitext(filename)[0])
+        removed_objects, freed_bytes = upload_store.prune()
+        if removed_objects:
+            current_app.logger.info(
+                f"已清理{removed_objects}个不再被引用的上传文件对象，释放{freed_bytes}字节"
+            )
+
         current_app.logger.info(f"备份文件删除操作完成: {filename}")
         return jsonify({"success": True, "message": "备份文件删除成功"}), 200
     except Exception as e:
@@ -665,34 +569,43 @@ def download_log(filename):
 @system_bp.route("/log/view/<filename>", methods=["GET"])
 def view_log_content(filename):
     """
-    查看日志文件内容
+    分页查询日志文件中的记录（按记录偏移索引定位，不读取整个文件）
+
+    查询参数：
+    - tail: 返回最后N条记录（默认模式，默认200条）；before 为上一页的 prevOffset 时向前翻页
+    - offset: 从该字节偏移起向后分页（每页 limit 条），传入上次的 nextOffset 可轮询新日志
+    - level: 最低级别（DEBUG/INFO/WARNING/ERROR/CRITICAL）
+    - module: 模块名，多个用逗号分隔
+    - since / until: 时间范围（YYYY-MM-DD[ HH:MM[:SS]]）
     """
     try:
-        # 获取日志文件路径
-        log_path = os.path.join(LOG_FOLDER, filename)
+        # 获取日志文件路径（不允许访问日志目录以外的文件）
+        log_path = os.path.join(LOG_FOLDER, os.path.basename(filename))
 
         # 检查文件是否存在
-        if not os.path.exists(log_path):
+        if filename != os.path.basename(filename) or not os.path.isfile(log_path):
             return jsonify({"success": False, "message": "日志文件不存在"}), 404
 
-        # 读取日志文件内容，尝试多种编码方式
-        content = ""
-        encodings_to_try = ["utf-8", "gbk", "gb2312", "ansi"]
+        limit = min(max(request.args.get("limit", 200, type=int), 1), MAX_LOG_RECORDS)
+        offset = request.args.get("offset", type=int)
+        tail = request.args.get("tail", type=int)
+        if offset is None:
+            tail = min(max(tail or limit, 1), MAX_LOG_RECORDS)
 
-        for encoding in encodings_to_try:
-            try:
-                with open(log_path, "r", encoding=encoding, errors="ignore") as f:
-                    content = f.read()
-                    break  # 成功读取后跳出循环
-            except UnicodeDecodeError:
-                continue  # 尝试下一种编码
-
-        if not content:
-            # 如果所有编码都失败，使用二进制模式读取并转换为字符串
-            with open(log_path, "rb") as f:
-                content = f.read().decode("utf-8", errors="replace")
-
-        return jsonify({"success": True, "content": content, "filename": filename}), 200
+        try:
+            log_filter = _parse_log_filter(request.args)
+        except ValueError as e:
+            return jsonify({"success": False, "message": str(e)}), 400
+
+        result = query_log(
+            log_path,
+            offset=offset,
+            tail=tail if offset is None else None,
+            before=request.args.get("before", type=int),
+            limit=limit,
+            log_filter=log_filter,
+        )
+        return jsonify({"success": True, "filename": filename, **result}), 200
     except Exception as e:
         current_app.logger.error(f"查看日志文件内容失败: {str(e)}")
         return (
@@ -701,6 +614,24 @@ def view_log_content(filename):
         )
 
 
+def _parse_log_filter(args):
+    """
+    解析日志查询的过滤参数，参数无效时抛出ValueError
+    """
+    level = None
+    if args.get("level"):
+        level = logging.getLevelName(args["level"].strip().upper())
+        if not isinstance(level, int):
+            raise ValueError(f"无效的日志级别: {args['level']}")
+
+    modules = [
+        name.strip() for name in args.get("module", "").split(",") if name.strip()
+    ]
+    since = parse_log_time(args["since"]) if args.get("since") else None
+    until = parse_log_time(args["until"], end=True) if args.get("until") else None
+    return LogFilter(level=level, modules=modules, since=since, until=until)
+
+
 # API端点：清理缓存
 @system_bp.route("/cache/clear", methods=["POST"])
 def clear_cache():
@@ -724,3 +655,65 @@ def clear_cache():
     except Exception as e:
         current_app.logger.error(f"清理缓存失败: {str(e)}")
         return jsonify({"success": False, "message": f"清理缓存失败: {str(e)}"}), 500
+
+
+# API端点：验证码预生成池统计
+@system_bp.route("/captcha-pool", methods=["GET"])
+def get_captcha_pool_stats():
+    """
+    获取验证码预生成池的命中统计（当前工作进程）
+    """
+    return jsonify({"success": True, "stats": get_captcha_pool().stats()}), 200
+
+
+# 请求统计可用的排序字段
+REQUEST_METRICS_SORT_FIELDS = (
+    "totalMs",
+    "avgMs",
+    "maxMs",
+    "count",
+    "errors",
+    "avgQueries",
+    "maxQueries",
+)
+
+
+# API端点：请求耗时和SQL查询统计
+@system_bp.route("/request-metrics", methods=["GET"])
+def get_request_metrics():
+    """
+    获取各路由的请求耗时和SQL查询次数统计（当前工作进程）
+
+    查询参数 sort 指定排序字段（默认按总耗时 totalMs 降序）
+    """
+    sort = request.args.get("sort", "totalMs")
+    if sort not in REQUEST_METRICS_SORT_FIELDS:
+        return jsonify({"success": False, "message": f"不支持的排序字段: {sort}"}), 400
+    return jsonify({"success": True, **request_metrics.snapshot(sort)}), 200
+
+
+# API端点：清空请求统计
+@system_bp.route("/request-metrics", methods=["DELETE"])
+def reset_request_metrics():
+    """
+    清空请求统计（当前工作进程）
+    """
+    request_metrics.reset()
+    current_app.logger.info("管理员清空了请求统计")
+    return jsonify({"success": True, "message": "请求统计已清空"}), 200
+
+
+# API端点：Prometheus格式的运行指标
+@system_bp.route("/metrics", methods=["GET"])
+def get_metrics():
+    """
+    以Prometheus文本格式输出运行指标（当前工作进程），指标名称见 utils/metrics.py
+
+    配置了 METRICS_TOKEN 时需携带请求头 Authorization: Bearer <token>
+    """
+    token = current_app.config.get("METRICS_TOKEN")
+    if token:
+        authorization = request.headers.get("Authorization", "")
+        if not hmac.compare_digest(authorization.encode(), f"Bearer {token}".encode()):
+            return jsonify({"success": False, "message": "无效的指标采集令牌"}), 401
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
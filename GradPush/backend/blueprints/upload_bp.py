@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+断点续传蓝图
+
+该文件负责处理大文件分块上传的API端点，包括：
+- 创建上传会话
+- 查询已接收的字节数（中断后从该偏移继续上传）
+- 按偏移追加数据
+- 取消上传
+
+上传完成后，在创建/更新申请时通过 uploadIds 引用（见 application_bp）。
+"""
+
+import os
+from flask import Blueprint, request, jsonify, session, current_app
+from extensions import resumable_uploads
+from models import SystemSettings
+from utils.streaming_upload import UploadError, UploadPolicy
+
+# 创建蓝图实例
+upload_bp = Blueprint("upload", __name__, url_prefix="/api/uploads")
+
+
+def allowed_file_types(settings):
+    """
+    系统设置中允许上传的扩展名列表（供各蓝图共用）
+    """
+    return [ext.strip().lower() for ext in settings.allowed_file_types.split(",")]
+
+
+def application_upload_policy(settings):
+    """
+    申请附件的上传大小限制（供各蓝图共用）
+    """
+    return UploadPolicy(
+        max_file_size=settings.single_file_size_limit * 1024 * 1024,
+        max_total_size=settings.total_file_size_limit * 1024 * 1024,
+        file_message=(
+            "单个文件大小超过限制: {filename}，"
+            f"最大允许{settings.single_file_size_limit}MB"
+        ),
+        total_message=f"总文件大小超过限制，最大允许{settings.total_file_size_limit}MB",
+    )
+
+
+def _upload_response(meta, status=200):
+    response = jsonify(
+        {
+            "uploadId": meta["id"],
+            "filename": meta["filename"],
+            "size": meta["size"],
+            "offset": meta["offset"],
+            "complete": bool(meta["sha256"]),
+            "sha256": meta["sha256"],
+            "chunkSize": current_app.config["UPLOAD_CHUNK_SIZE"],
+        }
+    )
+    response.headers["Upload-Offset"] = str(meta["offset"])
+    return response, status
+
+
+def _upload_error(error):
+    body = {"message": error.message}
+    if error.offset is not None:
+        body["offset"] = error.offset
+    response = jsonify(body)
+    if error.offset is not None:
+        response.headers["Upload-Offset"] = str(error.offset)
+    return response, error.status
+
+
+# 创建上传会话
+@upload_bp.route("", methods=["POST"])
+def create_upload():
+    user_id = session.get("user_id")
+    if not user_id:
+        return jsonify({"message": "未登录或会话已过期"}), 401
+
+    data = request.get_json(silent=True) or {}
+    filename = os.path.basename(str(data.get("filename") or "").replace("\\", "/"))
+    size = data.get("size")
+    if not filename or not isinstance(size, int) or size <= 0:
+        return jsonify({"message": "缺少文件名或文件大小"}), 400
+
+    settings = SystemSettings.query.first()
+    if not settings:
+        return jsonify({"message": "系统设置未配置"}), 500
+    if os.path.splitext(filename)[1].lower() not in allowed_file_types(settings):
+        return (
+            jsonify(
+                {
+                    "message": f"文件类型不允许: {filename}，仅支持{settings.allowed_file_types}"
+                }
+            ),
+            400,
+        )
+    policy = application_upload_policy(settings)
+    if size > policy.max_file_size:
+        return jsonify({"message": policy.file_message.format(filename=filename)}), 413
+
+    meta = resumable_uploads.create(
+        filename,
+        size,
+        user_id,
+        content_type=data.get("type"),
+        sha256=data.get("sha256"),
+    )
+    current_app.logger.info(
+        "创建断点续传会话 %s: %s（%d字节）", meta["id"], filename, size
+    )
+    return _upload_response(meta, 201)
+
+
+# 查询已接收的字节数
+@upload_bp.route("/<upload_id>", methods=["GET"])
+def get_upload(upload_id):
+    try:
+        meta = resumable_uploads.load(upload_id, session.get("user_id"))
+    except UploadError as e:
+        return _upload_error(e)
+    return _upload_response(meta)
+
+
+# 从 Upload-Offset 处追加数据（请求体为文件内容的一段）
+@upload_bp.route("/<upload_id>", methods=["PATCH"])
+def append_upload(upload_id):
+    offset = request.headers.get("Upload-Offset", type=int)
+    if offset is None or offset < 0:
+        return jsonify({"message": "缺少请求头 Upload-Offset"}), 400
+
+    try:
+        meta = resumable_uploads.append(
+            upload_id, session.get("user_id"), offset, request.stream
+        )
+    except UploadError as e:
+        return _upload_error(e)
+    return _upload_response(meta)
+
+
+# 取消上传
+@upload_bp.route("/<upload_id>", methods=["DELETE"])
+def delete_upload(upload_id):
+    try:
+        resumable_uploads.delete(upload_id, session.get("user_id"))
+    except UploadError as e:
+        return _upload_error(e)
+    return jsonify({"message": "上传已取消"}), 200
@@ -19,16 +19,21 @@ import uuid
 from PIL import Image
 from io import BytesIO
 from werkzeug.utils import secure_filename
-from extensions import db
-import openpyxl
+from extensions import db, job_runner
+from utils.ranking_engine import (
+    rebuild_major_ranking,
+    update_student_ranking,
+    remove_student_ranking,
+)
+from utils.blob_store import release_application_files
 from openpyxl.utils import get_column_letter
 
-# 导入组织信息管理模块，用于获取学院、系、专业信息
-from blueprints.organization_bp import (
-    get_all_faculties,
-    get_all_departments,
-    get_all_majors,
-)
+# 组织架构缓存，用于获取学院、系、专业名称
+from utils.org_cache import get_org_snapshot
+from utils.password_hasher import PasswordHasherBusy
+from utils.user_importer import import_users_from_excel
+from utils.job_runner import JobConflict
+from blueprints.job_bp import job_accepted, job_conflict
 
 # 创建蓝图实例
 user_bp = Blueprint("user", __name__, url_prefix="/api")
@@ -96,15 +101,11 @@ def _get_organization_info(user):
     Returns:
         包含学院、系和专业名称的字典
     """
-    # 预加载所有组织信息，避免重复查询
-    all_faculties = {f["id"]: f["name"] for f in get_all_faculties()}
-    all_departments = {d["id"]: d["name"] for d in get_all_departments()}
-    all_majors = {m["id"]: m["name"] for m in get_all_majors()}
-
-    # 安全获取学院、系和专业名称
-    faculty_name = all_faculties.get(user.faculty_id, "")
-    department_name = all_departments.get(user.department_id, "")
-    major_name = all_majors.get(user.major_id, "")
+    # 从组织架构缓存中获取学院、系和专业名称
+    org = get_org_snapshot()
+    faculty_name = org.faculty_name(user.faculty_id)
+    department_name = org.department_name(user.department_id)
+    major_name = org.major_name(user.major_id)
 
     return {
         "faculty_name": faculty_name,
@@ -159,9 +160,15 @@ def get_all_users():
     page = request.args.get("page", 1, type=int)
     per_page = request.args.get("per_page", 10, type=int)
 
-    # 调试日志
-    print(
-        f"筛选参数: role={role}, status={status}, faculty={faculty}, department={department}, major={major}, search={search}"
+    # 调试日志（未开启DEBUG级别时不格式化参数）
+    current_app.logger.debug(
+        "筛选参数: role=%s, status=%s, faculty=%s, department=%s, major=%s, search=%s",
+        role,
+        status,
+        faculty,
+        department,
+        major,
+        search,
     )
 
     # 构建查询
@@ -223,16 +230,13 @@ def get_all_users():
 
     # 获取所有用户列表
     user_list = []
-    # 一次性获取所有组织信息，避免循环中的重复查询
-    all_faculties = {f["id"]: f["name"] for f in get_all_faculties()}
-    all_departments = {d["id"]: d["name"] for d in get_all_departments()}
-    all_majors = {m["id"]: m["name"] for m in get_all_majors()}
+    # 从组织架构缓存中获取组织信息，避免循环中的重复查询
+    org = get_org_snapshot()
 
     for user in users:
-        # 从预加载的数据中获取组织信息
-        faculty_name = all_faculties.get(user.faculty_id, "")
-        department_name = all_departments.get(user.department_id, "")
-        major_name = all_majors.get(user.major_id, "")
+        faculty_name = org.faculty_name(user.faculty_id)
+        department_name = org.department_name(user.department_id)
+        major_name = org.major_name(user.major_id)
 
         user_data = {
             "id": user.id,
@@ -290,22 +294,13 @@ def delete_user(user_id):
         applications = Application.query.filter_by(
             student_id=user.student.student_id
         ).all()
-        # 先删除每个申请关联的文件
+        # 先释放每个申请的附件引用，不再被引用的文件在提交后删除
         for application in applications:
-            if application.files:
-                for file in application.files:
-                    try:
-                        if "path" in file and file["path"]:
-                            filename = os.path.basename(file["path"])
-                            file_path = os.path.join(
-                                current_app.config["FILE_FOLDER"], filename
-                            )
-                            if os.path.exists(file_path):
-                                os.remove(file_path)
-                    except Exception as e:
-                        print(f"删除文件失败: {str(e)}")
+            release_application_files(application.files)
         # 删除该学生的所有申请数据
         Application.query.filter_by(student_id=user.student.student_id).delete()
+        # 从专业排名表中移除该学生
+        remove_student_ranking(user.student.student_id)
         # 删除Student记录
         db.session.delete(user.student)
 
@@ -435,6 +430,8 @@ def create_user():
                 )
                 db.session.add(new_student)
                 db.session.flush()  # 确保学生记录已创建
+                # 新学生加入专业排名
+                update_student_ranking(new_student)
             student_id = data[
                 "username"
             ]  # 使用username作为student_id，与注册接口保持一致
@@ -464,6 +461,10 @@ def create_user():
         db.session.commit()
 
         return jsonify({"message": "用户创建成功"}), 200
+    except PasswordHasherBusy:
+        # 由应用统一返回503
+        db.session.rollback()
+        raise
     except Exception as e:
         db.session.rollback()
         return jsonify({"message": f"用户创建失败: {str(e)}"}), 500
@@ -535,11 +536,10 @@ def update_profile():
     db.session.commit()
 
     # 获取学院、系和专业名称
-    faculty_name = Faculty.query.get(user.faculty_id).name if user.faculty_id else ""
-    department_name = (
-        Department.query.get(user.department_id).name if user.department_id else ""
-    )
-    major_name = Major.query.get(user.major_id).name if user.major_id else ""
+    org_info = _get_organization_info(user)
+    faculty_name = org_info["faculty_name"]
+    department_name = org_info["department_name"]
+    major_name = org_info["major_name"]
 
     # 返回更新后的用户信息
     user_data = {
@@ -588,13 +588,10 @@ def reset_avatar():
         db.session.commit()
 
         # 获取学院、系和专业名称
-        faculty_name = (
-            Faculty.query.get(user.faculty_id).name if user.faculty_id else ""
-        )
-        department_name = (
-            Department.query.get(user.department_id).name if user.department_id else ""
-        )
-        major_name = Major.query.get(user.major_id).name if user.major_id else ""
+        org_info = _get_organization_info(user)
+        faculty_name = org_info["faculty_name"]
+        department_name = org_info["department_name"]
+        major_name = org_info["major_name"]
 
         # 返回更新后的用户信息
         user_data = {
@@ -717,13 +714,10 @@ def upload_avatar():
         db.session.commit()
 
         # 获取学院、系和专业名称
-        faculty_name = (
-            Faculty.query.get(user.faculty_id).name if user.faculty_id else ""
-        )
-        department_name = (
-            Department.query.get(user.department_id).name if user.department_id else ""
-        )
-        major_name = Major.query.get(user.major_id).name if user.major_id else ""
+        org_info = _get_organization_info(user)
+        faculty_name = org_info["faculty_name"]
+        department_name = org_info["department_name"]
+        major_name = org_info["major_name"]
 
         # 返回更新后的用户信息
         user_data = {
@@ -810,384 +804,52 @@ def import_users():
         return jsonify({"message": "只支持Excel文件(.xlsx, .xls)"}), 400
 
     try:
-        # 读取Excel文件
-        workbook = openpyxl.load_workbook(file, data_only=True)
-        worksheet = workbook.active
-
-        # 定义必填字段和可选字段
-        required_headers = ["用户名", "姓名", "角色", "状态"]
-        optional_headers = [
-            "学院",
-            "系",
-            "专业",
-            "邮箱",
-            "电话",
-            "性别",
-            "CET4成绩",
-            "CET6成绩",
-            "绩点",
-            "转换分数",
-        ]
-
-        # 读取表头并创建映射
-        header_to_column = {}
-        max_column = worksheet.max_column
-
-        for col in range(1, max_column + 1):
-            header = worksheet.cell(row=1, column=col).value
-            if header:
-                header_to_column[header.strip()] = col
-
-        # 验证必填字段是否存在
-        missing_headers = []
-        for header in required_headers:
-            if header not in header_to_column:
-                missing_headers.append(header)
-
-        if missing_headers:
-            return (
-                jsonify({"message": f"缺少必填表头：{','.join(missing_headers)}"}),
-                400,
+        # 保存上传文件后在后台任务中导入，立即返回任务ID
+        file_path = job_runner.stage_upload(file)
+        try:
+            # 同一时间只允许一个导入任务（重复提交时两个任务预加载的用户名相同，
+            # 批量写入会因唯一约束失败）
+            job = job_runner.submit(
+                "import-users",
+                _run_import_users,
+                file_path,
+                description=f"导入用户：{file.filename}",
+                created_by=session.get("username"),
+                unique=True,
             )
+        except JobConflict:
+            os.remove(file_path)
+            raise
+        return job_accepted(job, "用户导入任务已提交")
 
-        # 导入用户数据
-        success_count = 0
-        error_count = 0
-        errors = []
-
-        for row in range(2, worksheet.max_row + 1):
-            try:
-                # 根据表头映射获取用户数据
-                username = worksheet.cell(
-                    row=row, column=header_to_column["用户名"]
-                ).value
-                name = worksheet.cell(row=row, column=header_to_column["姓名"]).value
-                role = worksheet.cell(row=row, column=header_to_column["角色"]).value
-                status = worksheet.cell(row=row, column=header_to_column["状态"]).value
-
-                # 可选字段
-                faculty_name = (
-                    worksheet.cell(row=row, column=header_to_column.get("学院")).value
-                    if "学院" in header_to_column
-                    else None
-                )
-                department_name = (
-                    worksheet.cell(row=row, column=header_to_column.get("系")).value
-                    if "系" in header_to_column
-                    else None
-                )
-                major_name = (
-                    worksheet.cell(row=row, column=header_to_column.get("专业")).value
-                    if "专业" in header_to_column
-                    else None
-                )
-                email = (
-                    worksheet.cell(row=row, column=header_to_column.get("邮箱")).value
-                    if "邮箱" in header_to_column
-                    else None
-                )
-                phone = (
-                    worksheet.cell(row=row, column=header_to_column.get("电话")).value
-                    if "电话" in header_to_column
-                    else None
-                )
-                gender = (
-                    worksheet.cell(row=row, column=header_to_column.get("性别")).value
-                    if "性别" in header_to_column
-                    else None
-                )
+    except JobConflict as e:
+        return job_conflict(e)
+    except Exception as e:
+        return jsonify({"message": f"导入失败：{str(e)}"}), 500
 
-                # CET4成绩转换为整数
-                cet4_score = (
-                    worksheet.cell(
-                        row=row, column=header_to_column.get("CET4成绩")
-                    ).value
-                    if "CET4成绩" in header_to_column
-                    else None
-                )
-                if cet4_score is not None and cet4_score != "":
-                    try:
-                        cet4_score = int(cet4_score)
-                    except ValueError:
-                        cet4_score = None
-                else:
-                    cet4_score = None
-
-                # CET6成绩转换为整数
-                cet6_score = (
-                    worksheet.cell(
-                        row=row, column=header_to_column.get("CET6成绩")
-                    ).value
-                    if "CET6成绩" in header_to_column
-                    else None
-                )
-                if cet6_score is not None and cet6_score != "":
-                    try:
-                        cet6_score = int(cet6_score)
-                    except ValueError:
-                        cet6_score = None
-                else:
-                    cet6_score = None
-
-                # 绩点转换为浮点数
-                gpa = (
-                    worksheet.cell(row=row, column=header_to_column.get("绩点")).value
-                    if "绩点" in header_to_column
-                    else None
-                )
-                if gpa is not None and gpa != "":
-                    try:
-                        gpa = float(gpa)
-                    except ValueError:
-                        gpa = None
-                else:
-                    gpa = None
-
-                # 转换分数转换为浮点数
-                academic_score = (
-                    worksheet.cell(
-                        row=row, column=header_to_column.get("转换分数")
-                    ).value
-                    if "转换分数" in header_to_column
-                    else None
-                )
-                if academic_score is not None and academic_score != "":
-                    try:
-                        academic_score = float(academic_score)
-                    except ValueError:
-                        academic_score = None
-                else:
-                    academic_score = None
-
-                # 验证必填字段
-                if not username or not name or not role or not status:
-                    error_count += 1
-                    errors.append(f"第{row}行：用户名、姓名、角色和状态为必填字段")
-                    continue
-
-                # 检查用户名是否已存在
-                existing_user = User.query.filter_by(username=username).first()
-                if existing_user:
-                    # 获取或创建学院、系、专业ID（如果提供了名称）
-                    update_faculty_id = None
-                    update_department_id = None
-                    update_major_id = None
-
-                    # 处理学院ID
-                    if faculty_name:
-                        faculty = Faculty.query.filter_by(name=faculty_name).first()
-                        if not faculty:
-                            error_count += 1
-                            errors.append(f"第{row}行：学院 '{faculty_name}' 不存在")
-                            continue
-                        update_faculty_id = faculty.id
-                    elif faculty_name == "":
-                        # 如果明确为空字符串，则清空该字段
-                        update_faculty_id = None
-                    else:
-                        # 保留原有值
-                        update_faculty_id = existing_user.faculty_id
-
-                    # 处理系ID
-                    if department_name:
-                        department = Department.query.filter_by(
-                            name=department_name
-                        ).first()
-                        if not department:
-                            error_count += 1
-                            errors.append(f"第{row}行：系 '{department_name}' 不存在")
-                            continue
-                        update_department_id = department.id
-                    elif department_name == "":
-                        # 如果明确为空字符串，则清空该字段
-                        update_department_id = None
-                    else:
-                        # 保留原有值
-                        update_department_id = existing_user.department_id
-
-                    # 处理专业ID
-                    if major_name:
-                        major = Major.query.filter_by(name=major_name).first()
-                        if not major:
-                            error_count += 1
-                            errors.append(f"第{row}行：专业 '{major_name}' 不存在")
-                            continue
-                        update_major_id = major.id
-                    elif major_name == "":
-                        # 如果明确为空字符串，则清空该字段
-                        update_major_id = None
-                    else:
-                        # 保留原有值
-                        update_major_id = existing_user.major_id
-
-                    # 更新用户基本信息（适用于所有角色）
-                    existing_user.name = name
-                    existing_user.faculty_id = update_faculty_id
-                    existing_user.department_id = update_department_id
-                    existing_user.major_id = update_major_id
-                    existing_user.email = email or ""
-                    existing_user.phone = phone or ""
-
-                    # 将enabled转换为active以与数据库模型保持一致
-                    if status == "enabled":
-                        status = "active"
-                    existing_user.status = status
-
-                    # 如果是学生用户，还需要更新学生特定信息
-                    if existing_user.role == "student":
-                        # 获取或创建学生记录
-                        existing_student = Student.query.filter_by(
-                            student_id=username
-                        ).first()
-                        if existing_student:
-                            # 更新学生信息
-                            existing_student.gender = gender
-                            existing_student.cet4_score = cet4_score
-                            existing_student.cet6_score = cet6_score
-                            existing_student.gpa = gpa
-                            existing_student.academic_score = academic_score
-                        else:
-                            # 如果学生记录不存在，创建新的学生记录
-                            new_student = Student(
-                                student_id=username,
-                                student_name=name,
-                                faculty_id=update_faculty_id,
-                                department_id=update_department_id,
-                                major_id=update_major_id,
-                                gender=gender,
-                                cet4_score=cet4_score,
-                                cet6_score=cet6_score,
-                                gpa=gpa,
-                                academic_score=academic_score,
-                            )
-                            db.session.add(new_student)
-                            existing_user.student_id = username
-
-                    success_count += 1
-                    continue
-
-                # 验证角色
-                valid_roles = ["admin", "teacher", "student"]
-                if role not in valid_roles:
-                    error_count += 1
-                    errors.append(
-                        f"第{row}行：角色 '{role}' 无效，应为 admin/teacher/student"
-                    )
-                    continue
-
-                # 验证状态并统一转换为数据库使用的值
-                valid_statuses = ["enabled", "disabled", "active"]
-                if status not in valid_statuses:
-                    error_count += 1
-                    errors.append(
-                        f"第{row}行：状态 '{status}' 无效，应为 enabled/disabled/active"
-                    )
-                    continue
-
-                # 将enabled转换为active以与数据库模型保持一致
-                if status == "enabled":
-                    status = "active"
-
-                # 获取学院ID
-                faculty_id = None
-                if faculty_name:
-                    faculty = Faculty.query.filter_by(name=faculty_name).first()
-                    if not faculty:
-                        error_count += 1
-                        errors.append(f"第{row}行：学院 '{faculty_name}' 不存在")
-                        continue
-                    faculty_id = faculty.id
-
-                # 获取系ID
-                department_id = None
-                if department_name:
-                    department = Department.query.filter_by(
-                        name=department_name
-                    ).first()
-                    if not department:
-                        error_count += 1
-                        errors.append(f"第{row}行：系 '{department_name}' 不存在")
-                        continue
-                    department_id = department.id
-
-                # 获取专业ID
-                major_id = None
-                if major_name:
-                    major = Major.query.filter_by(name=major_name).first()
-                    if not major:
-                        error_count += 1
-                        errors.append(f"第{row}行：专业 '{major_name}' 不存在")
-                        continue
-                    major_id = major.id
-
-                # 学生角色验证
-                if role == "student":
-                    if not faculty_id or not department_id or not major_id:
-                        error_count += 1
-                        errors.append(f"第{row}行：学生用户必须填写学院、系和专业")
-                        continue
-
-                # 创建用户
-                new_user = User(
-                    username=username,
-                    name=name,
-                    role=role,
-                    faculty_id=faculty_id,
-                    department_id=department_id,
-                    major_id=major_id,
-                    email=email or "",
-                    phone=phone or "",
-                    status=status,
-                )
 
-                # 设置默认密码
-                new_user.set_password("123456")
-
-                # 学生角色需要创建学生记录
-                if role == "student":
-                    # 检查是否已存在对应的Student记录
-                    existing_student = Student.query.filter_by(
-                        student_id=username
-                    ).first()
-                    if not existing_student:
-                        new_student = Student(
-                            student_id=username,
-                            student_name=name,
-                            faculty_id=faculty_id,
-                            department_id=department_id,
-                            major_id=major_id,
-                            gender=gender,
-                            cet4_score=cet4_score,
-                            cet6_score=cet6_score,
-                            gpa=gpa,
-                            academic_score=academic_score,
-                        )
-                        db.session.add(new_student)
-                        new_user.student_id = username
-
-                # 添加用户到数据库
-                db.session.add(new_user)
-                success_count += 1
-
-            except Exception as e:
-                error_count += 1
-                errors.append(f"第{row}行：导入失败 - {str(e)}")
+def _run_import_users(job, file_path):
+    """
+    后台任务：从已保存的Excel文件导入用户
+    """
+    try:
+        # 流式读取Excel文件并分批写入用户和学生记录
+        report = import_users_from_excel(
+            file_path,
+            progress=lambda current, total: job.progress(current, total, "导入用户"),
+        )
+
+        # 批量导入可能改变多个专业的人数和成绩，整体重建专业排名表
+        db.session.flush()
+        rebuild_major_ranking()
 
         # 提交事务
         db.session.commit()
 
-        return (
-            jsonify(
-                {
-                    "message": "用户导入完成",
-                    "success_count": success_count,
-                    "error_count": error_count,
-                    "errors": errors,
-                }
-            ),
-            200,
-        )
+        return {"message": "用户导入完成", **report}
 
-    except Exception as e:
+    except Exception:
         db.session.rollback()
-        return jsonify({"message": f"导入失败：{str(e)}"}), 500
+        raise
+    finally:
+        os.remove(file_path)
@@ -8,9 +8,29 @@
 
 from flask_sqlalchemy import SQLAlchemy
 from flask_session import Session
+from utils.job_runner import JobRunner
+from utils.password_hasher import PasswordHasher
+from utils.request_metrics import RequestMetrics
+from utils.streaming_upload import ResumableUploadStore
+from utils.thumbnail_cache import ThumbnailCache
 
 # 创建数据库对象，供其他模块导入
 db = SQLAlchemy()
 
 # 创建session对象，用于存储验证码等临时数据
 session = Session()
+
+# 创建后台任务执行器，用于导入、备份、恢复等耗时操作
+job_runner = JobRunner()
+
+# 创建密码哈希服务，在有上限的线程池中计算bcrypt哈希
+password_hasher = PasswordHasher()
+
+# 创建请求统计，记录各路由的耗时和SQL查询次数
+request_metrics = RequestMetrics()
+
+# 创建断点续传会话存储，用于大文件分块上传
+resumable_uploads = ResumableUploadStore()
+
+# 创建缩略图缓存，审核页面预览证明材料时加载缩小后的图片
+thumbnails = ThumbnailCache()
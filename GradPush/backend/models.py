@@ -14,11 +14,11 @@
 - Faculty: 学院信息模型，存储学院信息
 - Department: 系信息模型，存储系信息
 - Major: 专业信息模型，存储专业信息
+- FileBlob: 申请附件的内容寻址存储，记录每个文件被引用的次数
 """
 
-from extensions import db
+from extensions import db, password_hasher
 from datetime import datetime
-import bcrypt
 from sqlalchemy import event
 import pytz
 
@@ -134,13 +134,11 @@ class User(db.Model):
 
     # 设置密码（哈希）
     def set_password(self, password):
-        self.password = bcrypt.hashpw(
-            password.encode("utf-8"), bcrypt.gensalt()
-        ).decode("utf-8")
+        self.password = password_hasher.hash(password)
 
     # 验证密码
     def check_password(self, password):
-        return bcrypt.checkpw(password.encode("utf-8"), self.password.encode("utf-8"))
+        return password_hasher.verify(password, self.password)
 
 
 # 申请模型
@@ -191,6 +189,11 @@ class Application(db.Model):
         db.DateTime, default=get_current_time, onupdate=get_current_time
     )
 
+    __table_args__ = (
+        # 申请列表按 (applied_at, id) 键集分页
+        db.Index("ix_application_applied_at_id", "applied_at", "id"),
+    )
+
     def __repr__(self):
         return f"<Application {self.id}>"
 
@@ -230,6 +233,10 @@ class Student(db.Model):
     # 综合表现加分（占总分8%）
     comprehensive_performance_total = db.Column(db.Float, nullable=True)  # 学院核定总分
 
+    # 已通过申请分数之和（未应用满分限制，随申请状态变化增量维护）
+    academic_specialty_raw = db.Column(db.Float, nullable=True)  # 学术专长分数之和
+    comprehensive_performance_raw = db.Column(db.Float, nullable=True)  # 综合表现分数之和
+
     # 总分与排名
     comprehensive_score = db.Column(db.Float, nullable=True)  # 综合成绩
     major_ranking = db.Column(db.Integer, nullable=True)  # 专业成绩排名
@@ -272,6 +279,35 @@ def call_before_save_student(mapper, connection, target):
         target.before_save()
 
 
+# 专业排名模型（物化排名表，随学生综合成绩变化增量维护）
+class StudentRanking(db.Model):
+    __tablename__ = "student_ranking"
+    major_id = db.Column(
+        db.Integer, db.ForeignKey("major.id", ondelete="CASCADE"), primary_key=True
+    )  # 专业ID
+    student_id = db.Column(
+        db.String(20),
+        db.ForeignKey("student.student_id", ondelete="CASCADE"),
+        primary_key=True,
+    )  # 学号
+    score = db.Column(db.Float, nullable=False, default=0.0)  # 参与排名的综合成绩
+    ranking = db.Column(db.Integer, nullable=False)  # 专业内排名（并列取相同名次）
+    total_students = db.Column(db.Integer, nullable=False)  # 专业内排名人数
+    updated_at = db.Column(
+        db.DateTime, default=get_current_time, onupdate=get_current_time
+    )
+
+    __table_args__ = (
+        # 学生仪表盘按学号直接读取一行
+        db.Index("ix_student_ranking_student_id", "student_id", unique=True),
+        # 增量调整名次时按专业内成绩区间更新
+        db.Index("ix_student_ranking_major_score", "major_id", "score"),
+    )
+
+    def __repr__(self):
+        return f"<StudentRanking {self.student_id} #{self.ranking}/{self.total_students}>"
+
+
 # 加分规则模型
 class Rule(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -423,6 +459,9 @@ class GraduateFile(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(255), nullable=False)  # 文件名
     filepath = db.Column(db.String(255), nullable=False)  # 文件路径
+    stored_name = db.Column(
+        db.String(255), nullable=False, unique=True, index=True
+    )  # 文件系统中的文件名（下载链接 /uploads/graduate-files/<stored_name>）
     file_size = db.Column(db.Integer, nullable=False)  # 文件大小（字节）
     file_type = db.Column(db.String(100), nullable=False)  # 文件类型
     upload_time = db.Column(db.DateTime, default=get_current_time)  # 上传时间
@@ -447,3 +486,21 @@ class GraduateFile(db.Model):
 
     def __repr__(self):
         return f"<GraduateFile {self.filename}>"
+
+
+# 申请附件的内容寻址存储（相同内容只保存一份，见 utils/blob_store.py）
+class FileBlob(db.Model):
+    __tablename__ = "file_blob"
+    id = db.Column(db.Integer, primary_key=True)
+    stored_name = db.Column(
+        db.String(255), nullable=False, unique=True, index=True
+    )  # FILE_FOLDER中的文件名：<sha256><扩展名>
+    sha256 = db.Column(db.String(64), nullable=False, index=True)  # 文件内容的sha256
+    size = db.Column(db.BigInteger, nullable=False)  # 文件大小（字节）
+    ref_count = db.Column(
+        db.Integer, nullable=False, default=0
+    )  # 引用该文件的申请附件条目数，减为0时删除文件
+    created_at = db.Column(db.DateTime, default=get_current_time)
+
+    def __repr__(self):
+        return f"<FileBlob {self.stored_name} refs={self.ref_count}>"
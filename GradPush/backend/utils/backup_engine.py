@@ -0,0 +1,621 @@
+# -*- coding: utf-8 -*-
+"""
+数据库备份引擎
+
+流式备份PostgreSQL数据库和uploads目录，内存占用与数据量无关：
+- 表数据使用 COPY ... TO STDOUT 逐块写出，不在内存中构造INSERT语句
+- 多个连接并行导出各表，通过导出的快照（pg_export_snapshot）保证各表数据一致
+- 各表数据由导出线程并行gzip压缩，再以不压缩方式存入ZIP
+- 上传文件默认增量备份到内容寻址存储（utils/upload_store.py），备份文件中只保存快照清单；
+  完整备份时已压缩格式的文件（PDF、图片、压缩包等）以不压缩方式存入ZIP，其他文件使用deflate压缩
+
+备份文件格式（ZIP，格式版本2）：
+- manifest.json                 备份信息（格式版本、创建时间、各表行数和大小、上传文件统计）
+- database/pre-data.sql         序列和表结构
+- database/data/<表名>.copy.gz  表数据（COPY文本格式，gzip压缩）
+- database/post-data.sql        主键、唯一约束、索引、外键、检查约束和序列当前值
+- uploads-manifest.json         上传文件快照清单（增量备份）
+- uploads/...                   上传文件（完整备份）
+
+旧格式（单个SQL文件 + uploads.zip）的备份仍由 db_backup.restore_database_python 恢复。
+"""
+
+import gzip
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_REPEATABLE_READ
+from utils.upload_store import UploadStoreError, walk_files
+
+FORMAT_VERSION = 2
+
+MANIFEST_NAME = "manifest.json"
+PRE_DATA_NAME = "database/pre-data.sql"
+POST_DATA_NAME = "database/post-data.sql"
+DATA_PREFIX = "database/data/"
+UPLOADS_PREFIX = "uploads/"
+UPLOADS_MANIFEST_NAME = "uploads-manifest.json"
+
+# 已压缩的文件格式，存入ZIP时不再压缩
+COMPRESSED_EXTENSIONS = {
+    ".pdf",
+    ".jpg",
+    ".jpeg",
+    ".png",
+    ".gif",
+    ".webp",
+    ".zip",
+    ".rar",
+    ".7z",
+    ".gz",
+    ".bz2",
+    ".xz",
+    ".docx",
+    ".xlsx",
+    ".pptx",
+    ".mp3",
+    ".mp4",
+    ".mov",
+}
+
+# 恢复时 COPY FROM STDIN 每次读取的字节数
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# 恢复事务中的批量导入设置：加大重建索引的内存，提交时不等待WAL落盘
+BULK_LOAD_SETTINGS = (
+    "SET LOCAL maintenance_work_mem = '256MB'; SET LOCAL synchronous_commit = off;"
+)
+
+
+def database_dsn(uri):
+    """
+    将SQLAlchemy连接字符串转换为psycopg2可用的连接字符串
+    """
+    return re.sub(r"^postgresql\+\w+://", "postgresql://", uri)
+
+
+def quote_ident(name):
+    """
+    为标识符加双引号（处理user等保留关键字）
+    """
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _qualified(name):
+    return "public." + quote_ident(name)
+
+
+class ByteProgress:
+    """
+    按已处理字节数报告恢复进度（每处理 PROGRESS_STEP 字节报告一次）
+    """
+
+    PROGRESS_STEP = 1024 * 1024
+
+    def __init__(self, total, progress=None):
+        self.total = total
+        self.done = 0
+        self.progress = progress
+        self._reported = 0
+
+    def advance(self, size):
+        self.done += size
+        if self.progress and (
+            self.done - self._reported >= self.PROGRESS_STEP or self.done >= self.total
+        ):
+            self._reported = self.done
+            self.progress(
+                min(self.done, self.total),
+                self.total,
+                f"已处理 {self.done / 1048576:.1f} MB / {self.total / 1048576:.1f} MB",
+            )
+
+
+class _ProgressReader:
+    """
+    读取时统计字节数的文件包装
+    """
+
+    def __init__(self, fileobj, tracker):
+        self.fileobj = fileobj
+        self.tracker = tracker
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self.tracker.advance(len(data))
+        return data
+
+
+class _CountingWriter:
+    """
+    统计写入字节数的文件包装（COPY TO STDOUT 的输出目标）
+    """
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.bytes = 0
+
+    def write(self, data):
+        self.bytes += len(data)
+        return self.fileobj.write(data)
+
+
+def _read_sequences(cursor):
+    """
+    读取序列定义、所属列和当前值
+    """
+    cursor.execute("""
+        SELECT c.relname, format_type(s.seqtypid, NULL), s.seqstart,
+               s.seqincrement, s.seqmin, s.seqmax, s.seqcache, s.seqcycle,
+               owner.relname, a.attname, d.deptype
+        FROM pg_class c
+        JOIN pg_sequence s ON s.seqrelid = c.oid
+        LEFT JOIN pg_depend d
+               ON d.objid = c.oid AND d.classid = 'pg_class'::regclass
+              AND d.deptype IN ('a', 'i')
+        LEFT JOIN pg_class owner ON owner.oid = d.refobjid
+        LEFT JOIN pg_attribute a
+               ON a.attrelid = d.refobjid AND a.attnum = d.refobjsubid
+        WHERE c.relnamespace = 'public'::regnamespace
+        ORDER BY c.relname
+        """)
+    sequences = cursor.fetchall()
+
+    values = {}
+    for row in sequences:
+        cursor.execute(f"SELECT last_value, is_called FROM {_qualified(row[0])}")
+        values[row[0]] = cursor.fetchone()
+    return sequences, values
+
+
+def _read_tables(cursor):
+    """
+    读取表和列定义，返回 [(表名, [列定义SQL])]
+    """
+    cursor.execute("""
+        SELECT c.relname, a.attname, format_type(a.atttypid, a.atttypmod),
+               pg_get_expr(d.adbin, d.adrelid), a.attnotnull, a.attidentity
+        FROM pg_class c
+        JOIN pg_attribute a ON a.attrelid = c.oid
+        LEFT JOIN pg_attrdef d ON d.adrelid = a.attrelid AND d.adnum = a.attnum
+        WHERE c.relnamespace = 'public'::regnamespace AND c.relkind = 'r'
+          AND a.attnum > 0 AND NOT a.attisdropped
+        ORDER BY c.relname, a.attnum
+        """)
+    tables = {}
+    for table, column, data_type, default, not_null, identity in cursor.fetchall():
+        definition = f"    {quote_ident(column)} {data_type}"
+        if identity:
+            kind = "ALWAYS" if identity == "a" else "BY DEFAULT"
+            definition += f" GENERATED {kind} AS IDENTITY"
+        elif default is not None:
+            definition += f" DEFAULT {default}"
+        if not_null:
+            definition += " NOT NULL"
+        tables.setdefault(table, []).append(definition)
+    return list(tables.items())
+
+
+def _read_post_data(cursor):
+    """
+    读取约束和索引定义（数据导入后再创建）
+    """
+    cursor.execute("""
+        SELECT t.relname, c.conname, pg_get_constraintdef(c.oid), c.contype
+        FROM pg_constraint c
+        JOIN pg_class t ON t.oid = c.conrelid
+        WHERE t.relnamespace = 'public'::regnamespace
+          AND c.contype IN ('p', 'u', 'x', 'c', 'f')
+        ORDER BY t.relname, c.conname
+        """)
+    constraints = cursor.fetchall()
+
+    # 约束自带的索引随约束创建，这里只取独立的索引
+    cursor.execute("""
+        SELECT pg_get_indexdef(i.indexrelid)
+        FROM pg_index i
+        JOIN pg_class t ON t.oid = i.indrelid
+        JOIN pg_class ic ON ic.oid = i.indexrelid
+        WHERE t.relnamespace = 'public'::regnamespace
+          AND NOT EXISTS (
+              SELECT 1 FROM pg_constraint c
+              WHERE c.conindid = i.indexrelid AND c.contype IN ('p', 'u', 'x')
+          )
+        ORDER BY ic.relname
+        """)
+    indexes = [row[0] for row in cursor.fetchall()]
+    return constraints, indexes
+
+
+def _build_schema(cursor):
+    """
+    生成 (表名列表, pre-data SQL, post-data SQL)
+    """
+    sequences, sequence_values = _read_sequences(cursor)
+    tables = _read_tables(cursor)
+    constraints, indexes = _read_post_data(cursor)
+
+    pre_data = []
+    for name, data_type, start, increment, minimum, maximum, cache, cycle, *_ in [
+        row for row in sequences if row[10] != "i"
+    ]:
+        # 标识列的序列随表创建
+        pre_data.append(
+            f"CREATE SEQUENCE {_qualified(name)} AS {data_type}"
+            f" INCREMENT BY {increment} MINVALUE {minimum} MAXVALUE {maximum}"
+            f" START WITH {start} CACHE {cache}{' CYCLE' if cycle else ''};"
+        )
+    for table, columns in tables:
+        pre_data.append(
+            f"CREATE TABLE {_qualified(table)} (\n" + ",\n".join(columns) + "\n);"
+        )
+    for name, *_, owner, column, deptype in sequences:
+        if deptype == "a":
+            pre_data.append(
+                f"ALTER SEQUENCE {_qualified(name)} OWNED BY "
+                f"{_qualified(owner)}.{quote_ident(column)};"
+            )
+
+    # 主键和唯一约束先于外键创建
+    order = {"p": 0, "u": 1, "x": 2}
+    post_data = [
+        f"ALTER TABLE ONLY {_qualified(table)} "
+        f"ADD CONSTRAINT {quote_ident(name)} {definition};"
+        for table, name, definition, contype in sorted(
+            (c for c in constraints if c[3] in order), key=lambda c: order[c[3]]
+        )
+    ]
+    post_data.extend(f"{definition};" for definition in indexes)
+    post_data.extend(
+        f"ALTER TABLE ONLY {_qualified(table)} "
+        f"ADD CONSTRAINT {quote_ident(name)} {definition};"
+        for table, name, definition, contype in constraints
+        if contype not in order
+    )
+    for name, *_, owner, column, deptype in sequences:
+        last_value, is_called = sequence_values[name]
+        if deptype == "i":
+            target = (
+                f"pg_get_serial_sequence('{_qualified(owner)}', "
+                f"'{column.replace(chr(39), chr(39) * 2)}')"
+            )
+        else:
+            target = f"'{_qualified(name)}'"
+        post_data.append(
+            f"SELECT setval({target}, {last_value}, {str(is_called).lower()});"
+        )
+
+    return (
+        [table for table, _ in tables],
+        "\n\n".join(pre_data) + "\n",
+        "\n\n".join(post_data) + "\n",
+    )
+
+
+def _dump_table(dsn, snapshot, table, path):
+    """
+    导出线程：在共享快照中将一个表的数据COPY到gzip文件，返回 (行数, 原始字节数)
+    """
+    conn = psycopg2.connect(dsn)
+    try:
+        conn.set_session(isolation_level=ISOLATION_LEVEL_REPEATABLE_READ, readonly=True)
+        cursor = conn.cursor()
+        cursor.execute("SET TRANSACTION SNAPSHOT %s", (snapshot,))
+        with gzip.open(path, "wb", compresslevel=6) as output:
+            writer = _CountingWriter(output)
+            cursor.copy_expert(f"COPY {_qualified(table)} TO STDOUT", writer)
+        rows = cursor.rowcount
+        conn.rollback()
+        return rows, writer.bytes
+    finally:
+        conn.close()
+
+
+def _archive_uploads(archive, uploads_dir, progress):
+    """
+    将上传文件完整写入备份文件，返回报告
+    """
+    files = walk_files(uploads_dir)
+    upload_bytes = 0
+    for done, (path, relative) in enumerate(files, start=1):
+        extension = os.path.splitext(relative)[1].lower()
+        archive.write(
+            path,
+            UPLOADS_PREFIX + relative,
+            compress_type=(
+                zipfile.ZIP_STORED
+                if extension in COMPRESSED_EXTENSIONS
+                else zipfile.ZIP_DEFLATED
+            ),
+        )
+        upload_bytes += os.path.getsize(path)
+        if progress and (done % 100 == 0 or done == len(files)):
+            progress(done, len(files))
+    return {"mode": "full", "files": len(files), "bytes": upload_bytes}
+
+
+def dump_database(
+    archive_path,
+    dsn,
+    uploads_dir=None,
+    workers=4,
+    progress=None,
+    upload_store=None,
+):
+    """
+    备份数据库和uploads目录到ZIP文件
+
+    Args:
+        archive_path: 备份文件路径
+        dsn: PostgreSQL连接字符串
+        uploads_dir: uploads目录，为None时不备份上传文件
+        workers: 并行导出表数据的连接数
+        progress: 进度回调 progress(当前步骤, 总步骤数, 说明)
+        upload_store: 上传文件的内容寻址存储（UploadStore），
+            指定时增量备份上传文件，快照ID为备份文件名（不含扩展名）
+
+    Returns:
+        备份报告：表数量、行数、数据库和上传文件的原始大小、备份文件大小、耗时和吞吐量
+    """
+    started = time.perf_counter()
+    backup_dir = os.path.dirname(os.path.abspath(archive_path))
+    temp_dir = tempfile.mkdtemp(prefix="backup_", dir=backup_dir)
+    partial_path = archive_path + ".partial"
+
+    conn = psycopg2.connect(dsn)
+    try:
+        conn.set_session(isolation_level=ISOLATION_LEVEL_REPEATABLE_READ, readonly=True)
+        cursor = conn.cursor()
+        # 导出快照，导出线程使用同一快照读取各表，保证备份一致
+        cursor.execute("SELECT pg_export_snapshot(), current_setting('server_version')")
+        snapshot, server_version = cursor.fetchone()
+        tables, pre_data, post_data = _build_schema(cursor)
+
+        table_reports = {}
+        with zipfile.ZipFile(
+            partial_path, "w", zipfile.ZIP_DEFLATED, allowZip64=True, compresslevel=6
+        ) as archive:
+            archive.writestr(PRE_DATA_NAME, pre_data)
+
+            pool = ThreadPoolExecutor(
+                max_workers=max(1, workers), thread_name_prefix="backup"
+            )
+            try:
+                futures = {
+                    pool.submit(
+                        _dump_table,
+                        dsn,
+                        snapshot,
+                        table,
+                        os.path.join(temp_dir, f"{index}.copy.gz"),
+                    ): (index, table)
+                    for index, table in enumerate(tables)
+                }
+                for done, future in enumerate(as_completed(futures), start=1):
+                    index, table = futures[future]
+                    rows, size = future.result()
+                    data_path = os.path.join(temp_dir, f"{index}.copy.gz")
+                    archive.write(
+                        data_path,
+                        f"{DATA_PREFIX}{table}.copy.gz",
+                        compress_type=zipfile.ZIP_STORED,
+                    )
+                    os.remove(data_path)
+                    table_reports[table] = {"name": table, "rows": rows, "bytes": size}
+                    if progress:
+                        progress(done, len(tables) + 1, f"已备份表 {table}")
+            finally:
+                pool.shutdown(wait=True, cancel_futures=True)
+
+            archive.writestr(POST_DATA_NAME, post_data)
+            conn.rollback()
+
+            def uploads_progress(done, total):
+                if progress:
+                    progress(len(tables) + done, len(tables) + total, "备份上传文件")
+
+            if upload_store is not None and uploads_dir:
+                snapshot_id = os.path.splitext(os.path.basename(archive_path))[0]
+                upload_manifest, uploads_report = upload_store.snapshot(
+                    uploads_dir, snapshot_id, uploads_progress
+                )
+                uploads_report["mode"] = "incremental"
+                archive.writestr(
+                    UPLOADS_MANIFEST_NAME,
+                    json.dumps(upload_manifest, ensure_ascii=False),
+                )
+            elif uploads_dir:
+                uploads_report = _archive_uploads(
+                    archive, uploads_dir, uploads_progress
+                )
+            else:
+                uploads_report = {"mode": "none", "files": 0, "bytes": 0}
+
+            table_list = [table_reports[table] for table in tables]
+            manifest = {
+                "format": FORMAT_VERSION,
+                "createdAt": datetime.now().isoformat(timespec="seconds"),
+                "serverVersion": server_version,
+                "tables": table_list,
+                "uploads": uploads_report,
+            }
+            archive.writestr(
+                MANIFEST_NAME, json.dumps(manifest, ensure_ascii=False, indent=2)
+            )
+
+        os.replace(partial_path, archive_path)
+    finally:
+        conn.close()
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+
+    seconds = time.perf_counter() - started
+    database_bytes = sum(table["bytes"] for table in table_list)
+    # 吞吐量按实际读取的数据量计算（增量备份时为新增的上传文件）
+    upload_bytes = uploads_report.get("newBytes", uploads_report["bytes"])
+    return {
+        "tables": len(table_list),
+        "rows": sum(table["rows"] for table in table_list),
+        "databaseBytes": database_bytes,
+        "uploadMode": uploads_report["mode"],
+        "uploadFiles": uploads_report["files"],
+        "uploadBytes": uploads_report["bytes"],
+        "uploadNewFiles": uploads_report.get("newObjects", uploads_report["files"]),
+        "uploadNewBytes": upload_bytes,
+        "archiveBytes": os.path.getsize(archive_path),
+        "seconds": round(seconds, 2),
+        "throughputMBps": round(
+            (database_bytes + upload_bytes) / (1024 * 1024) / max(seconds, 1e-6), 2
+        ),
+    }
+
+
+def is_backup_archive(path):
+    """
+    是否为本模块生成的备份文件（包含manifest.json的ZIP）
+    """
+    if not zipfile.is_zipfile(path):
+        return False
+    with zipfile.ZipFile(path) as archive:
+        return MANIFEST_NAME in archive.namelist()
+
+
+def drop_public_objects(cursor):
+    """
+    删除public模式下的所有表和序列
+    """
+    cursor.execute("""
+        SELECT relname, relkind FROM pg_class
+        WHERE relnamespace = 'public'::regnamespace AND relkind IN ('r', 'S')
+        ORDER BY relkind DESC
+        """)
+    for name, kind in cursor.fetchall():
+        object_type = "TABLE" if kind == "r" else "SEQUENCE"
+        cursor.execute(f"DROP {object_type} IF EXISTS {_qualified(name)} CASCADE")
+
+
+def sync_sequences(cursor):
+    """
+    将自增列的序列值调整到不小于表中的最大值（避免导入数据后插入时主键冲突）
+    """
+    cursor.execute("""
+        SELECT c.relname, a.attname,
+               pg_get_serial_sequence(format('%I.%I', 'public', c.relname), a.attname)
+        FROM pg_class c
+        JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum > 0
+        WHERE c.relnamespace = 'public'::regnamespace AND c.relkind = 'r'
+          AND NOT a.attisdropped
+          AND pg_get_serial_sequence(format('%I.%I', 'public', c.relname), a.attname)
+              IS NOT NULL
+        """)
+    for table, column, sequence in cursor.fetchall():
+        cursor.execute(
+            f"SELECT setval(%s, max_value) FROM ("
+            f"SELECT MAX({quote_ident(column)}) AS max_value FROM {_qualified(table)}"
+            f") t WHERE max_value >= (SELECT last_value FROM {sequence})",
+            (sequence,),
+        )
+
+
+def restore_database_archive(archive_path, dsn, progress=None):
+    """
+    从备份文件恢复数据库（在单个事务中执行，失败或取消时数据库保持原状）
+
+    先创建表结构，再用 COPY FROM STDIN 流式导入各表数据（每次读取 COPY_BUFFER_SIZE 字节），
+    最后创建约束和索引、设置序列值并更新统计信息。
+
+    Args:
+        archive_path: 备份文件路径
+        dsn: PostgreSQL连接字符串
+        progress: 进度回调 progress(已处理字节数, 总字节数, 说明)，按备份文件中表数据的压缩大小计算
+    """
+    with zipfile.ZipFile(archive_path) as archive:
+        manifest = json.loads(archive.read(MANIFEST_NAME))
+        if manifest.get("format") != FORMAT_VERSION:
+            raise ValueError(f"不支持的备份格式版本: {manifest.get('format')}")
+
+        tables = manifest["tables"]
+        entries = {
+            table["name"]: archive.getinfo(f"{DATA_PREFIX}{table['name']}.copy.gz")
+            for table in tables
+        }
+        tracker = ByteProgress(
+            sum(entry.compress_size for entry in entries.values()), progress
+        )
+
+        conn = psycopg2.connect(dsn)
+        try:
+            cursor = conn.cursor()
+            cursor.execute(BULK_LOAD_SETTINGS)
+            drop_public_objects(cursor)
+            cursor.execute(archive.read(PRE_DATA_NAME).decode("utf-8"))
+
+            # 表上还没有约束和索引，COPY只写入数据
+            for table in tables:
+                with archive.open(entries[table["name"]]) as raw, gzip.open(
+                    _ProgressReader(raw, tracker)
+                ) as data:
+                    cursor.copy_expert(
+                        f"COPY {_qualified(table['name'])} FROM STDIN",
+                        data,
+                        size=COPY_BUFFER_SIZE,
+                    )
+
+            # 数据导入后再重建约束、索引和序列值
+            cursor.execute(archive.read(POST_DATA_NAME).decode("utf-8"))
+            sync_sequences(cursor)
+            cursor.execute("ANALYZE")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+
+def restore_uploads_archive(archive_path, uploads_dir, upload_store=None):
+    """
+    从备份文件恢复uploads目录
+
+    增量备份的文件按其中的快照清单从内容寻址存储恢复，完整备份的文件先清空uploads目录再解压。
+    """
+    with zipfile.ZipFile(archive_path) as archive:
+        names = set(archive.namelist())
+        if UPLOADS_MANIFEST_NAME in names:
+            if upload_store is None:
+                raise UploadStoreError("增量备份的上传文件需要从内容寻址存储恢复")
+            manifest = json.loads(archive.read(UPLOADS_MANIFEST_NAME))
+            return upload_store.restore(manifest, uploads_dir)
+
+        os.makedirs(uploads_dir, exist_ok=True)
+        for item in os.listdir(uploads_dir):
+            item_path = os.path.join(uploads_dir, item)
+            if os.path.isdir(item_path):
+                shutil.rmtree(item_path)
+            else:
+                os.remove(item_path)
+
+        root = os.path.realpath(uploads_dir)
+        restored = 0
+        for member in archive.infolist():
+            if member.is_dir() or not member.filename.startswith(UPLOADS_PREFIX):
+                continue
+            target = os.path.realpath(
+                os.path.join(root, member.filename[len(UPLOADS_PREFIX) :])
+            )
+            # 防止路径穿越
+            if not target.startswith(root + os.sep):
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with archive.open(member) as source, open(target, "wb") as output:
+                shutil.copyfileobj(source, output)
+            restored += 1
+        return {"files": restored, "copied": restored, "removed": None}
@@ -0,0 +1,434 @@
+# -*- coding: utf-8 -*-
+"""
+申请附件的内容寻址存储
+
+附件按内容保存为 FILE_FOLDER/<sha256><扩展名>，相同内容的文件只保存一份
+（同一份证书提交到多个申请、被驳回后重新提交都不再产生新的副本），
+file_blob 表记录每个文件被申请附件条目（Application.files）引用的次数：
+- 保存附件时文件已存在则丢弃新上传的副本，附件条目直接指向已有文件
+- 申请的附件列表变化时按前后差异增减引用计数（sync_file_refs）
+- 最后一个引用移除时引用计数记为0，事务提交后锁定该记录再次确认仍为0，
+  才删除文件和记录；回滚则保留文件
+- 增加引用时同样锁定记录（UPDATE），并确认文件仍然存在，与删除文件的请求互斥：
+  文件已被删除时抛出 UploadError，不会保存指向不存在文件的附件条目
+
+所有函数都不提交事务，由调用方与申请本身的修改在同一事务中提交。
+未记录在 file_blob 中的旧附件（每次上传单独保存、文件名带时间戳的文件）
+只被一个附件条目引用，删除申请时仍直接删除。
+"""
+
+import hashlib
+import os
+import re
+import shutil
+import time
+from collections import Counter
+from flask import current_app
+from sqlalchemy import case, event, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from extensions import db, resumable_uploads
+from models import Application, FileBlob
+from utils.streaming_upload import CHUNK_SIZE, UploadError, spool_upload
+
+# 内容寻址的文件名：<sha256><扩展名>
+_BLOB_NAME_PATTERN = re.compile(r"^[0-9a-f]{64}(\.[0-9A-Za-z]+)?$")
+
+# 事务提交后待删除的文件（保存在 Session.info 中）
+_PENDING_UNLINKS = "blob_store_unlinks"
+
+# 事务提交后待确认删除的内容寻址文件（引用计数已减为0）
+_PENDING_RELEASES = "blob_store_releases"
+
+# 清理未被引用的文件时跳过最近保存的文件（可能属于尚未提交的申请）
+ORPHAN_GRACE_SECONDS = 3600
+
+
+def blob_name(sha256, filename):
+    """
+    内容对应的文件名，保留原扩展名以便按扩展名设置Content-Type
+    """
+    return sha256 + os.path.splitext(filename)[1].lower()
+
+
+def content_sha256(stored_name):
+    """
+    内容寻址的文件名中的sha256，旧附件返回None
+    """
+    if _BLOB_NAME_PATTERN.match(stored_name):
+        return stored_name[:64]
+    return None
+
+
+def entry_filename(entry):
+    """
+    附件条目在 FILE_FOLDER 中的文件名（path 可能是URL或旧的本地绝对路径）
+    """
+    if not isinstance(entry, dict) or not entry.get("path"):
+        return None
+    return os.path.basename(str(entry["path"]).replace("\\", "/")) or None
+
+
+def _blob_entry_name(entry):
+    filename = entry_filename(entry)
+    if filename and _BLOB_NAME_PATTERN.match(filename):
+        return filename
+    return None
+
+
+def _file_entry(filename, stored_name, size, content_type, sha256):
+    return {
+        "name": filename,
+        "path": f"/uploads/files/{stored_name}",
+        "size": size,
+        "type": content_type,
+        "sha256": sha256,
+    }
+
+
+def _display_name(filename):
+    # 仅保留文件名部分，防止目录遍历
+    return os.path.basename(str(filename).replace("\\", "/"))
+
+
+def save_upload(file_storage):
+    """
+    保存随表单上传的附件，内容已存在时不再保存副本
+
+    Returns:
+        dict: 附件条目（name、path、size、type、sha256），引用计数由 sync_file_refs 增加
+    """
+    stream = spool_upload(file_storage)
+    try:
+        stored_name = blob_name(stream.sha256, file_storage.filename)
+        target = os.path.join(current_app.config["FILE_FOLDER"], stored_name)
+        if not _reuse_file(target):
+            stream.commit(target)
+    finally:
+        stream.close()
+    return _file_entry(
+        _display_name(file_storage.filename),
+        stored_name,
+        stream.size,
+        file_storage.content_type,
+        stream.sha256,
+    )
+
+
+def save_resumable_upload(meta, owner):
+    """
+    保存已完成的断点续传上传并结束会话，内容已存在时丢弃上传的数据
+
+    Returns:
+        dict: 附件条目，引用计数由 sync_file_refs 增加
+    """
+    stored_name = blob_name(meta["sha256"], meta["filename"])
+    target = os.path.join(current_app.config["FILE_FOLDER"], stored_name)
+    if _reuse_file(target):
+        resumable_uploads.delete(meta["id"], owner)
+    else:
+        resumable_uploads.claim(meta["id"], owner, target)
+    return _file_entry(
+        _display_name(meta["filename"]),
+        stored_name,
+        meta["size"],
+        meta["contentType"],
+        meta["sha256"],
+    )
+
+
+def _reuse_file(path):
+    """
+    内容相同的文件已存在时更新其修改时间并返回True
+
+    清理未被引用的文件时跳过 ORPHAN_GRACE_SECONDS 内修改过的文件，
+    避免删除即将被尚未提交的申请引用的旧文件。
+    """
+    try:
+        os.utime(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def _schedule_unlink(path):
+    db.session.info.setdefault(_PENDING_UNLINKS, set()).add(path)
+
+
+def _schedule_release(stored_name):
+    db.session.info.setdefault(_PENDING_RELEASES, set()).add(stored_name)
+
+
+def _increment(stored_name, count):
+    # UPDATE 锁定记录，与提交后确认删除文件的事务互斥
+    result = db.session.execute(
+        update(FileBlob)
+        .where(FileBlob.stored_name == stored_name)
+        .values(ref_count=FileBlob.ref_count + count)
+    )
+    return result.rowcount > 0
+
+
+def _ensure_file(stored_name):
+    if not os.path.isfile(os.path.join(current_app.config["FILE_FOLDER"], stored_name)):
+        raise UploadError(f"附件文件不存在，请重新上传: {stored_name}", 409)
+
+
+def _acquire(stored_name, count):
+    """
+    增加引用计数
+
+    Raises:
+        UploadError: 文件不存在（已被删除或客户端提交了不存在的文件名）
+    """
+    if _increment(stored_name, count):
+        # 已持有记录的锁，文件此时存在即不会再被删除
+        _ensure_file(stored_name)
+        return
+
+    # 首次引用：创建记录（文件必须已保存）
+    _ensure_file(stored_name)
+    path = os.path.join(current_app.config["FILE_FOLDER"], stored_name)
+    try:
+        with db.session.begin_nested():
+            db.session.add(
+                FileBlob(
+                    stored_name=stored_name,
+                    sha256=stored_name[:64],
+                    size=os.path.getsize(path),
+                    ref_count=count,
+                )
+            )
+    except IntegrityError:
+        # 其他请求同时创建了该记录
+        if not _increment(stored_name, count):
+            raise UploadError(f"附件文件不存在，请重新上传: {stored_name}", 409)
+        _ensure_file(stored_name)
+
+
+def _release(stored_name, count):
+    # 记录保留到提交后确认删除文件时，其间新增的引用通过同一记录互斥
+    db.session.execute(
+        update(FileBlob)
+        .where(FileBlob.stored_name == stored_name)
+        .values(
+            ref_count=case(
+                (FileBlob.ref_count > count, FileBlob.ref_count - count), else_=0
+            )
+        )
+    )
+    _schedule_release(stored_name)
+
+
+def sync_file_refs(old_files, new_files):
+    """
+    申请的附件列表由 old_files 变为 new_files 时调整引用计数（不提交事务）
+
+    新增的引用在同一事务中计数，最后一个引用移除的文件在事务提交后删除。
+    """
+    old_refs = Counter(filter(None, map(_blob_entry_name, old_files or [])))
+    new_refs = Counter(filter(None, map(_blob_entry_name, new_files or [])))
+
+    for stored_name in sorted(old_refs.keys() | new_refs.keys()):
+        delta = new_refs[stored_name] - old_refs[stored_name]
+        if delta > 0:
+            _acquire(stored_name, delta)
+        elif delta < 0:
+            _release(stored_name, -delta)
+
+
+def release_application_files(files):
+    """
+    删除申请时释放其附件（不提交事务）
+
+    内容寻址的文件在最后一个引用移除后删除，旧附件直接删除；文件都在事务提交后删除。
+    """
+    sync_file_refs(files, [])
+    for entry in files or []:
+        filename = entry_filename(entry)
+        if filename and not _BLOB_NAME_PATTERN.match(filename):
+            _schedule_unlink(os.path.join(current_app.config["FILE_FOLDER"], filename))
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _link_or_copy(source, target):
+    # 硬链接不占用额外空间，旧文件在事务提交后删除
+    try:
+        os.link(source, target)
+    except FileExistsError:
+        pass
+    except OSError:
+        shutil.copy2(source, target)
+
+
+def dedupe_application_files():
+    """
+    将旧附件迁移到内容寻址存储，并按所有申请的附件条目重新核对引用计数（不提交事务）
+
+    - 旧附件按sha256链接到 <sha256><扩展名>，附件条目改为指向该文件，旧文件在提交后删除
+    - 引用计数与实际的附件条目数不一致时修正，不再被引用的记录删除
+    - 未被任何申请引用且超过 ORPHAN_GRACE_SECONDS 的文件在提交后删除
+
+    :return: 报告
+    """
+    file_folder = current_app.config["FILE_FOLDER"]
+    migrated = 0
+    missing = 0
+    refs = Counter()
+
+    for application in Application.query.order_by(Application.id):
+        files = []
+        changed = False
+        for entry in application.files or []:
+            filename = entry_filename(entry)
+            if filename and not _BLOB_NAME_PATTERN.match(filename):
+                path = os.path.join(file_folder, filename)
+                if os.path.isfile(path):
+                    sha256 = _file_sha256(path)
+                    stored_name = blob_name(sha256, filename)
+                    _link_or_copy(path, os.path.join(file_folder, stored_name))
+                    _schedule_unlink(path)
+                    entry = {
+                        **entry,
+                        "path": f"/uploads/files/{stored_name}",
+                        "size": os.path.getsize(path),
+                        "sha256": sha256,
+                    }
+                    migrated += 1
+                    changed = True
+                else:
+                    missing += 1
+            files.append(entry)
+            stored_name = _blob_entry_name(entry)
+            if stored_name:
+                refs[stored_name] += 1
+        if changed:
+            application.files = files
+
+    fixed = 0
+    blobs = {blob.stored_name: blob for blob in FileBlob.query}
+    for stored_name, count in refs.items():
+        blob = blobs.pop(stored_name, None)
+        path = os.path.join(file_folder, stored_name)
+        if blob is None:
+            if not os.path.isfile(path):
+                missing += 1
+                continue
+            blob = FileBlob(
+                stored_name=stored_name,
+                sha256=stored_name[:64],
+                size=os.path.getsize(path),
+                ref_count=0,
+            )
+            db.session.add(blob)
+        if blob.ref_count != count:
+            blob.ref_count = count
+            fixed += 1
+    for blob in blobs.values():
+        # 记录存在但没有附件条目引用，提交后确认仍未被引用时删除
+        if blob.ref_count != 0:
+            blob.ref_count = 0
+            fixed += 1
+        _schedule_release(blob.stored_name)
+
+    orphaned = 0
+    expire_time = time.time() - ORPHAN_GRACE_SECONDS
+    if os.path.isdir(file_folder):
+        for name in os.listdir(file_folder):
+            path = os.path.join(file_folder, name)
+            if (
+                _BLOB_NAME_PATTERN.match(name)
+                and name not in refs
+                and os.path.getmtime(path) < expire_time
+            ):
+                _schedule_unlink(path)
+                orphaned += 1
+
+    return {
+        "migrated_files": migrated,
+        "missing_files": missing,
+        "fixed_blobs": fixed,
+        "orphaned_files": orphaned,
+    }
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+        current_app.logger.info("删除申请附件: %s", path)
+        return True
+    except FileNotFoundError:
+        return True
+    except OSError as e:
+        current_app.logger.error(f"删除文件失败: {str(e)}")
+        return False
+
+
+def _collect_released(stored_names):
+    """
+    删除引用计数仍为0的内容寻址文件及其记录
+
+    逐个锁定记录（SELECT ... FOR UPDATE）后再次确认引用计数，删除文件后才提交，
+    同时增加引用的请求会等待该锁，随后发现记录已删除、文件不存在而报错。
+    """
+    file_folder = current_app.config["FILE_FOLDER"]
+    with db.engine.begin() as connection:
+        for stored_name in sorted(stored_names):
+            ref_count = connection.execute(
+                select(FileBlob.ref_count)
+                .where(FileBlob.stored_name == stored_name)
+                .with_for_update()
+            ).scalar()
+            # 记录不存在说明已被其他请求清理
+            if ref_count is None or ref_count > 0:
+                continue
+            if _remove_file(os.path.join(file_folder, stored_name)):
+                connection.execute(
+                    FileBlob.__table__.delete().where(
+                        FileBlob.stored_name == stored_name
+                    )
+                )
+
+
+@event.listens_for(Session, "after_commit")
+def _unlink_after_commit(session):
+    # 释放保存点时也会触发，只在外层事务提交后删除
+    if session.in_nested_transaction():
+        return
+    released = session.info.pop(_PENDING_RELEASES, None)
+    paths = session.info.pop(_PENDING_UNLINKS, None)
+    if released:
+        try:
+            _collect_released(released)
+        except Exception:
+            # 记录保留，下次 dedupe-files 时再清理
+            current_app.logger.exception("删除未被引用的附件失败")
+    if not paths:
+        return
+
+    # 旧附件和未被引用的文件：提交后其他请求可能又引用了相同内容，重新检查记录后再删除
+    names = [os.path.basename(path) for path in paths]
+    with db.engine.connect() as connection:
+        referenced = set(
+            connection.execute(
+                select(FileBlob.stored_name).where(FileBlob.stored_name.in_(names))
+            ).scalars()
+        )
+    for path in paths:
+        if os.path.basename(path) not in referenced:
+            _remove_file(path)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_after_rollback(session, previous_transaction):
+    # 外层事务回滚时引用计数未生效，保留文件
+    if previous_transaction.parent is None:
+        session.info.pop(_PENDING_UNLINKS, None)
+        session.info.pop(_PENDING_RELEASES, None)
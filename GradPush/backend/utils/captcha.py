@@ -5,6 +5,9 @@
 
 import random
 import os
+import threading
+from functools import lru_cache
+from io import BytesIO
 from PIL import Image, ImageDraw, ImageFont, ImageFilter
 
 # 验证码字符集
@@ -17,7 +20,11 @@ DEFAULT_LENGTH = 4
 DEFAULT_BG_COLOR = (255, 255, 255)
 DEFAULT_FONT_SIZE = 40  # 调整字体大小
 
-# 尝试使用系统字体
+# FreeType字体对象不是线程安全的，多个线程共用同一字体对象绘制文字时需加锁
+_font_lock = threading.Lock()
+
+# 尝试使用系统字体（每种字号只加载一次）
+@lru_cache(maxsize=None)
 def get_system_font(font_size=DEFAULT_FONT_SIZE):
     """尝试获取系统字体，如果失败则使用默认字体"""
     # 常见系统字体路径
@@ -73,15 +80,16 @@ def generate_captcha(length=DEFAULT_LENGTH, width=DEFAULT_WIDTH, height=DEFAULT_
     char_width = width // length
     
     # 绘制每个字符
-    for i, char in enumerate(captcha_text):
-        # 随机颜色
-        char_color = (random.randint(0, 100), random.randint(0, 100), random.randint(0, 100))
-        
-        # 计算字符位置 - 居中显示
-        x = i * char_width + (char_width - font_size) // 3
-        y = (height - font_size) // 3 + random.randint(-5, 5)  # 轻微随机偏移
-        
-        draw.text((x, y), char, font=font, fill=char_color)
+    with _font_lock:
+        for i, char in enumerate(captcha_text):
+            # 随机颜色
+            char_color = (random.randint(0, 100), random.randint(0, 100), random.randint(0, 100))
+
+            # 计算字符位置 - 居中显示
+            x = i * char_width + (char_width - font_size) // 3
+            y = (height - font_size) // 3 + random.randint(-5, 5)  # 轻微随机偏移
+
+            draw.text((x, y), char, font=font, fill=char_color)
     
     # 添加干扰线
     for _ in range(5):
@@ -102,4 +110,17 @@ def generate_captcha(length=DEFAULT_LENGTH, width=DEFAULT_WIDTH, height=DEFAULT_
     # 轻微模糊处理
     image = image.filter(ImageFilter.SMOOTH_MORE)
     
-    return image, captcha_text
\ No newline at end of file
+    return image, captcha_text
+
+
+def render_captcha():
+    """
+    生成验证码并编码为PNG
+
+    Returns:
+        tuple: (验证码字符串, PNG图片字节)
+    """
+    image, captcha_text = generate_captcha()
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    return captcha_text, buffer.getvalue()
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+验证码预生成池
+
+验证码图片的绘制、滤镜和PNG编码较耗时，由后台线程预先生成一批
+（验证码文本, PNG字节）放入池中，请求时直接取出：
+- 池中剩余数量低于一半时唤醒后台线程补充到 CAPTCHA_POOL_SIZE 个
+- 池为空时在请求线程中同步生成（记为未命中）
+- CAPTCHA_POOL_SIZE 为0时不启用预生成，每次请求同步生成
+
+后台线程在首次取验证码时启动，多进程部署时每个工作进程各自维护一个池。
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from flask import current_app
+from utils.captcha import render_captcha
+
+
+class CaptchaPool:
+    """
+    预生成的验证码池
+    """
+
+    def __init__(self, size, logger, render=render_captcha):
+        self.size = size
+        self.logger = logger
+        self.low_water = size // 2
+        self._render = render
+        self._items = deque()
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._worker = None
+        self._worker_pid = None
+
+        self.hits = 0
+        self.misses = 0
+        self.rendered = 0
+
+    def _ensure_worker(self):
+        # fork出的子进程中线程不存在，需按进程重新启动
+        if self._worker_pid == os.getpid() and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker_pid == os.getpid() and self._worker.is_alive():
+                return
+            self._items.clear()
+            self._worker = threading.Thread(
+                target=self._run, name="captcha-pool", daemon=True
+            )
+            self._worker_pid = os.getpid()
+            self._worker.start()
+
+    def _run(self):
+        while True:
+            while len(self._items) < self.size:
+                try:
+                    item = self._render()
+                except Exception:
+                    self.logger.exception("预生成验证码失败")
+                    time.sleep(1)
+                    continue
+                self._items.append(item)
+                with self._lock:
+                    self.rendered += 1
+            self._wakeup.wait()
+            self._wakeup.clear()
+
+    def get(self):
+        """
+        取出一个验证码
+
+        Returns:
+            tuple: (验证码字符串, PNG图片字节)
+        """
+        if self.size <= 0:
+            item = self._render()
+            with self._lock:
+                self.misses += 1
+                self.rendered += 1
+            return item
+
+        self._ensure_worker()
+        try:
+            item = self._items.popleft()
+            hit = True
+        except IndexError:
+            item = self._render()
+            hit = False
+
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+                self.rendered += 1
+
+        if len(self._items) <= self.low_water:
+            self._wakeup.set()
+        return item
+
+    def stats(self):
+        """
+        池的命中统计
+        """
+        with self._lock:
+            hits, misses, rendered = self.hits, self.misses, self.rendered
+        total = hits + misses
+        return {
+            "size": self.size,
+            "available": len(self._items),
+            "hits": hits,
+            "misses": misses,
+            "hitRate": round(hits / total, 4) if total else None,
+            "rendered": rendered,
+        }
+
+
+_pool_lock = threading.Lock()
+
+
+def get_captcha_pool():
+    """
+    获取当前应用的验证码池
+    """
+    app = current_app._get_current_object()
+    pool = app.extensions.get("captcha_pool")
+    if pool is None:
+        with _pool_lock:
+            pool = app.extensions.get("captcha_pool")
+            if pool is None:
+                pool = CaptchaPool(app.config.get("CAPTCHA_POOL_SIZE", 50), app.logger)
+                app.extensions["captcha_pool"] = pool
+    return pool
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+验证码存储模块
+
+按token保存验证码文本，同一用户标识（IP+User-Agent的哈希值）只保留最新的验证码。
+支持三种存储方式（配置项 CAPTCHA_STORE_TYPE）：
+- database: 使用 Captcha 表持久化存储（默认），多个工作进程共享
+- cache: 使用共享缓存（SHARED_CACHE_TYPE 配置的 filesystem / redis），多进程共享，
+  不产生数据库写入
+- memory: 进程内存储，有数量上限，按过期时间淘汰；只适用于单进程部署，
+  多个工作进程时其他进程签发的验证码无法校验
+
+过期的验证码在 CAPTCHA_EXPIRED_GRACE 秒内仍可读取，以便提示用户“验证码已过期”。
+"""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import NamedTuple
+import pytz
+from flask import current_app
+from utils.shared_cache import get_shared_cache
+
+# 过期后仍保留的时间（秒），用于区分“已过期”和“不存在”
+CAPTCHA_EXPIRED_GRACE = 60
+
+
+class CaptchaEntry(NamedTuple):
+    """
+    已保存的验证码
+    """
+
+    text: str
+    identifier: str
+    expires_at: float  # 过期时间（时间戳）
+
+    @property
+    def expired(self):
+        return time.time() > self.expires_at
+
+
+class MemoryCaptchaStore:
+    """
+    进程内验证码存储（有数量上限，按过期时间淘汰）
+    """
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # token → CaptchaEntry，按创建顺序排列（TTL固定，即按过期时间排列）
+        self._entries = OrderedDict()
+        # 用户标识 → token
+        self._tokens = {}
+        self._lock = threading.Lock()
+
+    def _evict(self, now):
+        # 淘汰超过保留期限的验证码，以及超出数量上限的最旧验证码
+        while self._entries:
+            token, entry = next(iter(self._entries.items()))
+            if (
+                entry.expires_at + CAPTCHA_EXPIRED_GRACE >= now
+                and len(self._entries) < self.max_entries
+            ):
+                break
+            self._remove(token)
+
+    def _remove(self, token):
+        entry = self._entries.pop(token, None)
+        if entry is not None and self._tokens.get(entry.identifier) == token:
+            del self._tokens[entry.identifier]
+        return entry
+
+    def issue(self, identifier, text):
+        """
+        保存新的验证码并替换该用户的旧验证码，返回token
+        """
+        token = str(uuid.uuid4())
+        now = time.time()
+        with self._lock:
+            old_token = self._tokens.get(identifier)
+            if old_token is not None:
+                self._remove(old_token)
+            self._evict(now)
+            self._entries[token] = CaptchaEntry(text, identifier, now + self.ttl)
+            self._tokens[identifier] = token
+        return token
+
+    def get(self, token):
+        with self._lock:
+            return self._entries.get(token)
+
+    def discard(self, token):
+        """
+        删除验证码，返回验证码是否存在（用于保证验证码只能使用一次）
+        """
+        with self._lock:
+            return self._remove(token) is not None
+
+
+class CacheCaptchaStore:
+    """
+    基于cachelib共享缓存的验证码存储（多进程共享）
+    """
+
+    TOKEN_PREFIX = "captcha:token:"
+    IDENTIFIER_PREFIX = "captcha:identifier:"
+
+    def __init__(self, cache, ttl):
+        self.cache = cache
+        self.ttl = ttl
+
+    def issue(self, identifier, text):
+        token = str(uuid.uuid4())
+        timeout = self.ttl + CAPTCHA_EXPIRED_GRACE
+
+        # 替换该用户的旧验证码
+        old_token = self.cache.get(self.IDENTIFIER_PREFIX + identifier)
+        if old_token:
+            self.cache.delete(self.TOKEN_PREFIX + old_token)
+
+        self.cache.set(
+            self.TOKEN_PREFIX + token,
+            (text, identifier, time.time() + self.ttl),
+            timeout=timeout,
+        )
+        self.cache.set(self.IDENTIFIER_PREFIX + identifier, token, timeout=timeout)
+        return token
+
+    def get(self, token):
+        value = self.cache.get(self.TOKEN_PREFIX + token)
+        return CaptchaEntry(*value) if value else None
+
+    def discard(self, token):
+        return bool(self.cache.delete(self.TOKEN_PREFIX + token))
+
+
+class DatabaseCaptchaStore:
+    """
+    基于Captcha表的验证码存储（持久化，多进程共享）
+    """
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.timezone = pytz.timezone("Asia/Shanghai")
+
+    def _now(self):
+        return datetime.now(self.timezone)
+
+    def _timestamp(self, value):
+        # 数据库中的时间可能不带时区，按上海时区处理
+        if value.tzinfo is None:
+            value = self.timezone.localize(value)
+        return value.timestamp()
+
+    def issue(self, identifier, text):
+        from extensions import db
+        from models import Captcha
+
+        token = str(uuid.uuid4())
+        current_time = self._now()
+        grace_time = current_time - timedelta(seconds=CAPTCHA_EXPIRED_GRACE)
+
+        # 清理过期验证码和该用户的旧验证码
+        Captcha.query.filter(
+            (Captcha.expired_at < grace_time) | (Captcha.user_identifier == identifier)
+        ).delete(synchronize_session=False)
+
+        # 限制未过期验证码的数量，超出时删除最旧的验证码
+        active_count = Captcha.query.filter(Captcha.expired_at > current_time).count()
+        if active_count >= self.max_entries:
+            oldest_ids = [
+                row.id
+                for row in Captcha.query.with_entities(Captcha.id)
+                .order_by(Captcha.created_at.asc())
+                .limit(active_count - (self.max_entries - 1))
+            ]
+            Captcha.query.filter(Captcha.id.in_(oldest_ids)).delete(
+                synchronize_session=False
+            )
+
+        db.session.add(
+            Captcha(
+                token=token,
+                text=text,
+                expired_at=current_time + timedelta(seconds=self.ttl),
+                user_identifier=identifier,
+            )
+        )
+        db.session.commit()
+        return token
+
+    def get(self, token):
+        from models import Captcha
+
+        captcha = Captcha.query.filter_by(token=token).first()
+        if not captcha:
+            return None
+        return CaptchaEntry(
+            captcha.text, captcha.user_identifier, self._timestamp(captcha.expired_at)
+        )
+
+    def discard(self, token):
+        from extensions import db
+        from models import Captcha
+
+        deleted = Captcha.query.filter_by(token=token).delete(synchronize_session=False)
+        db.session.commit()
+        return deleted > 0
+
+
+def _create_captcha_store(app):
+    config = app.config
+    store_type = (config.get("CAPTCHA_STORE_TYPE") or "database").lower()
+    ttl = config.get("CAPTCHA_TTL", 300)
+    max_entries = config.get("CAPTCHA_MAX_ENTRIES", 10000)
+
+    if store_type == "memory":
+        return MemoryCaptchaStore(ttl, max_entries)
+    if store_type == "cache":
+        cache = get_shared_cache(config)
+        if cache is not None:
+            return CacheCaptchaStore(cache, ttl)
+        app.logger.warning("未配置共享缓存（SHARED_CACHE_TYPE），验证码使用数据库存储")
+    elif store_type != "database":
+        app.logger.warning(f"不支持的验证码存储类型: {store_type}，使用数据库存储")
+    return DatabaseCaptchaStore(ttl, max_entries)
+
+
+_store_lock = threading.Lock()
+
+
+def get_captcha_store():
+    """
+    获取当前应用的验证码存储
+    """
+    app = current_app._get_current_object()
+    store = app.extensions.get("captcha_store")
+    if store is None:
+        with _store_lock:
+            store = app.extensions.get("captcha_store")
+            if store is None:
+                store = _create_captcha_store(app)
+                app.extensions["captcha_store"] = store
+    return store
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""
+跨进程文件锁
+
+多个工作进程共享同一目录中的状态文件时（后台任务状态、断点续传会话），
+对锁文件加 fcntl.flock 排他锁，使读取-修改-写回在进程之间互斥；
+每次加锁都重新打开锁文件，同一进程的不同线程之间同样互斥。
+
+没有fcntl的平台（Windows开发环境，单进程运行）退化为进程内的线程锁。
+"""
+
+import os
+import threading
+import zlib
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# 没有fcntl时使用的线程锁数量（按路径分配）
+_LOCK_STRIPES = 64
+_thread_locks = [threading.Lock() for _ in range(_LOCK_STRIPES)]
+
+
+@contextmanager
+def file_lock(path):
+    """
+    持有 path 上的排他锁（锁文件不存在时创建）
+    """
+    if fcntl is None:
+        key = zlib.crc32(os.path.abspath(path).encode("utf-8"))
+        with _thread_locks[key % _LOCK_STRIPES]:
+            yield
+        return
+
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        # 关闭文件即释放锁
+        os.close(fd)
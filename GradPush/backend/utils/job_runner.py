@@ -0,0 +1,479 @@
+# -*- coding: utf-8 -*-
+"""
+后台任务模块
+
+在进程内的线程池中执行耗时的管理操作（导入、备份、恢复、成绩重算等），
+请求线程提交任务后立即返回任务ID，前端轮询任务进度：
+- 任务状态保存在 JOB_FOLDER 下的JSON文件中（每个任务一个文件），
+  多个工作进程都可以查询和取消任务，无需外部消息队列；修改任务状态时持有该任务的
+  文件锁（utils/file_lock.py），其他进程写入的取消请求不会被进度更新覆盖
+- 任务函数的第一个参数为 JobContext，用于报告进度和检查是否已被取消
+- 取消为协作式：排队中的任务直接取消，运行中的任务在下次报告进度时中止
+- 服务重启后，所属进程已退出的未完成任务被标记为失败
+
+配置项：
+- JOB_FOLDER: 任务状态文件目录
+- JOB_MAX_WORKERS: 并发执行的任务数量
+- JOB_RETENTION_DAYS: 已结束任务的保留天数
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from werkzeug.utils import secure_filename
+from utils.file_lock import file_lock
+from utils.metrics import JOB_DURATION
+
+# 任务状态
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+
+ACTIVE_STATUSES = (JOB_QUEUED, JOB_RUNNING)
+
+# 进度写入文件的最小间隔（秒）
+PROGRESS_WRITE_INTERVAL = 0.5
+
+# 本进程的唯一标识（容器中重启后进程号可能相同）
+_PROCESS_TOKEN = uuid.uuid4().hex
+
+
+class JobCancelled(Exception):
+    """
+    任务已被取消（由 JobContext.progress / check_cancelled 抛出）
+    """
+
+
+class JobConflict(Exception):
+    """
+    同类任务正在排队或运行中
+    """
+
+    def __init__(self, job):
+        super().__init__(f"已有同类任务正在执行: {job['id']}")
+        self.job = job
+
+
+def _now():
+    return datetime.now().isoformat()
+
+
+def _owner_alive(job):
+    """
+    判断任务所属的进程是否仍在运行
+    """
+    pid = job.get("pid")
+    if not pid:
+        return False
+    if pid == os.getpid():
+        return job.get("process_token") == _PROCESS_TOKEN
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # 无权限等情况视为进程存在
+        return True
+    return True
+
+
+class JobStore:
+    """
+    基于文件的任务状态存储
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+
+    def _path(self, job_id):
+        return os.path.join(self.folder, f"{secure_filename(job_id)}.json")
+
+    def _lock_path(self, job_id):
+        return os.path.join(self.folder, f"{secure_filename(job_id)}.lock")
+
+    def submit_lock(self):
+        """
+        提交任务时的锁（检查同类任务和保存新任务在进程之间互斥）
+        """
+        return file_lock(os.path.join(self.folder, "submit.lock"))
+
+    def load(self, job_id):
+        try:
+            with open(self._path(job_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, job):
+        # 先写临时文件再替换，避免其他进程读到写了一半的文件
+        path = self._path(job["id"])
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(job, f, ensure_ascii=False, default=str)
+        os.replace(temp_path, path)
+
+    def update(self, job_id, **fields):
+        """
+        读取-修改-写回任务状态，返回更新后的任务
+        """
+        with file_lock(self._lock_path(job_id)):
+            job = self.load(job_id)
+            if job is None:
+                return None
+            job.update(fields)
+            self.save(job)
+            return job
+
+    def delete(self, job_id):
+        for path in (self._path(job_id), self._lock_path(job_id)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def all(self):
+        jobs = []
+        for filename in os.listdir(self.folder):
+            if filename.endswith(".json"):
+                job = self.load(filename[: -len(".json")])
+                if job:
+                    jobs.append(job)
+        return jobs
+
+
+class JobContext:
+    """
+    传给任务函数的上下文，用于报告进度和响应取消
+    """
+
+    def __init__(self, runner, job_id):
+        self.runner = runner
+        self.job_id = job_id
+        self._last_write = 0.0
+
+    @property
+    def cancelled(self):
+        return self.runner._is_cancel_requested(self.job_id)
+
+    def check_cancelled(self):
+        if self.cancelled:
+            raise JobCancelled()
+
+    def progress(self, current=None, total=None, message=None):
+        """
+        报告任务进度，任务已被取消时抛出 JobCancelled
+
+        :param current: 已完成数量
+        :param total: 总数量（未知时为None）
+        :param message: 当前步骤说明
+        """
+        now = time.monotonic()
+        finished = total is not None and current is not None and current >= total
+        throttled = now - self._last_write < PROGRESS_WRITE_INTERVAL and not finished
+
+        # 本进程的取消请求每次都检查，任务文件只在写入进度时检查
+        if self.runner._is_cancel_requested(self.job_id, check_store=not throttled):
+            raise JobCancelled()
+        if throttled:
+            return
+        self._last_write = now
+
+        percent = None
+        if total:
+            percent = round(min(current or 0, total) * 100.0 / total, 1)
+        self.runner.store.update(
+            self.job_id,
+            progress={
+                "current": current,
+                "total": total,
+                "percent": percent,
+                "message": message,
+            },
+            updated_at=_now(),
+        )
+
+
+class JobRunner:
+    """
+    进程内后台任务执行器
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.store = None
+        self.executor = None
+        self.max_workers = 2
+        self.retention = timedelta(days=7)
+        self.job_types = {}
+        # 本进程中的任务：job_id → Future / 取消事件
+        self._futures = {}
+        self._cancel_events = {}
+        self._lock = threading.RLock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.store = JobStore(app.config["JOB_FOLDER"])
+        self.max_workers = app.config.get("JOB_MAX_WORKERS", 2)
+        self.retention = timedelta(days=app.config.get("JOB_RETENTION_DAYS", 7))
+        app.extensions["job_runner"] = self
+        self._mark_orphaned_jobs()
+
+    def register(self, job_type, description=None):
+        """
+        注册可通过 POST /api/jobs 按类型提交的任务函数（装饰器）
+
+        任务函数的调用方式为 func(JobContext, params)，params 为请求中的参数字典
+        """
+
+        def decorator(fn):
+            self.job_types[job_type] = {"func": fn, "description": description}
+            return fn
+
+        return decorator
+
+    def _get_executor(self):
+        with self._lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="job"
+                )
+            return self.executor
+
+    def _mark_orphaned_jobs(self):
+        """
+        将所属进程已退出的未完成任务标记为失败
+        """
+        for job in self.store.all():
+            if job["status"] in ACTIVE_STATUSES and not _owner_alive(job):
+                self.store.update(
+                    job["id"],
+                    status=JOB_FAILED,
+                    error="服务重启，任务已中断",
+                    finished_at=_now(),
+                )
+
+    def _prune(self):
+        """
+        删除超过保留期限的已结束任务
+        """
+        threshold = (datetime.now() - self.retention).isoformat()
+        for job in self.store.all():
+            finished_at = job.get("finished_at")
+            if job["status"] not in ACTIVE_STATUSES and finished_at:
+                if finished_at < threshold:
+                    self.store.delete(job["id"])
+
+        # 清理中断任务遗留的上传文件
+        upload_folder = os.path.join(self.store.folder, "uploads")
+        if os.path.isdir(upload_folder):
+            expire_time = time.time() - self.retention.total_seconds()
+            for filename in os.listdir(upload_folder):
+                path = os.path.join(upload_folder, filename)
+                try:
+                    if os.path.getmtime(path) < expire_time:
+                        os.remove(path)
+                except OSError:
+                    pass
+
+    def find_active(self, job_type):
+        """
+        查找排队或运行中的同类任务
+        """
+        for job in self.store.all():
+            if job["type"] == job_type and job["status"] in ACTIVE_STATUSES:
+                return job
+        return None
+
+    def submit(
+        self,
+        job_type,
+        func,
+        *args,
+        description=None,
+        created_by=None,
+        unique=False,
+        **kwargs,
+    ):
+        """
+        提交后台任务，立即返回任务信息
+
+        :param job_type: 任务类型
+        :param func: 任务函数，调用方式为 func(JobContext, *args, **kwargs)，
+                     返回值（可JSON序列化）保存为任务结果
+        :param description: 任务说明
+        :param created_by: 提交任务的用户名
+        :param unique: 为True时，同类任务排队或运行中则抛出 JobConflict
+        """
+        self._prune()
+
+        with self._lock, self.store.submit_lock():
+            if unique:
+                active = self.find_active(job_type)
+                if active is not None:
+                    raise JobConflict(active)
+
+            job = {
+                "id": uuid.uuid4().hex,
+                "type": job_type,
+                "description": description or job_type,
+                "status": JOB_QUEUED,
+                "progress": None,
+                "result": None,
+                "error": None,
+                "created_by": created_by,
+                "created_at": _now(),
+                "started_at": None,
+                "finished_at": None,
+                "updated_at": _now(),
+                "cancel_requested": False,
+                "pid": os.getpid(),
+                "process_token": _PROCESS_TOKEN,
+            }
+            self.store.save(job)
+            self._cancel_events[job["id"]] = threading.Event()
+            self._futures[job["id"]] = self._get_executor().submit(
+                self._run, job["id"], job_type, func, args, kwargs
+            )
+        return job
+
+    def _run(self, job_id, job_type, func, args, kwargs):
+        app = self.app
+        started_at = time.perf_counter()
+        status = JOB_FAILED
+        with app.app_context():
+            try:
+                if self._is_cancel_requested(job_id):
+                    raise JobCancelled()
+                self.store.update(
+                    job_id, status=JOB_RUNNING, started_at=_now(), updated_at=_now()
+                )
+                app.logger.info(f"后台任务开始执行: {job_id}")
+
+                result = func(JobContext(self, job_id), *args, **kwargs)
+
+                # 进度写入有节流，成功后补全为100%
+                progress = (self.store.load(job_id) or {}).get("progress") or {}
+                if progress.get("total"):
+                    progress.update(current=progress["total"], percent=100.0)
+                self.store.update(
+                    job_id,
+                    status=JOB_SUCCEEDED,
+                    result=result,
+                    progress=progress or None,
+                    finished_at=_now(),
+                    updated_at=_now(),
+                )
+                status = JOB_SUCCEEDED
+                app.logger.info(f"后台任务执行成功: {job_id}")
+            except JobCancelled:
+                status = JOB_CANCELLED
+                self.store.update(
+                    job_id,
+                    status=JOB_CANCELLED,
+                    finished_at=_now(),
+                    updated_at=_now(),
+                )
+                app.logger.info(f"后台任务已取消: {job_id}")
+            except Exception as e:
+                self.store.update(
+                    job_id,
+                    status=JOB_FAILED,
+                    error=str(e),
+                    finished_at=_now(),
+                    updated_at=_now(),
+                )
+                app.logger.exception(f"后台任务执行失败: {job_id}")
+            finally:
+                with self._lock:
+                    self._futures.pop(job_id, None)
+                    self._cancel_events.pop(job_id, None)
+                JOB_DURATION.observe(time.perf_counter() - started_at, job_type, status)
+
+    def queue_depth(self):
+        """
+        本进程中排队和运行中的任务数
+
+        :return: (排队数, 运行数)
+        """
+        with self._lock:
+            futures = list(self._futures.values())
+        running = sum(1 for future in futures if future.running())
+        queued = sum(
+            1 for future in futures if not future.running() and not future.done()
+        )
+        return queued, running
+
+    def _is_cancel_requested(self, job_id, check_store=True):
+        event = self._cancel_events.get(job_id)
+        if event is not None and event.is_set():
+            return True
+        if not check_store:
+            return False
+        # 其他进程可能通过任务文件请求取消
+        job = self.store.load(job_id)
+        return bool(job and job.get("cancel_requested"))
+
+    def get(self, job_id):
+        return self.store.load(job_id)
+
+    def list(self, job_type=None, limit=50):
+        """
+        按提交时间倒序列出任务
+        """
+        jobs = self.store.all()
+        if job_type:
+            jobs = [job for job in jobs if job["type"] == job_type]
+        jobs.sort(key=lambda job: job["created_at"], reverse=True)
+        return jobs[:limit]
+
+    def cancel(self, job_id):
+        """
+        取消任务，返回更新后的任务（任务不存在时返回None）
+        """
+        job = self.store.load(job_id)
+        if job is None or job["status"] not in ACTIVE_STATUSES:
+            return job
+
+        with self._lock:
+            event = self._cancel_events.get(job_id)
+            if event is not None:
+                event.set()
+            future = self._futures.get(job_id)
+
+        if future is not None and future.cancel():
+            # 尚未开始执行，直接标记为已取消
+            with self._lock:
+                self._futures.pop(job_id, None)
+                self._cancel_events.pop(job_id, None)
+            return self.store.update(
+                job_id,
+                status=JOB_CANCELLED,
+                cancel_requested=True,
+                finished_at=_now(),
+                updated_at=_now(),
+            )
+
+        # 运行中（或在其他进程中）的任务在下次报告进度时中止
+        return self.store.update(job_id, cancel_requested=True, updated_at=_now())
+
+    def stage_upload(self, file_storage):
+        """
+        将上传的文件保存到任务目录，供后台任务在请求结束后读取
+
+        :return: 保存后的文件路径（任务结束后由任务函数删除）
+        """
+        upload_folder = os.path.join(self.store.folder, "uploads")
+        os.makedirs(upload_folder, exist_ok=True)
+        _, ext = os.path.splitext(file_storage.filename or "")
+        path = os.path.join(upload_folder, f"{uuid.uuid4().hex}{ext.lower()}")
+        file_storage.save(path)
+        return path
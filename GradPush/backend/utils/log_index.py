@@ -0,0 +1,362 @@
+# -*- coding: utf-8 -*-
+"""
+日志文件索引
+
+为每个日志文件建立记录级的偏移索引（一条记录为一行日志头及其后的续行，如异常堆栈），
+查询时按索引直接定位到字节偏移读取，不需要把整个文件读入内存：
+- 索引中保存每条记录的起始偏移、时间、级别和模块，按级别/模块/时间过滤时不读取文件
+- 索引按文件的 (设备号, inode) 缓存：日志轮转（app.log → app.log.1）只是重命名，
+  已建立的索引继续有效；正在写入的文件只对新增部分补建索引
+- 只索引到最后一个完整的行，未写完的行在下次查询时再补充
+
+支持两种日志格式（utils/logging_setup.py）：
+    {"time": "2024-01-01 12:00:00,123", "level": "INFO", "module": "module", ...}
+    2024-01-01 12:00:00,123 [INFO] [module:func:42] - message
+JSON格式的记录返回时转换为文本格式，请求ID等字段放在 fields 中。
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+
+# 建立索引时每次读取的块大小
+CHUNK_SIZE = 1024 * 1024
+
+# 最多缓存的索引数量（app.log 及其轮转文件）
+MAX_CACHED_INDEXES = 16
+
+# 文本格式的日志头，或JSON格式日志记录的前三个字段（time、level、module）
+_HEADER_PATTERN = re.compile(
+    rb'^(?:\{"time": ")?(\d{4})-(\d\d)-(\d\d) (\d\d):(\d\d):(\d\d),\d{3}'
+    rb'(?:", "level": "| \[)([A-Z]+)(?:", "module": "|\] \[)([^:\]"\n]*)',
+    re.MULTILINE,
+)
+_TIME_PATTERN = re.compile(r"^(\d{4})-(\d\d)-(\d\d)(?:[ T](\d\d):(\d\d)(?::(\d\d))?)?")
+
+
+def parse_log_time(value, end=False):
+    """
+    将 "YYYY-MM-DD[ HH:MM[:SS]]" 转换为可比较的整数 YYYYMMDDHHMMSS
+
+    Args:
+        value: 时间字符串
+        end: 省略的时分秒按一天/一分钟的结尾补齐（用于时间范围的上限）
+
+    Raises:
+        ValueError: 时间格式无效
+    """
+    match = _TIME_PATTERN.match(value.strip())
+    if not match:
+        raise ValueError(f"无效的时间: {value}")
+    year, month, day, hour, minute, second = match.groups()
+    default = "59" if end else "00"
+    return int(
+        year
+        + month
+        + day
+        + (hour or ("23" if end else "00"))
+        + (minute or default)
+        + (second or default)
+    )
+
+
+def _format_time(value):
+    if not value:
+        return None
+    text = str(value)
+    return (
+        f"{text[0:4]}-{text[4:6]}-{text[6:8]} {text[8:10]}:{text[10:12]}:{text[12:14]}"
+    )
+
+
+def _expand_json_record(record):
+    """
+    将JSON格式的日志记录转换为文本格式，其余字段放入 fields
+    """
+    try:
+        entry = json.loads(record["text"])
+    except ValueError:
+        return
+    text = (
+        f"{entry.pop('time', '')} [{entry.pop('level', '')}] "
+        f"[{entry.pop('module', '')}:{entry.pop('func', '')}:{entry.pop('line', '')}]"
+        f" - {entry.pop('message', '')}"
+    )
+    for key in ("exc", "stack"):
+        if entry.get(key):
+            text += "\n" + entry.pop(key)
+    record["text"] = text
+    record["fields"] = entry
+
+
+class LogFilter:
+    """
+    日志记录的过滤条件
+
+    Args:
+        level: 最低级别（如 WARNING 时返回 WARNING、ERROR、CRITICAL）
+        modules: 模块名列表
+        since: 开始时间（YYYYMMDDHHMMSS整数）
+        until: 结束时间（YYYYMMDDHHMMSS整数）
+    """
+
+    def __init__(self, level=None, modules=None, since=None, until=None):
+        self.level = level
+        self.modules = set(modules or ())
+        self.since = since
+        self.until = until
+
+    @property
+    def empty(self):
+        return not (self.level or self.modules or self.since or self.until)
+
+
+class LogIndex:
+    """
+    单个日志文件的记录偏移索引
+    """
+
+    def __init__(self):
+        self.offsets = array("q")  # 记录起始偏移
+        self.times = array("q")  # 记录时间（YYYYMMDDHHMMSS，无法解析时为0）
+        self.levels = array("B")  # 记录级别（logging级别数值，无法解析时为0）
+        self.modules = array("H")  # 记录模块（module_names中的下标）
+        self.module_names = [""]
+        self._module_ids = {"": 0}
+        self.size = 0  # 已建立索引的字节数（到最后一个完整行为止）
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def _module_id(self, name):
+        module_id = self._module_ids.get(name)
+        if module_id is None:
+            module_id = len(self.module_names)
+            self.module_names.append(name)
+            self._module_ids[name] = module_id
+        return module_id
+
+    def update(self, fileobj, file_size):
+        """
+        为文件中新增的完整行补建索引
+        """
+        if file_size <= self.size:
+            return
+        fileobj.seek(self.size)
+        base = self.size
+        pending = b""
+        while base + len(pending) < file_size:
+            chunk = fileobj.read(min(CHUNK_SIZE, file_size - base - len(pending)))
+            if not chunk:
+                break
+            data = pending + chunk
+            end = data.rfind(b"\n") + 1
+            if end == 0:
+                pending = data
+                continue
+            self._index_lines(data, end, base)
+            base += end
+            pending = data[end:]
+        self.size = base
+
+    def _index_lines(self, data, end, base):
+        # 文件开头不是日志头时（如被截断的堆栈），作为一条无级别的记录
+        if base == 0 and not _HEADER_PATTERN.match(data):
+            self._append(0, 0, 0, 0)
+
+        # 每行都要处理，级别和模块按原始字节缓存查找结果
+        append_offset = self.offsets.append
+        append_time = self.times.append
+        append_level = self.levels.append
+        append_module = self.modules.append
+        level_cache = {}
+        module_cache = {}
+        for match in _HEADER_PATTERN.finditer(data, 0, end):
+            year, month, day, hour, minute, second, level, module = match.groups()
+            level_no = level_cache.get(level)
+            if level_no is None:
+                level_no = logging.getLevelName(level.decode("ascii"))
+                level_no = level_cache[level] = (
+                    level_no if isinstance(level_no, int) else 0
+                )
+            module_id = module_cache.get(module)
+            if module_id is None:
+                module_id = module_cache[module] = self._module_id(
+                    module.decode("utf-8", errors="replace")
+                )
+            append_offset(base + match.start())
+            append_time(int(year + month + day + hour + minute + second))
+            append_level(level_no)
+            append_module(module_id)
+
+    def _append(self, offset, time, level, module_id):
+        self.offsets.append(offset)
+        self.times.append(time)
+        self.levels.append(level)
+        self.modules.append(module_id)
+
+    def _matches(self, position, log_filter):
+        if log_filter.level and self.levels[position] < log_filter.level:
+            return False
+        if log_filter.since and self.times[position] < log_filter.since:
+            return False
+        if log_filter.until and self.times[position] > log_filter.until:
+            return False
+        if log_filter.modules and (
+            self.module_names[self.modules[position]] not in log_filter.modules
+        ):
+            return False
+        return True
+
+    def _select(self, positions, limit, log_filter):
+        selected = []
+        for position in positions:
+            if log_filter.empty or self._matches(position, log_filter):
+                selected.append(position)
+                if len(selected) >= limit:
+                    break
+        return selected
+
+    def _end_offset(self, position):
+        if position + 1 < len(self.offsets):
+            return self.offsets[position + 1]
+        return self.size
+
+    def read_records(self, fileobj, positions):
+        """
+        读取记录内容，相邻的记录合并为一次读取
+        """
+        records = []
+        index = 0
+        while index < len(positions):
+            run_end = index + 1
+            while (
+                run_end < len(positions)
+                and positions[run_end] == positions[run_end - 1] + 1
+            ):
+                run_end += 1
+
+            start = self.offsets[positions[index]]
+            fileobj.seek(start)
+            data = fileobj.read(self._end_offset(positions[run_end - 1]) - start)
+            for position in positions[index:run_end]:
+                begin = self.offsets[position] - start
+                text = data[begin : self._end_offset(position) - start]
+                record = {
+                    "offset": self.offsets[position],
+                    "time": _format_time(self.times[position]),
+                    "level": (
+                        logging.getLevelName(self.levels[position])
+                        if self.levels[position]
+                        else None
+                    ),
+                    "module": self.module_names[self.modules[position]] or None,
+                    "text": text.decode("utf-8", errors="replace").rstrip("\n"),
+                }
+                if record["text"].startswith("{"):
+                    _expand_json_record(record)
+                records.append(record)
+            index = run_end
+        return records
+
+    def forward(self, offset, limit, log_filter):
+        """
+        从字节偏移 offset 起（含）向后查找记录
+
+        Returns:
+            tuple: (记录位置列表, 下一页的起始偏移；已到达文件末尾时为已索引的大小)
+        """
+        start = bisect_left(self.offsets, offset)
+        selected = self._select(range(start, len(self.offsets)), limit, log_filter)
+        if len(selected) >= limit and selected[-1] + 1 < len(self.offsets):
+            next_offset = self.offsets[selected[-1] + 1]
+        else:
+            next_offset = self.size
+        return selected, next_offset
+
+    def backward(self, before, limit, log_filter):
+        """
+        查找字节偏移 before 之前（不含）的最后 limit 条记录
+
+        Returns:
+            tuple: (记录位置列表, 是否还有更早的记录)
+        """
+        end = bisect_left(self.offsets, before if before is not None else self.size + 1)
+        selected = self._select(range(end - 1, -1, -1), limit, log_filter)
+        selected.reverse()
+        if not selected:
+            has_more = False
+        elif log_filter.empty:
+            has_more = selected[0] > 0
+        else:
+            has_more = any(
+                self._matches(position, log_filter)
+                for position in range(selected[0] - 1, -1, -1)
+            )
+        return selected, has_more
+
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def _get_index(stat):
+    key = (stat.st_dev, stat.st_ino)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        # 文件被截断或inode被复用时重建索引
+        if index is None or index.size > stat.st_size:
+            index = LogIndex()
+            _indexes[key] = index
+        _indexes.move_to_end(key)
+        while len(_indexes) > MAX_CACHED_INDEXES:
+            _indexes.popitem(last=False)
+    return index
+
+
+def query_log(path, offset=None, tail=None, before=None, limit=200, log_filter=None):
+    """
+    查询日志文件中的记录
+
+    Args:
+        path: 日志文件路径
+        offset: 向后分页，返回该字节偏移起（含）的记录
+        tail: 返回最后 tail 条记录（before 指定时为该偏移之前的记录）
+        before: 与 tail 配合向前翻页，传入上一页的 prevOffset
+        limit: 向后分页时每页的记录数
+        log_filter: 过滤条件 LogFilter
+
+    Returns:
+        dict: records、size（已索引的字节数）、totalRecords（文件中的记录总数）、
+              nextOffset（继续向后读取/轮询新日志的偏移）、
+              prevOffset（首条记录的偏移）、hasMore（该方向上是否还有记录）、
+              modules（文件中出现过的模块名）
+    """
+    log_filter = log_filter or LogFilter()
+    with open(path, "rb") as fileobj:
+        stat = os.fstat(fileobj.fileno())
+        index = _get_index(stat)
+        with index.lock:
+            index.update(fileobj, stat.st_size)
+            if tail:
+                positions, has_more = index.backward(before, tail, log_filter)
+                next_offset = index.size
+            else:
+                positions, next_offset = index.forward(offset or 0, limit, log_filter)
+                has_more = next_offset < index.size
+            records = index.read_records(fileobj, positions)
+            return {
+                "records": records,
+                "size": index.size,
+                "totalRecords": len(index),
+                "nextOffset": next_offset,
+                "prevOffset": records[0]["offset"] if records else None,
+                "hasMore": has_more,
+                "modules": sorted(name for name in index.module_names if name),
+            }
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+日志配置
+
+请求线程只把日志记录放入内存队列（QueueHandler），由后台线程（QueueListener）
+写入日志文件和控制台，请求线程中不发生文件I/O：
+- 日志文件每条记录一行JSON（JSON Lines），包含时间、级别、模块、请求ID、路由、用户和请求耗时
+- 日志级别按模块配置（LOG_LEVEL 为默认级别，LOG_MODULE_LEVELS 如 "auth_bp=DEBUG,rule_engine=WARNING"），
+  没有任何模块开启DEBUG时 logger.debug 在创建日志记录前即返回
+- 每个请求分配请求ID（沿用请求头 X-Request-ID），并在响应头中返回
+
+调试日志使用 %s 参数形式（logger.debug("...: %s", value)），未开启时不会格式化消息。
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import time
+import uuid
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from flask import g, has_request_context, request, session
+from flask.logging import default_handler
+
+TEXT_FORMAT = (
+    "%(asctime)s [%(levelname)s] [%(module)s:%(funcName)s:%(lineno)d] - %(message)s"
+)
+
+# 请求上下文中记录到日志的字段（记录属性 → JSON字段名）
+CONTEXT_FIELDS = (
+    ("request_id", "requestId"),
+    ("route", "route"),
+    ("user", "user"),
+    ("duration_ms", "durationMs"),
+)
+
+
+def parse_module_levels(spec):
+    """
+    解析按模块配置的日志级别，如 "auth_bp=DEBUG,rule_engine=WARNING"
+
+    Raises:
+        ValueError: 级别名称无效
+    """
+    levels = {}
+    for item in (spec or "").split(","):
+        if not item.strip():
+            continue
+        module, _, level_name = item.partition("=")
+        level = logging.getLevelName(level_name.strip().upper())
+        if not isinstance(level, int):
+            raise ValueError(f"无效的日志级别: {item}")
+        levels[module.strip()] = level
+    return levels
+
+
+class ModuleLevelFilter(logging.Filter):
+    """
+    按日志记录所在的模块过滤级别
+    """
+
+    def __init__(self, default_level, module_levels):
+        super().__init__()
+        self.default_level = default_level
+        self.module_levels = module_levels
+
+    def filter(self, record):
+        return record.levelno >= self.module_levels.get(
+            record.module, self.default_level
+        )
+
+
+class RequestContextFilter(logging.Filter):
+    """
+    为日志记录添加请求上下文（在记录日志的线程中执行）
+    """
+
+    def filter(self, record):
+        if has_request_context():
+            record.request_id = g.get("request_id")
+            record.route = request.endpoint
+            record.user = session.get("username")
+            started_at = g.get("request_started_at")
+            if started_at is not None:
+                record.duration_ms = round((time.perf_counter() - started_at) * 1000, 1)
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    每条日志记录输出为一行JSON
+
+    time、level、module 固定为前三个字段，日志查看接口按此顺序建立索引。
+    """
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "module": record.module,
+            "func": record.funcName,
+            "line": record.lineno,
+            "message": record.getMessage(),
+        }
+        for attribute, field in CONTEXT_FIELDS:
+            value = getattr(record, attribute, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class StructuredQueueHandler(QueueHandler):
+    """
+    放入队列前只合并消息参数和异常堆栈，保留记录的其他字段供后台线程格式化
+    """
+
+    def prepare(self, record):
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def configure_logging(app, log_folder):
+    """
+    为应用配置异步日志和请求ID
+    """
+    config = app.config
+    default_level = logging.getLevelName(config.get("LOG_LEVEL", "INFO").upper())
+    module_levels = parse_module_levels(config.get("LOG_MODULE_LEVELS"))
+
+    os.makedirs(log_folder, exist_ok=True)
+    file_handler = RotatingFileHandler(
+        os.path.join(log_folder, "app.log"),
+        maxBytes=config.get("LOG_MAX_BYTES", 10 * 1024 * 1024),
+        backupCount=config.get("LOG_BACKUP_COUNT", 5),
+        encoding="utf-8",  # 设置文件编码为UTF-8，解决中文乱码问题
+    )
+    if config.get("LOG_FORMAT", "json") == "json":
+        file_handler.setFormatter(JsonFormatter())
+    else:
+        file_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, file_handler, console_handler)
+    listener.start()
+    # 退出时写完队列中剩余的日志
+    atexit.register(listener.stop)
+
+    queue_handler = StructuredQueueHandler(log_queue)
+    queue_handler.addFilter(RequestContextFilter())
+
+    logger = app.logger
+    logger.removeHandler(default_handler)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.addHandler(queue_handler)
+    logger.addFilter(ModuleLevelFilter(default_level, module_levels))
+    # logger级别取所有模块中最低的级别，更低级别的日志在创建记录前即被丢弃
+    logger.setLevel(min([default_level, *module_levels.values()]))
+    logger.propagate = False
+    app.extensions["log_listener"] = listener
+
+    @app.before_request
+    def assign_request_id():
+        g.request_id = (
+            request.headers.get("X-Request-ID", "")[:64] or uuid.uuid4().hex[:16]
+        )
+        g.request_started_at = time.perf_counter()
+
+    @app.after_request
+    def log_request(response):
+        response.headers["X-Request-ID"] = g.get("request_id", "")
+        if config.get("LOG_REQUESTS", True):
+            logger.info("%s %s %s", request.method, request.path, response.status_code)
+        return response
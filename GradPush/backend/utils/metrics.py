@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+"""
+运行指标（Prometheus文本格式）
+
+不依赖外部库的计数器、直方图和采集时计算的指标，由 GET /api/system/metrics 以
+Prometheus 文本格式（text/plain; version=0.0.4）输出。计数器和直方图在请求线程和
+后台任务中更新，每个指标使用独立的锁；数据保存在当前进程中，多进程部署时需分别采集。
+
+指标名称：
+- gradpush_http_requests_total{method,route,status}: 请求数（route为URL规则，如 /api/applications/<int:id>）
+- gradpush_http_request_duration_seconds{method,route}: 请求耗时直方图
+- gradpush_upload_requests_total: 上传文件（multipart/form-data）的请求数
+- gradpush_upload_bytes_total: 上传文件请求的字节数
+- gradpush_captchas_rendered_total: 生成的验证码图片数
+- gradpush_captcha_pool_hits_total / gradpush_captcha_pool_misses_total: 验证码预生成池命中/未命中次数
+- gradpush_captcha_pool_available: 预生成池中可用的验证码数量
+- gradpush_db_pool_size / gradpush_db_pool_checked_out / gradpush_db_pool_overflow:
+  数据库连接池大小、已借出的连接数、超出池大小的连接数
+- gradpush_jobs{state}: 本进程中排队（queued）和运行中（running）的后台任务数
+- gradpush_job_duration_seconds{type,status}: 后台任务耗时直方图（数据库备份为 type="backup"）
+- gradpush_process_start_time_seconds: 进程启动时间（Unix时间戳）
+"""
+
+import threading
+import time
+from bisect import bisect_left
+
+# 请求耗时分桶（秒）
+REQUEST_DURATION_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+)
+
+# 后台任务耗时分桶（秒）
+JOB_DURATION_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    只增不减的计数器
+    """
+
+    type = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        for labelvalues, value in values:
+            yield self.name + _format_labels(self.labelnames, labelvalues), value
+
+
+class Histogram:
+    """
+    固定分桶的直方图
+    """
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # 标签值 → [各桶计数..., +Inf桶计数, 总和]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(labelvalues)
+            if counts is None:
+                counts = self._values[labelvalues] = [0] * (len(self.buckets) + 1) + [
+                    0.0
+                ]
+            counts[index] += 1
+            counts[-1] += value
+
+    def samples(self):
+        with self._lock:
+            values = [(labels, list(counts)) for labels, counts in self._values.items()]
+        for labelvalues, counts in values:
+            total = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts[:-1]):
+                total += count
+                labels = _format_labels(
+                    self.labelnames, labelvalues, f'le="{_format_value(bound)}"'
+                )
+                yield f"{self.name}_bucket{labels}", total
+            labels = _format_labels(self.labelnames, labelvalues)
+            yield f"{self.name}_sum{labels}", counts[-1]
+            yield f"{self.name}_count{labels}", total
+
+
+class CallbackMetric:
+    """
+    采集时调用函数计算的指标
+
+    函数返回数值，或 [(标签值元组, 数值)] 列表；返回None时不输出该指标
+    """
+
+    def __init__(self, name, documentation, func, labelnames=(), type="gauge"):
+        self.name = name
+        self.documentation = documentation
+        self.func = func
+        self.labelnames = tuple(labelnames)
+        self.type = type
+
+    def samples(self):
+        value = self.func()
+        if value is None:
+            return
+        if not isinstance(value, list):
+            value = [((), value)]
+        for labelvalues, sample in value:
+            yield self.name + _format_labels(self.labelnames, labelvalues), sample
+
+
+class MetricsRegistry:
+    """
+    指标注册表
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=()):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name, documentation, func, labelnames=(), type="gauge"):
+        return self.register(
+            CallbackMetric(name, documentation, func, labelnames, type)
+        )
+
+    def render(self):
+        """
+        输出 Prometheus 文本格式
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            samples = list(metric.samples())
+            if not samples and isinstance(metric, CallbackMetric):
+                continue
+            lines.append(f"# HELP {metric.name} {_escape(metric.documentation)}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for sample, value in samples:
+                lines.append(f"{sample} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+HTTP_REQUESTS = metrics.counter(
+    "gradpush_http_requests_total", "请求数", ("method", "route", "status")
+)
+HTTP_REQUEST_DURATION = metrics.histogram(
+    "gradpush_http_request_duration_seconds",
+    "请求耗时（秒）",
+    ("method", "route"),
+    REQUEST_DURATION_BUCKETS,
+)
+UPLOAD_REQUESTS = metrics.counter(
+    "gradpush_upload_requests_total", "上传文件（multipart/form-data）的请求数"
+)
+UPLOAD_BYTES = metrics.counter("gradpush_upload_bytes_total", "上传文件请求的字节数")
+JOB_DURATION = metrics.histogram(
+    "gradpush_job_duration_seconds",
+    "后台任务耗时（秒）",
+    ("type", "status"),
+    JOB_DURATION_BUCKETS,
+)
+
+_PROCESS_START_TIME = time.time()
+metrics.callback(
+    "gradpush_process_start_time_seconds",
+    "进程启动时间（Unix时间戳）",
+    lambda: _PROCESS_START_TIME,
+)
+
+
+def init_app_metrics(app, db, job_runner):
+    """
+    注册采集时从连接池、后台任务和验证码池读取的指标
+    """
+
+    def pool_value(method):
+        def read():
+            with app.app_context():
+                pool = db.engine.pool
+            # SQLite等使用的连接池没有这些统计方法
+            reader = getattr(pool, method, None)
+            # QueuePool.overflow() 在连接数未达到池大小时为负数
+            return max(reader(), 0) if callable(reader) else None
+
+        return read
+
+    metrics.callback("gradpush_db_pool_size", "数据库连接池大小", pool_value("size"))
+    metrics.callback(
+        "gradpush_db_pool_checked_out",
+        "已借出的数据库连接数",
+        pool_value("checkedout"),
+    )
+    metrics.callback(
+        "gradpush_db_pool_overflow",
+        "超出连接池大小的数据库连接数",
+        pool_value("overflow"),
+    )
+
+    def job_depth():
+        queued, running = job_runner.queue_depth()
+        return [(("queued",), queued), (("running",), running)]
+
+    metrics.callback(
+        "gradpush_jobs", "本进程中排队和运行中的后台任务数", job_depth, ("state",)
+    )
+
+    def captcha_stat(key):
+        def read():
+            pool = app.extensions.get("captcha_pool")
+            return pool.stats()[key] if pool is not None else 0
+
+        return read
+
+    metrics.callback(
+        "gradpush_captchas_rendered_total",
+        "生成的验证码图片数",
+        captcha_stat("rendered"),
+        type="counter",
+    )
+    metrics.callback(
+        "gradpush_captcha_pool_hits_total",
+        "验证码预生成池命中次数",
+        captcha_stat("hits"),
+        type="counter",
+    )
+    metrics.callback(
+        "gradpush_captcha_pool_misses_total",
+        "验证码预生成池未命中次数",
+        captcha_stat("misses"),
+        type="counter",
+    )
+    metrics.callback(
+        "gradpush_captcha_pool_available",
+        "预生成池中可用的验证码数量",
+        captcha_stat("available"),
+    )
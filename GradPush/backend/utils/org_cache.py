@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+组织架构缓存模块
+
+学院、系、专业数据很少变化，按版本号缓存在进程内：
+- ID → 名称映射，系 → 学院、专业 → 系的上级索引，以及下级ID索引
+- 组织数据增删改后调用 invalidate_org_cache() 更新版本号
+- 启用共享缓存（SHARED_CACHE_TYPE）时版本号保存在共享缓存中，
+  其他工作进程发现版本变化后重新加载，保持多进程一致
+- 未启用共享缓存时进程内快照最多保留 LOCAL_SNAPSHOT_TTL 秒，
+  其他进程的修改最迟在该时间后生效
+- 同一请求内只检查一次版本号（保存在flask.g中）
+"""
+
+import threading
+import time
+import uuid
+from types import MappingProxyType
+from flask import current_app, g, has_app_context
+from extensions import db
+from models import Faculty, Department, Major
+from utils.shared_cache import get_shared_cache
+
+# 共享缓存中的版本号键
+ORG_VERSION_KEY = "org_cache_version"
+
+# 未启用共享缓存时进程内快照的有效期（秒）
+LOCAL_SNAPSHOT_TTL = 30
+
+
+class OrgSnapshot:
+    """
+    某一版本的组织架构快照（只读）
+    """
+
+    def __init__(self, version, faculties, departments, majors):
+        self.version = version
+
+        # ID → 名称
+        self.faculty_names = MappingProxyType({f.id: f.name for f in faculties})
+        self.department_names = MappingProxyType({d.id: d.name for d in departments})
+        self.major_names = MappingProxyType({m.id: m.name for m in majors})
+
+        # 上级索引
+        self.department_faculty = MappingProxyType(
+            {d.id: d.faculty_id for d in departments}
+        )
+        self.major_department = MappingProxyType(
+            {m.id: m.department_id for m in majors}
+        )
+
+        # 下级索引
+        departments_by_faculty = {}
+        for department in departments:
+            departments_by_faculty.setdefault(department.faculty_id, []).append(
+                department.id
+            )
+        majors_by_department = {}
+        majors_by_faculty = {}
+        for major in majors:
+            majors_by_department.setdefault(major.department_id, []).append(major.id)
+            faculty_id = self.department_faculty.get(major.department_id)
+            majors_by_faculty.setdefault(faculty_id, []).append(major.id)
+
+        self.departments_by_faculty = MappingProxyType(
+            {k: tuple(v) for k, v in departments_by_faculty.items()}
+        )
+        self.majors_by_department = MappingProxyType(
+            {k: tuple(v) for k, v in majors_by_department.items()}
+        )
+        self.majors_by_faculty = MappingProxyType(
+            {k: tuple(v) for k, v in majors_by_faculty.items()}
+        )
+
+    def faculty_name(self, faculty_id, default=""):
+        return self.faculty_names.get(faculty_id, default)
+
+    def department_name(self, department_id, default=""):
+        return self.department_names.get(department_id, default)
+
+    def major_name(self, major_id, default=""):
+        return self.major_names.get(major_id, default)
+
+
+_snapshot = None
+_local_version = 0
+_lock = threading.Lock()
+
+
+def _current_version():
+    """
+    当前版本号（启用共享缓存时以共享缓存为准）
+    """
+    shared = get_shared_cache(current_app.config)
+    if shared is None:
+        # 无法得知其他进程的修改，按有效期定期重新加载
+        return (_local_version, int(time.monotonic() // LOCAL_SNAPSHOT_TTL))
+    version = shared.get(ORG_VERSION_KEY)
+    if version is None:
+        # 共享缓存中尚无版本号（首次启动或缓存被清空）
+        shared.add(ORG_VERSION_KEY, 1)
+        version = shared.get(ORG_VERSION_KEY) or 1
+    return version
+
+
+def _load_snapshot(version):
+    """
+    从数据库加载组织架构（三次轻量查询）
+    """
+    faculties = db.session.query(Faculty.id, Faculty.name).all()
+    departments = db.session.query(
+        Department.id, Department.name, Department.faculty_id
+    ).all()
+    majors = db.session.query(Major.id, Major.name, Major.department_id).all()
+    return OrgSnapshot(version, faculties, departments, majors)
+
+
+def get_org_snapshot():
+    """
+    获取当前版本的组织架构快照
+    """
+    global _snapshot
+    if has_app_context() and "org_snapshot" in g:
+        return g.org_snapshot
+
+    version = _current_version()
+    snapshot = _snapshot
+    if snapshot is None or snapshot.version != version:
+        with _lock:
+            snapshot = _snapshot
+            if snapshot is None or snapshot.version != version:
+                snapshot = _load_snapshot(version)
+                _snapshot = snapshot
+
+    if has_app_context():
+        g.org_snapshot = snapshot
+    return snapshot
+
+
+def invalidate_org_cache():
+    """
+    组织数据变更后使缓存失效（需在事务提交后调用）
+    """
+    global _local_version, _snapshot
+    with _lock:
+        _local_version += 1
+        _snapshot = None
+
+    shared = get_shared_cache(current_app.config)
+    if shared is not None:
+        # 写入新的唯一版本号（filesystem缓存的inc不是原子操作，并发失效时可能丢失递增）
+        shared.set(ORG_VERSION_KEY, uuid.uuid4().hex)
+
+    if has_app_context():
+        g.pop("org_snapshot", None)
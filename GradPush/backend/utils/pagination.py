@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+键集分页（游标分页）工具模块
+
+按 (时间列, 主键) 降序进行键集分页：
+- 每页只查询 limit+1 行，不使用 OFFSET，翻页耗时与数据总量无关
+- 游标为不透明的 base64url 字符串，内容为上一页最后一行的 (时间, ID)
+- 时间列为空的行排在最后
+"""
+
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import and_, or_, tuple_
+
+# 默认每页条数与每页最大条数
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(time_value, row_id):
+    """
+    将分页位置编码为不透明游标
+
+    Args:
+        time_value: 排序时间列的值（可为None）
+        row_id: 主键ID
+
+    Returns:
+        base64url编码的游标字符串
+    """
+    payload = [time_value.isoformat() if time_value else None, row_id]
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """
+    解析游标
+
+    Returns:
+        (time_value, row_id) 元组
+
+    Raises:
+        ValueError: 游标格式无效
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        time_text, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        time_value = datetime.fromisoformat(time_text) if time_text else None
+        if not isinstance(row_id, int):
+            raise ValueError("游标ID无效")
+        return time_value, row_id
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"无效的分页游标: {cursor}") from e
+
+
+def parse_page_size(value, default=DEFAULT_PAGE_SIZE):
+    """
+    解析每页条数，限制在 [1, MAX_PAGE_SIZE] 范围内
+    """
+    try:
+        size = int(value) if value is not None else default
+    except (TypeError, ValueError):
+        size = default
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def keyset_order(time_column, id_column):
+    """
+    键集分页的排序条件：时间降序（空值在后）、ID降序
+    """
+    return (time_column.desc().nulls_last(), id_column.desc())
+
+
+def keyset_after(time_column, id_column, time_value, row_id):
+    """
+    位于游标之后的行的筛选条件（与 keyset_order 的排序一致）
+    """
+    if time_value is None:
+        # 已进入时间为空的尾部，只按ID继续
+        return and_(time_column.is_(None), id_column < row_id)
+    return or_(
+        tuple_(time_column, id_column) < tuple_(time_value, row_id),
+        time_column.is_(None),
+    )
+
+
+def iter_keyset_batches(query, time_column, id_column, batch_size, after=None):
+    """
+    按键集分批遍历查询结果，每批只保留 batch_size 行在内存中
+
+    Args:
+        query: 已应用筛选条件的查询（不含排序）
+        time_column: 排序时间列
+        id_column: 主键列
+        batch_size: 每批行数
+        after: 起始游标位置 (time_value, row_id)，为None时从头开始
+
+    Yields:
+        每批的行列表
+    """
+    while True:
+        batch_query = query
+        if after is not None:
+            batch_query = batch_query.filter(
+                keyset_after(time_column, id_column, *after)
+            )
+        rows = (
+            batch_query.order_by(*keyset_order(time_column, id_column))
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            return
+        yield rows
+        if len(rows) < batch_size:
+            return
+        last = rows[-1]
+        after = (getattr(last, time_column.key), getattr(last, id_column.key))
+
+
+def iter_id_batches(query, id_column, batch_size):
+    """
+    按主键升序分批遍历查询结果（即创建顺序，用于不分页返回全部结果的旧版接口）
+
+    Args:
+        query: 已应用筛选条件的查询（不含排序）
+        id_column: 主键列
+        batch_size: 每批行数
+
+    Yields:
+        每批的行列表
+    """
+    last_id = None
+    while True:
+        batch_query = query
+        if last_id is not None:
+            batch_query = batch_query.filter(id_column > last_id)
+        rows = batch_query.order_by(id_column).limit(batch_size).all()
+        if not rows:
+            return
+        yield rows
+        if len(rows) < batch_size:
+            return
+        last_id = getattr(rows[-1], id_column.key)
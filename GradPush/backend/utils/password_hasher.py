@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+密码哈希服务
+
+bcrypt的计算强度可通过 BCRYPT_ROUNDS 配置（每加1耗时翻倍）：
+- 哈希和校验在有上限的线程池中执行（bcrypt计算时释放GIL），
+  登录高峰时最多占用 PASSWORD_HASH_WORKERS 个CPU，不会拖慢其他接口
+- 排队的任务超过 PASSWORD_HASH_MAX_PENDING 个时直接拒绝（PasswordHasherBusy），
+  避免请求线程全部阻塞在等待哈希上；应用统一将其转换为503响应（BUSY_MESSAGE）
+- 已保存的哈希强度与配置不一致时，登录成功后按新强度重新哈希（needs_rehash）
+
+未调用 init_app 时（如初始化脚本）在当前线程中直接计算。
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import bcrypt
+
+# bcrypt默认的计算强度
+DEFAULT_ROUNDS = 12
+
+# 任务过多被拒绝时返回给用户的提示
+BUSY_MESSAGE = "登录人数过多，请稍后重试"
+
+
+class PasswordHasherBusy(Exception):
+    """
+    等待计算的任务过多
+    """
+
+
+class PasswordHasher:
+    """
+    密码哈希服务
+    """
+
+    def __init__(self, app=None):
+        self.rounds = DEFAULT_ROUNDS
+        self.max_pending = 0
+        self._executor = None
+        self._pending = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.rounds = app.config.get("BCRYPT_ROUNDS", DEFAULT_ROUNDS)
+        workers = app.config.get("PASSWORD_HASH_WORKERS", 2)
+        self.max_pending = app.config.get("PASSWORD_HASH_MAX_PENDING", 64)
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="password-hash"
+        )
+        app.extensions["password_hasher"] = self
+
+    def _run(self, func, *args, wait=False):
+        if self._executor is None:
+            return func(*args)
+
+        with self._lock:
+            if not wait and self._pending >= self.max_pending:
+                raise PasswordHasherBusy("等待计算的密码哈希任务过多")
+            self._pending += 1
+        try:
+            return self._executor.submit(func, *args).result()
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def _hash(self, password):
+        return bcrypt.hashpw(
+            password.encode("utf-8"), bcrypt.gensalt(self.rounds)
+        ).decode("utf-8")
+
+    @staticmethod
+    def _verify(password, hashed):
+        try:
+            return bcrypt.checkpw(password.encode("utf-8"), hashed.encode("utf-8"))
+        except ValueError:
+            # 数据库中的密码不是有效的bcrypt哈希
+            return False
+
+    def hash(self, password, wait=False):
+        """
+        按配置的计算强度哈希密码
+
+        wait为True时不受排队上限限制，等待计算完成（用于后台任务）
+        """
+        return self._run(self._hash, password, wait=wait)
+
+    def verify(self, password, hashed):
+        """
+        校验密码是否与哈希匹配
+        """
+        if not password or not hashed:
+            return False
+        return self._run(self._verify, password, hashed)
+
+    @staticmethod
+    def get_rounds(hashed):
+        """
+        读取哈希的计算强度（格式：$2b$12$...），无法解析时返回None
+        """
+        parts = (hashed or "").split("$")
+        if len(parts) < 4 or not parts[2].isdigit():
+            return None
+        return int(parts[2])
+
+    def needs_rehash(self, hashed):
+        """
+        哈希的计算强度与当前配置不一致时需要重新哈希
+        """
+        return self.get_rounds(hashed) != self.rounds
@@ -0,0 +1,349 @@
+# -*- coding: utf-8 -*-
+"""
+学生排名计算模块
+
+基于集合运算生成推免成绩排名报表：
+- 使用窗口函数 RANK() OVER (PARTITION BY major_id ...) 在数据库中计算专业内排名（含并列）
+- 一次查询加载筛选范围内所有学生的已通过申请
+- 单次遍历构建响应数据
+
+无论学生人数多少，查询次数保持不变。
+
+同时维护物化排名表 student_ranking（按 major_id, student_id 存储名次）：
+- 学生综合成绩变化时只调整受影响成绩区间内学生的名次，不重新排序整个专业
+- 专业人数变化（新增/删除学生、转专业）时按专业整体重建
+- 学生仪表盘直接按学号读取一行（只读，排名表不一致时即时计算名次）
+- 排名表与学生数据不一致的专业由 reconcile_rankings 按专业重建
+"""
+
+from sqlalchemy import func, or_, select, update, delete, insert
+from extensions import db
+from models import Student, Application, Faculty, Department, Major, StudentRanking
+
+
+def _ranking_filters(faculty_id=None, department_id=None, major_id=None):
+    """
+    构建学生筛选条件
+    """
+    conditions = []
+    if faculty_id is not None:
+        conditions.append(Student.faculty_id == faculty_id)
+    if department_id is not None:
+        conditions.append(Student.department_id == department_id)
+    if major_id is not None:
+        conditions.append(Student.major_id == major_id)
+    return conditions
+
+
+def _application_item(app):
+    """
+    将已通过申请转换为排名报表中的加分项目
+    """
+    return {
+        "project_name": app.project_name,
+        "award_time": app.award_date.isoformat() if app.award_date else None,
+        "self_eval_score": app.self_score,
+        "score_basis": app.description,
+        "college_approved_score": app.final_score,
+        "total_score": app.final_score,
+    }
+
+
+def build_student_ranking(faculty_id=None, department_id=None, major_id=None):
+    """
+    生成学生推免成绩排名
+
+    Args:
+        faculty_id: 学院ID（可选）
+        department_id: 系ID（可选）
+        major_id: 专业ID（可选）
+
+    Returns:
+        按综合成绩降序排列的学生信息列表
+    """
+    conditions = _ranking_filters(faculty_id, department_id, major_id)
+    score = func.coalesce(Student.comprehensive_score, 0.0)
+
+    # 1. 学生基本信息 + 专业内排名 + 专业内人数（一次查询）
+    ranking_query = (
+        db.session.query(
+            Student,
+            Faculty.name.label("faculty_name"),
+            Department.name.label("department_name"),
+            Major.name.label("major_name"),
+            func.rank()
+            .over(partition_by=Student.major_id, order_by=score.desc())
+            .label("major_ranking"),
+            func.count(Student.id)
+            .over(partition_by=Student.major_id)
+            .label("major_total_students"),
+        )
+        .outerjoin(Faculty, Student.faculty_id == Faculty.id)
+        .outerjoin(Department, Student.department_id == Department.id)
+        .outerjoin(Major, Student.major_id == Major.id)
+        .filter(*conditions)
+        .order_by(score.desc(), Student.id)
+    )
+    rows = ranking_query.all()
+
+    # 2. 筛选范围内所有学生的已通过申请（一次查询，按学生分组）
+    student_ids = select(Student.student_id).where(*conditions)
+    applications = (
+        Application.query.filter(
+            Application.status == "approved",
+            Application.application_type.in_(["academic", "comprehensive"]),
+            Application.student_id.in_(student_ids),
+        )
+        .order_by(Application.student_id, Application.id)
+        .all()
+    )
+
+    items_by_student = {}
+    for app in applications:
+        items = items_by_student.setdefault(
+            app.student_id, {"academic": [], "comprehensive": []}
+        )
+        items[app.application_type].append(_application_item(app))
+
+    # 3. 单次遍历构建响应数据
+    result = []
+    for sequence, row in enumerate(rows, start=1):
+        student = row.Student
+        specialty_total = student.academic_specialty_total or 0.0
+        performance_total = student.comprehensive_performance_total or 0.0
+        comprehensive_score = student.comprehensive_score or 0.0
+        items = items_by_student.get(student.student_id, {})
+
+        result.append(
+            {
+                "id": student.id,
+                "student_id": student.student_id,
+                "student_name": student.student_name,
+                "departmentId": student.department_id,
+                "department": row.department_name or "未知系别",
+                "majorId": student.major_id,
+                "major": row.major_name or "未知专业",
+                "facultyId": student.faculty_id,
+                "faculty": row.faculty_name or "未知学院",
+                "gender": student.gender,
+                "cet4_score": student.cet4_score,
+                "cet6_score": student.cet6_score,
+                "gpa": student.gpa,
+                "academic_score": student.academic_score,
+                "academic_specialty_total": specialty_total,
+                "comprehensive_performance_total": performance_total,
+                # 保持向后兼容，total_score使用comprehensive_score的值
+                "total_score": comprehensive_score,
+                "major_ranking": row.major_ranking,
+                "major_total_students": row.major_total_students,
+                "specialty_score": specialty_total,
+                "comprehensive_score": comprehensive_score,
+                # 考核综合成绩总分（学术专长分 + 综合表现分）
+                "total_comprehensive_score": specialty_total + performance_total,
+                # 综合成绩（学业成绩*权重 + 学术专长分 + 综合表现分）
+                "final_comprehensive_score": comprehensive_score,
+                # 向前端提供final_score字段，用于显示综合成绩
+                "final_score": comprehensive_score,
+                "sequence": sequence,
+                "academicItems": items.get("academic", []),
+                "comprehensiveItems": items.get("comprehensive", []),
+            }
+        )
+
+    return result
+
+
+def _ranking_score(student):
+    """
+    参与排名的成绩（未计算综合成绩的学生按0分处理，与排名报表一致）
+    """
+    return student.comprehensive_score or 0.0
+
+
+def rebuild_major_ranking(major_id=None):
+    """
+    使用窗口函数重建专业排名（不提交事务）
+
+    Args:
+        major_id: 专业ID，为None时重建所有专业
+    """
+    score = func.coalesce(Student.comprehensive_score, 0.0)
+    ranking_select = select(
+        Student.major_id,
+        Student.student_id,
+        score,
+        func.rank().over(partition_by=Student.major_id, order_by=score.desc()),
+        func.count(Student.id).over(partition_by=Student.major_id),
+    ).where(Student.major_id.isnot(None))
+
+    delete_stmt = delete(StudentRanking)
+    if major_id is not None:
+        ranking_select = ranking_select.where(Student.major_id == major_id)
+        delete_stmt = delete_stmt.where(StudentRanking.major_id == major_id)
+
+    db.session.execute(delete_stmt)
+    db.session.execute(
+        insert(StudentRanking).from_select(
+            ["major_id", "student_id", "score", "ranking", "total_students"],
+            ranking_select,
+        )
+    )
+
+
+def remove_student_ranking(student_id):
+    """
+    从排名表中移除学生，并将其后的学生名次前移（不提交事务）
+    """
+    entry = StudentRanking.query.filter_by(student_id=student_id).first()
+    if not entry:
+        return
+
+    major_id, old_score = entry.major_id, entry.score
+    db.session.delete(entry)
+    db.session.flush()
+
+    # 成绩低于该学生的名次减1，专业人数减1
+    db.session.execute(
+        update(StudentRanking)
+        .where(StudentRanking.major_id == major_id, StudentRanking.score < old_score)
+        .values(ranking=StudentRanking.ranking - 1)
+    )
+    db.session.execute(
+        update(StudentRanking)
+        .where(StudentRanking.major_id == major_id)
+        .values(total_students=StudentRanking.total_students - 1)
+    )
+
+
+def update_student_ranking(student):
+    """
+    学生综合成绩变化后增量更新其在专业内的名次（不提交事务）
+
+    名次定义为 1 + 专业内成绩严格高于该学生的人数（并列取相同名次）。
+    成绩由 old 变为 new 时，只有成绩位于两者之间的学生名次变化：
+    - new > old：成绩在 [old, new) 的学生名次加1
+    - new < old：成绩在 [new, old) 的学生名次减1
+
+    Args:
+        student: Student对象（综合成绩已更新）
+
+    Returns:
+        更新后的StudentRanking对象，学生无专业时返回None
+    """
+    entry = StudentRanking.query.filter_by(student_id=student.student_id).first()
+
+    # 转专业：先从原专业移除
+    if entry and entry.major_id != student.major_id:
+        remove_student_ranking(student.student_id)
+        entry = None
+
+    if not student.major_id:
+        return None
+
+    # 新加入排名的学生会改变专业人数，按专业整体重建
+    if entry is None:
+        db.session.flush()
+        rebuild_major_ranking(student.major_id)
+        return StudentRanking.query.filter_by(student_id=student.student_id).first()
+
+    old_score = entry.score
+    new_score = _ranking_score(student)
+    if new_score == old_score:
+        return entry
+
+    others = (
+        StudentRanking.major_id == entry.major_id,
+        StudentRanking.student_id != entry.student_id,
+    )
+    if new_score > old_score:
+        db.session.execute(
+            update(StudentRanking)
+            .where(
+                *others,
+                StudentRanking.score >= old_score,
+                StudentRanking.score < new_score,
+            )
+            .values(ranking=StudentRanking.ranking + 1)
+        )
+    else:
+        db.session.execute(
+            update(StudentRanking)
+            .where(
+                *others,
+                StudentRanking.score >= new_score,
+                StudentRanking.score < old_score,
+            )
+            .values(ranking=StudentRanking.ranking - 1)
+        )
+
+    higher_count = (
+        db.session.query(func.count())
+        .select_from(StudentRanking)
+        .filter(*others, StudentRanking.score > new_score)
+        .scalar()
+    )
+    entry.score = new_score
+    entry.ranking = higher_count + 1
+    return entry
+
+
+def get_student_ranking(student):
+    """
+    读取学生的专业排名（只读，不修改排名表）
+
+    排名表与学生当前专业或综合成绩不一致时（如排名表上线前的历史数据、
+    直接修改了学生成绩），按学生表即时计算名次，排名表由 reconcile_rankings 修复。
+
+    Returns:
+        StudentRanking对象（即时计算时为未加入session的临时对象），学生无专业时返回None
+    """
+    score = _ranking_score(student)
+    entry = StudentRanking.query.filter_by(student_id=student.student_id).first()
+    if (
+        entry is not None
+        and entry.major_id == student.major_id
+        and entry.score == score
+    ):
+        return entry
+    if not student.major_id:
+        return None
+
+    ranking_score = func.coalesce(Student.comprehensive_score, 0.0)
+    higher_count, total_students = (
+        db.session.query(func.count().filter(ranking_score > score), func.count())
+        .filter(Student.major_id == student.major_id)
+        .one()
+    )
+    return StudentRanking(
+        major_id=student.major_id,
+        student_id=student.student_id,
+        score=score,
+        ranking=higher_count + 1,
+        total_students=total_students,
+    )
+
+
+def reconcile_rankings(fix=False):
+    """
+    核对排名表与学生当前专业、综合成绩是否一致
+
+    :param fix: 为True时按专业重建存在不一致的排名（不提交事务）
+    :return: (不一致的学生数量, 已重建的专业数量)
+    """
+    rows = (
+        db.session.query(Student.major_id, StudentRanking.major_id)
+        .outerjoin(StudentRanking, StudentRanking.student_id == Student.student_id)
+        .filter(
+            or_(
+                # 缺少排名记录（有专业的学生）或排名记录在其他专业
+                StudentRanking.major_id.is_distinct_from(Student.major_id),
+                StudentRanking.score != func.coalesce(Student.comprehensive_score, 0.0),
+            )
+        )
+        .all()
+    )
+    major_ids = {major_id for row in rows for major_id in row if major_id is not None}
+    if fix:
+        for major_id in sorted(major_ids):
+            rebuild_major_ranking(major_id)
+    return len(rows), len(major_ids) if fix else 0
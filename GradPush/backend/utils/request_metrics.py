@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+"""
+请求耗时与SQL查询统计
+
+通过Flask的 before_request / after_request 和SQLAlchemy的游标执行事件，
+记录每个请求的耗时、SQL查询次数、数据库总耗时和最慢的一条SQL：
+- 按路由（请求方法 + URL规则）汇总，耗时和查询次数使用固定分桶的直方图，内存占用与请求量无关
+- 超过 SLOW_REQUEST_MS 毫秒或 SLOW_REQUEST_QUERIES 条SQL的请求记录警告日志（便于发现N+1查询）
+- REQUEST_METRICS_SERVER_TIMING 开启时在响应头 Server-Timing 中返回本次请求的耗时和查询次数，
+  可在浏览器开发者工具中查看
+
+同时更新 utils/metrics.py 中的Prometheus计数器（只增不减，不随 reset 清空）。
+
+统计数据保存在当前进程中，多进程部署时每个工作进程各自统计。
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from datetime import datetime
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from utils.metrics import (
+    HTTP_REQUEST_DURATION,
+    HTTP_REQUESTS,
+    UPLOAD_BYTES,
+    UPLOAD_REQUESTS,
+)
+
+# 请求耗时分桶（毫秒）
+DURATION_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# SQL查询次数分桶
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# 保存的SQL语句最大长度
+MAX_STATEMENT_LENGTH = 500
+
+
+class Histogram:
+    """
+    固定分桶的直方图（非线程安全，由调用方加锁）
+    """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        # 最后一个桶为 +Inf
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        """
+        累计计数 [(上限, 不大于该上限的数量)]，最后一项的上限为 "+Inf"
+        """
+        result = []
+        total = 0
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def quantile(self, q):
+        """
+        按分桶估计分位数（返回所在桶的上限，落在最后一个桶时返回最大的上限）
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            if total >= rank:
+                return bound
+        return self.buckets[-1]
+
+
+class _RequestStats:
+    """
+    单个请求的统计（只在处理该请求的线程中修改）
+    """
+
+    __slots__ = ("started_at", "queries", "db_time", "slowest_time", "slowest_sql")
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.slowest_time = 0.0
+        self.slowest_sql = None
+
+    def add_query(self, statement, elapsed):
+        self.queries += 1
+        self.db_time += elapsed
+        if elapsed > self.slowest_time:
+            self.slowest_time = elapsed
+            self.slowest_sql = statement
+
+
+class RouteStats:
+    """
+    单个路由的汇总统计
+    """
+
+    def __init__(self, method, rule, endpoint):
+        self.method = method
+        self.rule = rule
+        self.endpoint = endpoint
+        self.errors = 0
+        self.duration = Histogram(DURATION_BUCKETS)
+        self.queries = Histogram(QUERY_COUNT_BUCKETS)
+        self.db_ms = 0.0
+        self.max_ms = 0.0
+        self.max_queries = 0
+        self.slowest_sql = None
+        self.slowest_sql_ms = 0.0
+
+    def to_dict(self):
+        count = self.duration.count
+        return {
+            "method": self.method,
+            "route": self.rule,
+            "endpoint": self.endpoint,
+            "count": count,
+            "errors": self.errors,
+            "totalMs": round(self.duration.sum, 1),
+            "avgMs": round(self.duration.sum / count, 1) if count else None,
+            "maxMs": round(self.max_ms, 1),
+            "p50Ms": self.duration.quantile(0.5),
+            "p95Ms": self.duration.quantile(0.95),
+            "avgQueries": round(self.queries.sum / count, 1) if count else None,
+            "maxQueries": self.max_queries,
+            "avgDbMs": round(self.db_ms / count, 1) if count else None,
+            "slowestSql": self.slowest_sql,
+            "slowestSqlMs": round(self.slowest_sql_ms, 1),
+            "durationHistogram": self.duration.cumulative(),
+            "queryHistogram": self.queries.cumulative(),
+        }
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_started_at = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started_at = getattr(context, "_metrics_started_at", None)
+    if started_at is None or not has_request_context():
+        return
+    stats = g.get("request_stats")
+    if stats is not None:
+        stats.add_query(statement, time.perf_counter() - started_at)
+
+
+class RequestMetrics:
+    """
+    请求统计
+    """
+
+    def __init__(self, app=None):
+        self.routes = {}
+        self.since = datetime.now()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.server_timing = app.config.get("REQUEST_METRICS_SERVER_TIMING", False)
+        self.slow_ms = app.config.get("SLOW_REQUEST_MS", 1000)
+        self.slow_queries = app.config.get("SLOW_REQUEST_QUERIES", 100)
+        self.logger = app.logger
+
+        if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+            event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.extensions["request_metrics"] = self
+
+    @staticmethod
+    def _before_request():
+        g.request_stats = _RequestStats()
+
+    def _after_request(self, response):
+        stats = g.pop("request_stats", None)
+        if stats is None:
+            return response
+
+        elapsed_ms = (time.perf_counter() - stats.started_at) * 1000
+        db_ms = stats.db_time * 1000
+        # 未匹配到路由的请求（如404）合并统计，避免路由数量无限增长
+        rule = request.url_rule.rule if request.url_rule else "<unmatched>"
+        self.record(
+            request.method,
+            rule,
+            request.endpoint,
+            response.status_code,
+            elapsed_ms,
+            stats,
+        )
+        HTTP_REQUESTS.inc(request.method, rule, str(response.status_code))
+        HTTP_REQUEST_DURATION.observe(elapsed_ms / 1000, request.method, rule)
+        if request.mimetype == "multipart/form-data":
+            UPLOAD_REQUESTS.inc()
+            UPLOAD_BYTES.inc(amount=request.content_length or 0)
+
+        if self.server_timing:
+            response.headers["Server-Timing"] = (
+                f"app;dur={elapsed_ms:.1f}, "
+                f'db;dur={db_ms:.1f};desc="{stats.queries} queries"'
+            )
+
+        if elapsed_ms >= self.slow_ms or stats.queries >= self.slow_queries:
+            self.logger.warning(
+                "慢请求 %s %s: 耗时%.1fms，SQL %d条共%.1fms，最慢SQL %.1fms: %s",
+                request.method,
+                request.path,
+                elapsed_ms,
+                stats.queries,
+                db_ms,
+                stats.slowest_time * 1000,
+                (stats.slowest_sql or "")[:MAX_STATEMENT_LENGTH],
+            )
+        return response
+
+    def record(self, method, rule, endpoint, status_code, elapsed_ms, stats):
+        """
+        将一次请求的统计计入路由汇总
+        """
+        key = (method, rule)
+        with self._lock:
+            route = self.routes.get(key)
+            if route is None:
+                route = self.routes[key] = RouteStats(method, rule, endpoint)
+            if status_code >= 500:
+                route.errors += 1
+            route.duration.observe(elapsed_ms)
+            route.queries.observe(stats.queries)
+            route.db_ms += stats.db_time * 1000
+            route.max_ms = max(route.max_ms, elapsed_ms)
+            route.max_queries = max(route.max_queries, stats.queries)
+            if stats.slowest_time * 1000 > route.slowest_sql_ms:
+                route.slowest_sql_ms = stats.slowest_time * 1000
+                route.slowest_sql = (stats.slowest_sql or "")[:MAX_STATEMENT_LENGTH]
+
+    def snapshot(self, sort="totalMs"):
+        """
+        所有路由的统计（默认按总耗时降序）
+        """
+        with self._lock:
+            routes = [route.to_dict() for route in self.routes.values()]
+        routes.sort(key=lambda item: item.get(sort) or 0, reverse=True)
+        return {"since": self.since.isoformat(timespec="seconds"), "routes": routes}
+
+    def reset(self):
+        with self._lock:
+            self.routes = {}
+            self.since = datetime.now()
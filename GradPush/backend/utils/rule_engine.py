@@ -1,8 +1,209 @@
-from models import Rule, RuleCalculation
+from flask import current_app
+from models import Rule, RuleCalculation, Application
 from extensions import db
+from utils.score_aggregator import apply_application_transitions
+from sqlalchemy import update
+from sqlalchemy.orm import joinedload
+from types import MappingProxyType
+from typing import NamedTuple
+import threading
 import json
 
 
+class CompiledRuleTree(NamedTuple):
+    """
+    编译后的规则树（不可变）
+
+    - scores: 规范化路径元组（去除空格的节点名称）→ 已应用最大值限制的分数
+    - default_score: 路径未匹配时的分数
+    """
+
+    rule_id: int
+    version: tuple
+    scores: MappingProxyType
+    default_score: float
+
+    def score(self, tree_path):
+        """
+        按路径查询分数（单次字典查找）
+        """
+        key = _normalize_path(tree_path)
+        if key is None:
+            return 0.0
+        return self.scores.get(key, self.default_score)
+
+
+def _normalize_name(name):
+    """
+    规范化节点名称（忽略空格进行比较）
+    """
+    return name.replace(" ", "")
+
+
+def _normalize_path(tree_path):
+    """
+    规范化路径为元组，路径无效时返回None
+    """
+    if not tree_path or not isinstance(tree_path, list):
+        return None
+    if not all(isinstance(name, str) for name in tree_path):
+        return None
+    return tuple(_normalize_name(name) for name in tree_path)
+
+
+# 编译过程中标记分数无效的路径（原实现在该路径上解析分数出错时整体返回0）
+_INVALID = object()
+
+
+def _collect_node_scores(node, prefix, scores):
+    """
+    收集以node为终点的所有路径分数，同名路径取最大值
+    """
+    name = node.get("dimension", {}).get("name", "")
+    path = prefix + (_normalize_name(name),)
+
+    try:
+        node_score = float(node.get("score", 0.0))
+    except (TypeError, ValueError):
+        node_score = _INVALID
+
+    existing = scores.get(path)
+    if existing is _INVALID or node_score is _INVALID:
+        scores[path] = _INVALID
+    elif existing is None or node_score > existing:
+        scores[path] = node_score
+
+    for child in node.get("children") or []:
+        _collect_node_scores(child, path, scores)
+
+
+def _calculation_version(calculation):
+    """
+    计算配置的版本标识，用于判断缓存是否失效
+    """
+    return (calculation.id, calculation.updated_at)
+
+
+def compile_rule_tree(calculation):
+    """
+    将树结构计算配置编译为路径 → 分数的不可变映射
+
+    与逐层遍历的匹配方式保持一致：
+    - 同一根节点下同名路径取最大分数
+    - 多个根节点均匹配时取第一个得分为正的根节点
+    - 非正分数视为未匹配（得0分）
+    - 最大值限制和四位小数取整在编译时完成
+    """
+    rule_id = calculation.rule_id
+    version = _calculation_version(calculation)
+    empty = CompiledRuleTree(rule_id, version, MappingProxyType({}), 0.0)
+
+    params = calculation.parameters
+    if not params:
+        return empty
+
+    # 处理参数：如果已经是字典则直接使用，否则解析JSON字符串
+    if not isinstance(params, dict):
+        try:
+            params = json.loads(params)
+        except (TypeError, ValueError):
+            return empty
+        if not isinstance(params, dict):
+            return empty
+
+    # 获取树结构配置（从tree.structure路径获取）
+    tree_config = params.get("tree", {}).get("structure", {})
+    if not tree_config:
+        return empty
+
+    max_score = (
+        float(calculation.max_score) if calculation.max_score is not None else None
+    )
+
+    def finalize(score):
+        # 应用最大值限制
+        if max_score is not None:
+            score = min(score, max_score)
+        return round(score, 4)
+
+    # 按根节点顺序合并，先得到正分（或出错）的根节点优先
+    settled = {}
+    root_node = tree_config.get("root", {})
+    for child in root_node.get("children") or []:
+        child_scores = {}
+        _collect_node_scores(child, (), child_scores)
+        for path, score in child_scores.items():
+            if path in settled:
+                continue
+            if score is _INVALID:
+                settled[path] = 0.0
+            elif score > 0:
+                settled[path] = finalize(score)
+
+    return CompiledRuleTree(
+        rule_id,
+        version,
+        MappingProxyType(settled),
+        finalize(0.0),
+    )
+
+
+# 编译结果缓存：rule_id → CompiledRuleTree
+_compiled_cache = {}
+_compiled_cache_lock = threading.Lock()
+
+
+def get_compiled_tree(calculation):
+    """
+    获取计算配置的编译结果，按 (rule_id, 版本) 缓存
+    """
+    version = _calculation_version(calculation)
+    compiled = _compiled_cache.get(calculation.rule_id)
+    if compiled is not None and compiled.version == version:
+        return compiled
+
+    compiled = compile_rule_tree(calculation)
+    with _compiled_cache_lock:
+        _compiled_cache[calculation.rule_id] = compiled
+    return compiled
+
+
+def invalidate_rule_cache(rule_id=None):
+    """
+    使规则的编译缓存失效
+
+    :param rule_id: 规则ID，为None时清空全部缓存
+    """
+    with _compiled_cache_lock:
+        if rule_id is None:
+            _compiled_cache.clear()
+        else:
+            _compiled_cache.pop(rule_id, None)
+
+
+# 批量计分时每批加载的申请数量
+BATCH_CHUNK_SIZE = 500
+
+
+def application_student_data(application):
+    """
+    将申请的动态系数转换为规则计算所需的学生数据
+    （与前端提交的student_data格式一致，tree_path为路径数组）
+    """
+    coefficients = application.dynamic_coefficients
+    student_data = dict(coefficients) if isinstance(coefficients, dict) else {}
+    tree_path = student_data.get("tree_path")
+    if isinstance(tree_path, str):
+        student_data["tree_path"] = tree_path.split(",")
+    student_data.setdefault("faculty_id", application.faculty_id)
+    return student_data
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
 class RuleEngine:
     """
     规则引擎核心类，用于处理推免综合成绩计算的规则匹配与分值计算
@@ -31,14 +232,6 @@ class RuleEngine:
 
         # 遍历所有规则
         for rule in rules:
-            # 创建临时对象用于条件评估
-            class TempApplication:
-                def __init__(self, data):
-                    self.__dict__ = data
-
-            application = TempApplication(student_data)
-            student = TempApplication(student_data)
-
             # 直接匹配规则并计算分数
             score = self.calculate_score(rule, student_data)
             matched_rules.append(rule)
@@ -58,6 +251,122 @@ class RuleEngine:
             "matched_rules": matched_details,
         }
 
+    def batch_calculate(self, items, chunk_size=BATCH_CHUNK_SIZE):
+        """
+        批量计算分数
+
+        参数:
+        - items: 计分项列表，每项为以下形式之一：
+          {"application_id": 申请ID, "rule_id": 可选，默认使用申请关联的规则}
+          {"student_data": 学生数据字典, "rule_id": 规则ID}
+        - chunk_size: 每批加载的申请数量
+
+        返回:
+        - 与items顺序一致的结果列表，每项包含 index、application_id、rule_id、score、error
+        """
+        # 1. 分批加载涉及的申请
+        application_ids = sorted(
+            {item["application_id"] for item in items if item.get("application_id")}
+        )
+        applications = {}
+        for chunk in _chunks(application_ids, chunk_size):
+            for application in Application.query.filter(Application.id.in_(chunk)):
+                applications[application.id] = application
+
+        # 2. 解析每项的规则和学生数据
+        resolved = []
+        for index, item in enumerate(items):
+            application_id = item.get("application_id")
+            rule_id = item.get("rule_id")
+            student_data = item.get("student_data")
+            error = None
+
+            if application_id:
+                application = applications.get(application_id)
+                if application is None:
+                    error = "申请不存在"
+                else:
+                    rule_id = rule_id or application.rule_id
+                    student_data = application_student_data(application)
+            elif not isinstance(student_data, dict):
+                error = "缺少学生数据"
+
+            if error is None and not rule_id:
+                error = "缺少规则ID"
+
+            resolved.append((index, application_id, rule_id, student_data, error))
+
+        # 3. 一次查询预加载所有规则及其计算配置
+        rule_ids = {entry[2] for entry in resolved if entry[4] is None}
+        rules = {}
+        for chunk in _chunks(sorted(rule_ids), chunk_size):
+            for rule in Rule.query.options(joinedload(Rule.calculation)).filter(
+                Rule.id.in_(chunk)
+            ):
+                rules[rule.id] = rule
+
+        # 4. 逐项计分（规则树编译结果已缓存，每项为一次字典查找）
+        results = []
+        for index, application_id, rule_id, student_data, error in resolved:
+            score = None
+            if error is None:
+                rule = rules.get(rule_id)
+                if rule is None:
+                    error = "规则不存在"
+                else:
+                    score = self.calculate_score(rule, student_data)
+            results.append(
+                {
+                    "index": index,
+                    "application_id": application_id,
+                    "rule_id": rule_id,
+                    "score": score,
+                    "error": error,
+                }
+            )
+
+        return results
+
+    def write_back_scores(self, results, chunk_size=BATCH_CHUNK_SIZE):
+        """
+        将批量计分结果批量写回申请的final_score（不提交事务）
+
+        已通过申请的分数变化在同一事务中增量更新学生统计数据和专业排名。
+
+        返回:
+        - 更新的申请数量
+        """
+        rows = [
+            {"id": result["application_id"], "final_score": result["score"]}
+            for result in results
+            if result["application_id"] and result["error"] is None
+        ]
+        transitions = []
+        for chunk in _chunks(rows, chunk_size):
+            scores = {row["id"]: row["final_score"] for row in chunk}
+            # 锁定申请记录，避免与并发审核重复计算分数变化
+            approved = (
+                db.session.query(
+                    Application.id,
+                    Application.student_id,
+                    Application.final_score,
+                    Application.application_type,
+                )
+                .filter(Application.id.in_(scores), Application.status == "approved")
+                .with_for_update()
+            )
+            for application_id, student_id, final_score, application_type in approved:
+                transitions.append(
+                    (
+                        student_id,
+                        ("approved", final_score, application_type),
+                        ("approved", scores[application_id], application_type),
+                    )
+                )
+            db.session.execute(update(Application), chunk)
+        apply_application_transitions(transitions)
+        return len(rows)
+
     def calculate_score(self, rule, student_data):
         """
         计算单个规则的分数
@@ -70,9 +379,10 @@ class RuleEngine:
             if isinstance(rule, int):
                 from models import Rule
 
-                rule = Rule.query.get(rule)
+                rule_id = rule
+                rule = Rule.query.get(rule_id)
                 if not rule:
-                    print(f"规则ID {rule} 不存在")
+                    current_app.logger.warning(f"规则ID {rule_id} 不存在")
                     return 0.0
 
             if not rule:
@@ -95,102 +405,22 @@ class RuleEngine:
 
     def _calculate_tree_score(self, calculation, student_data):
         """
-        树结构计算得分
+        树结构计算得分（使用缓存的编译结果，按路径单次查找）
         """
-        if not calculation.parameters:
+        # 转换student_data为字典格式
+        if isinstance(student_data, dict):
+            student_dict = student_data
+        elif hasattr(student_data, "__dict__"):
+            student_dict = {
+                k: v for k, v in student_data.__dict__.items() if not k.startswith("_")
+            }
+        else:
             return 0.0
 
-        try:
-            # 处理参数：如果已经是字典则直接使用，否则解析JSON字符串
-            if isinstance(calculation.parameters, dict):
-                params = calculation.parameters
-            else:
-                params = json.loads(calculation.parameters)
-                if not isinstance(params, dict):
-                    return 0.0
-
-            # 获取树结构配置（从tree.structure路径获取）
-            tree_config = params.get("tree", {}).get("structure", {})
-            if not tree_config:
-                return 0.0
-
-            # 转换student_data为字典格式
-            student_dict = {}
-            if hasattr(student_data, "__dict__"):
-                student_dict = {
-                    k: v
-                    for k, v in student_data.__dict__.items()
-                    if not k.startswith("_")
-                }
-            elif isinstance(student_data, dict):
-                student_dict = student_data
-            else:
-                return 0.0
-
-            # 提取树路径
-            tree_path = student_dict.get("tree_path", [])
-
-            if not tree_path or not isinstance(tree_path, list):
-                return 0.0
+        # 提取树路径
+        tree_path = student_dict.get("tree_path", [])
 
-            # 查找匹配路径的分数
-            def find_node_score(node, path_index=0):
-                if not node:
-                    return 0.0
-                if path_index >= len(tree_path):
-                    return 0.0
-
-                # 获取节点名称（从dimension.name中获取）
-                node_name = node.get("dimension", {}).get("name", "")
-                expected_name = tree_path[path_index]
-                # 忽略空格进行比较
-                node_name_stripped = node_name.replace(" ", "")
-                expected_name_stripped = expected_name.replace(" ", "")
-
-                # 检查当前节点是否匹配路径中的当前项（忽略空格）
-                if node_name_stripped == expected_name_stripped:
-                    # 如果是最后一个路径项，返回该节点的分数
-                    if path_index == len(tree_path) - 1:
-                        node_score = float(node.get("score", 0.0))
-                        return node_score
-                    # 否则继续向下查找所有子节点，找到最深层的匹配节点
-                    max_score = 0.0
-                    for child in node.get("children", []):
-                        score = find_node_score(child, path_index + 1)
-                        if score > max_score:
-                            max_score = score
-                    if max_score > 0:
-                        return max_score
-
-                # 没有找到匹配的路径
-                return 0.0
-
-            # 从根节点的子节点开始匹配路径
-            found = False
-            result = 0.0
-
-            # 获取根节点
-            root_node = tree_config.get("root", {})
-
-            # 遍历根节点的所有子节点
-            for child in root_node.get("children", []):
-                # 从根节点的子节点开始匹配路径
-                score = find_node_score(child, 0)
-                if score > 0:
-                    result = score
-                    found = True
-                    break
-
-            if not found:
-                result = 0.0
-
-            # 应用最大值限制
-            if calculation.max_score is not None:
-                result = min(result, float(calculation.max_score))
-
-            return round(result, 4)
-        except Exception as e:
-            return 0.0
+        return get_compiled_tree(calculation).score(tree_path)
 
 
 # 创建规则引擎实例
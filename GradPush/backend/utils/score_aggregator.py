@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+"""
+学生成绩增量汇总模块
+
+申请状态变化时，根据该申请变化前后的 (status, final_score, application_type)
+计算增量，调整学生的已通过申请分数之和，无需重新查询该学生的全部申请：
+- academic_specialty_raw / comprehensive_performance_raw 保存未应用满分限制的分数之和
+- academic_specialty_total / comprehensive_performance_total 为应用学院满分限制后的值
+- 综合成绩和专业排名随之更新
+
+所有函数都不提交事务，由调用方与申请本身的修改在同一事务中提交。
+并发审核同一学生的申请时，学生记录先加行锁（SELECT ... FOR UPDATE），
+增量以 UPDATE ... SET raw = raw + :delta 在数据库中原子地累加。
+定期运行 reconcile_student_scores 全量核对增量结果和专业排名表，报告并可修复偏差。
+"""
+
+from sqlalchemy import bindparam, case, func, update
+from extensions import db
+from models import Student, Application, FacultyScoreSettings
+from utils.ranking_engine import reconcile_rankings, update_student_ranking
+
+# 计入学生统计的申请类型与对应的原始分数字段
+AGGREGATED_TYPES = {
+    "academic": "academic_specialty_raw",
+    "comprehensive": "comprehensive_performance_raw",
+}
+
+# 核对时允许的浮点误差
+DRIFT_TOLERANCE = 1e-6
+
+# 修复偏差时每批加载的学生数量
+RECONCILE_CHUNK_SIZE = 500
+
+
+def application_state(application):
+    """
+    提取申请中影响学生统计的状态
+    """
+    return (
+        application.status,
+        application.final_score,
+        application.application_type,
+    )
+
+
+def _contribution(state):
+    """
+    计算申请状态对学生各类原始分数之和的贡献
+
+    :return: {原始分数字段: 分数}
+    """
+    if state is None:
+        return {}
+    status, final_score, application_type = state
+    if status != "approved" or final_score is None:
+        return {}
+    field = AGGREGATED_TYPES.get(application_type)
+    if not field:
+        return {}
+    return {field: final_score}
+
+
+def _load_score_settings(students):
+    """
+    一次查询加载学生所属学院的成绩设置
+
+    :return: {学院ID: FacultyScoreSettings}
+    """
+    faculty_ids = {student.faculty_id for student in students}
+    faculty_ids.discard(None)
+    if not faculty_ids:
+        return {}
+    return {
+        settings.faculty_id: settings
+        for settings in FacultyScoreSettings.query.filter(
+            FacultyScoreSettings.faculty_id.in_(faculty_ids)
+        )
+    }
+
+
+def _apply_score_settings(student, faculty_score_settings):
+    """
+    根据原始分数之和和学院成绩设置更新学生的各项总分、综合成绩和专业排名
+
+    :param faculty_score_settings: 学生所属学院的成绩设置，未配置时为None
+    """
+    # 如果没有学院成绩设置（或设置项为空），使用默认值
+    specialty_max, performance_max, academic_weight = 15.0, 5.0, 80.0
+    if faculty_score_settings:
+        if faculty_score_settings.specialty_max_score is not None:
+            specialty_max = faculty_score_settings.specialty_max_score
+        if faculty_score_settings.performance_max_score is not None:
+            performance_max = faculty_score_settings.performance_max_score
+        if faculty_score_settings.academic_score_weight is not None:
+            academic_weight = faculty_score_settings.academic_score_weight
+
+    # 应用满分限制
+    student.academic_specialty_total = min(
+        student.academic_specialty_raw or 0.0, specialty_max
+    )
+    student.comprehensive_performance_total = min(
+        student.comprehensive_performance_raw or 0.0, performance_max
+    )
+
+    # 计算综合成绩：学业成绩 * 学业成绩权重 / 100 + 学术专长总分 + 综合表现总分
+    calculated_score = (
+        (student.academic_score or 0.0) * academic_weight / 100
+        + student.academic_specialty_total
+        + student.comprehensive_performance_total
+    )
+    # 更新综合成绩，保留四位小数
+    student.comprehensive_score = round(calculated_score, 4)
+
+    # 增量调整该学生在专业排名表中的位置
+    update_student_ranking(student)
+
+
+def recompute_student_scores(student, score_settings=None):
+    """
+    重新汇总学生的全部已通过申请（不提交事务）
+
+    用于原始分数尚未初始化的学生以及核对修复
+
+    :param score_settings: _load_score_settings() 的结果，为None时按学生单独查询
+    """
+    if score_settings is None:
+        score_settings = _load_score_settings([student])
+
+    sums = dict.fromkeys(AGGREGATED_TYPES.values(), 0.0)
+    rows = (
+        db.session.query(
+            Application.application_type, func.sum(Application.final_score)
+        )
+        .filter(
+            Application.student_id == student.student_id,
+            Application.status == "approved",
+            Application.final_score.isnot(None),
+            Application.application_type.in_(AGGREGATED_TYPES),
+        )
+        .group_by(Application.application_type)
+    )
+    for application_type, total in rows:
+        sums[AGGREGATED_TYPES[application_type]] = total or 0.0
+
+    for field, total in sums.items():
+        setattr(student, field, total)
+    _apply_score_settings(student, score_settings.get(student.faculty_id))
+
+
+def apply_application_transition(student_id, old_state, new_state):
+    """
+    根据单个申请的状态变化增量更新学生统计数据（不提交事务）
+
+    :param student_id: 学号
+    :param old_state: 变化前的 application_state()，新建申请时为None
+    :param new_state: 变化后的 application_state()，删除申请时为None
+    :return: 更新后的Student对象，状态变化不影响统计或学生不存在时返回None
+    """
+    students = apply_application_transitions([(student_id, old_state, new_state)])
+    return students[0] if students else None
+
+
+def apply_application_transitions(transitions):
+    """
+    根据多个申请的状态变化增量更新学生统计数据（不提交事务）
+
+    同一学生的增量先合并，每个学生只更新一次。学生记录按学号顺序加行锁，
+    增量在数据库中原子累加；原始分数尚未初始化的学生按数据库中的申请全量汇总
+    （申请本身的修改需已写入或在session中）。
+
+    :param transitions: [(学号, 变化前的状态, 变化后的状态)]
+    :return: 更新后的Student对象列表
+    """
+    deltas = {}
+    for student_id, old_state, new_state in transitions:
+        old_contribution = _contribution(old_state)
+        new_contribution = _contribution(new_state)
+        student_deltas = deltas.setdefault(
+            student_id, dict.fromkeys(AGGREGATED_TYPES.values(), 0.0)
+        )
+        for field in student_deltas:
+            student_deltas[field] += new_contribution.get(
+                field, 0.0
+            ) - old_contribution.get(field, 0.0)
+
+    student_ids = sorted(
+        student_id
+        for student_id, student_deltas in deltas.items()
+        if any(student_deltas.values())
+    )
+    fields = list(AGGREGATED_TYPES.values())
+    increment = (
+        update(Student.__table__)
+        .where(Student.student_id == bindparam("_student_id"))
+        .values(
+            {
+                field: getattr(Student, field) + bindparam(f"_{field}")
+                for field in fields
+            }
+        )
+    )
+
+    updated = []
+    flushed = False
+    for start in range(0, len(student_ids), RECONCILE_CHUNK_SIZE):
+        chunk = student_ids[start : start + RECONCILE_CHUNK_SIZE]
+        # 加行锁并重新读取，其他事务提交的增量在锁释放后可见
+        students = (
+            Student.query.filter(Student.student_id.in_(chunk))
+            .order_by(Student.student_id)
+            .with_for_update()
+            .populate_existing()
+            .all()
+        )
+        score_settings = _load_score_settings(students)
+
+        initialized = {
+            student.student_id
+            for student in students
+            if all(getattr(student, field) is not None for field in fields)
+        }
+        if initialized:
+            db.session.execute(
+                increment,
+                [
+                    {
+                        "_student_id": student_id,
+                        **{f"_{field}": deltas[student_id][field] for field in fields},
+                    }
+                    for student_id in sorted(initialized)
+                ],
+            )
+            # 重新读取累加后的原始分数（这些学生在session中没有未写入的修改）
+            Student.query.filter(
+                Student.student_id.in_(initialized)
+            ).populate_existing().all()
+
+        for student in students:
+            if student.student_id in initialized:
+                _apply_score_settings(student, score_settings.get(student.faculty_id))
+            else:
+                # 原始分数尚未初始化，全量汇总一次（申请本身的修改需先写入）
+                if not flushed:
+                    db.session.flush()
+                    flushed = True
+                recompute_student_scores(student, score_settings)
+            updated.append(student)
+    return updated
+
+
+def reconcile_student_scores(fix=False, max_report=100):
+    """
+    全量核对学生的原始分数之和与已通过申请是否一致，以及专业排名表是否与学生数据一致
+
+    :param fix: 为True时重新汇总存在偏差的学生并重建排名不一致的专业（不提交事务）
+    :param max_report: 报告中最多列出的偏差条数
+    :return: 核对报告
+    """
+    # 一次分组查询汇总所有学生的已通过申请
+    expected = {}
+    rows = (
+        db.session.query(
+            Application.student_id,
+            *(
+                func.sum(
+                    case(
+                        (
+                            Application.application_type == application_type,
+                            Application.final_score,
+                        ),
+                        else_=0.0,
+                    )
+                )
+                for application_type in AGGREGATED_TYPES
+            ),
+        )
+        .filter(
+            Application.status == "approved",
+            Application.final_score.isnot(None),
+        )
+        .group_by(Application.student_id)
+    )
+    for student_id, *totals in rows:
+        expected[student_id] = dict(zip(AGGREGATED_TYPES.values(), totals))
+
+    checked = 0
+    drifts = []
+    drifted_ids = []
+    student_rows = db.session.query(
+        Student.student_id,
+        *(getattr(Student, field) for field in AGGREGATED_TYPES.values()),
+    )
+    for student_id, *actual_totals in student_rows:
+        checked += 1
+        student_expected = expected.get(student_id, {})
+        drifted = False
+        for field, actual in zip(AGGREGATED_TYPES.values(), actual_totals):
+            should_be = student_expected.get(field) or 0.0
+            # 尚未初始化（None）的学生按0分核对
+            if abs((actual or 0.0) - should_be) > DRIFT_TOLERANCE:
+                drifted = True
+                if len(drifts) < max_report:
+                    drifts.append(
+                        {
+                            "student_id": student_id,
+                            "field": field,
+                            "expected": should_be,
+                            "actual": actual,
+                        }
+                    )
+        if drifted:
+            drifted_ids.append(student_id)
+
+    fixed = 0
+    if fix:
+        for start in range(0, len(drifted_ids), RECONCILE_CHUNK_SIZE):
+            chunk = drifted_ids[start : start + RECONCILE_CHUNK_SIZE]
+            students = Student.query.filter(Student.student_id.in_(chunk)).all()
+            score_settings = _load_score_settings(students)
+            for student in students:
+                recompute_student_scores(student, score_settings)
+                fixed += 1
+
+    # 修复成绩后再核对排名表
+    stale_rankings, rebuilt_majors = reconcile_rankings(fix=fix)
+
+    return {
+        "checked_students": checked,
+        "drifted_students": len(drifted_ids),
+        "fixed_students": fixed,
+        "drifts": drifts,
+        "stale_rankings": stale_rankings,
+        "rebuilt_majors": rebuilt_majors,
+    }
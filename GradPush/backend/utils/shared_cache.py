@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+多进程共享缓存模块
+
+根据配置创建 cachelib 缓存实例，供需要在多个工作进程之间共享状态的模块使用
+（如组织架构缓存的版本号）。
+
+配置项：
+- SHARED_CACHE_TYPE: filesystem（默认，同一主机的多个进程）、redis（多台主机）、
+  null（不共享，仅适用于单进程部署）
+- SHARED_CACHE_DIR: filesystem 类型的缓存目录
+- SHARED_CACHE_REDIS_URL: redis 类型的连接地址（需要安装 redis 包）
+"""
+
+import threading
+from flask import current_app
+
+_shared_cache = None
+_shared_cache_initialized = False
+_shared_cache_lock = threading.Lock()
+
+
+def _create_shared_cache(config):
+    """
+    根据配置创建缓存实例，不可用时返回None
+    """
+    cache_type = (config.get("SHARED_CACHE_TYPE") or "null").lower()
+    if cache_type == "null":
+        return None
+
+    try:
+        import cachelib
+    except ImportError:
+        current_app.logger.warning("未安装cachelib，共享缓存已禁用")
+        return None
+
+    prefix = config.get("SHARED_CACHE_KEY_PREFIX", "gradpush:")
+    if cache_type == "filesystem":
+        return cachelib.FileSystemCache(
+            config["SHARED_CACHE_DIR"], default_timeout=0, threshold=0
+        )
+    if cache_type == "redis":
+        try:
+            import redis
+        except ImportError:
+            current_app.logger.warning("未安装redis，共享缓存已禁用")
+            return None
+        client = redis.from_url(config["SHARED_CACHE_REDIS_URL"])
+        return cachelib.RedisCache(client, key_prefix=prefix, default_timeout=0)
+
+    current_app.logger.warning(f"不支持的共享缓存类型: {cache_type}，共享缓存已禁用")
+    return None
+
+
+def get_shared_cache(config):
+    """
+    获取进程内唯一的共享缓存实例
+
+    Args:
+        config: 应用配置（current_app.config）
+
+    Returns:
+        cachelib缓存实例，未启用共享缓存时返回None
+    """
+    global _shared_cache, _shared_cache_initialized
+    if not _shared_cache_initialized:
+        with _shared_cache_lock:
+            if not _shared_cache_initialized:
+                _shared_cache = _create_shared_cache(config)
+                _shared_cache_initialized = True
+    return _shared_cache
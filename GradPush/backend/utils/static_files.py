@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+上传文件的静态服务
+
+/uploads 下的各个路由统一通过 send_upload 返回文件：
+- 强ETag：文件名含sha256的附件（见 utils/blob_store.py）使用sha256，其他文件使用大小和修改时间
+- 按文件类别设置Cache-Control（UPLOAD_CACHE_CONTROL），内容寻址的附件和缩略图内容不会变化，
+  使用 immutable 长期缓存；头像、推免文件等在有效期内不再请求，过期后重新验证
+- 处理 If-None-Match / If-Modified-Since（返回304）和 Range / If-Range（返回206，大PDF可分段加载）
+- Content-Type按扩展名确定，Content-Disposition使用RFC 5987编码的文件名（支持中文）
+- 开启 X_ACCEL_REDIRECT 时只返回响应头和 X-Accel-Redirect，由nginx发送文件内容
+
+nginx配置示例（X_ACCEL_REDIRECT_LOCATIONS 中的目录 → internal location）：
+
+    location /internal/uploads/ {
+        internal;
+        alias /path/to/backend/uploads/;
+    }
+    location /internal/thumbnails/ {
+        internal;
+        alias /path/to/backend/cache/thumbnails/;
+    }
+"""
+
+import mimetypes
+import os
+from urllib.parse import quote
+from flask import current_app, send_file
+from werkzeug.exceptions import NotFound
+from werkzeug.utils import safe_join
+
+# 按扩展名指定的Content-Type（其他扩展名由mimetypes推断）
+CONTENT_TYPES = {
+    ".pdf": "application/pdf",
+    ".txt": "text/plain; charset=utf-8",
+    ".doc": "application/msword",
+    ".docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    ".xls": "application/vnd.ms-excel",
+    ".xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    ".ppt": "application/vnd.ms-powerpoint",
+    ".pptx": "application/vnd.openxmlformats-officedocument.presentationml.presentation",
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".gif": "image/gif",
+    ".webp": "image/webp",
+}
+
+# 浏览器可直接显示的文件（默认内联显示，其他文件作为附件下载）
+INLINE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".webp", ".pdf")
+
+# 内容不会变化的文件使用的缓存类别
+IMMUTABLE_CATEGORY = "immutable"
+
+
+def content_type(filename):
+    """
+    按扩展名确定Content-Type
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    if ext in CONTENT_TYPES:
+        return CONTENT_TYPES[ext]
+    return mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+
+def is_inline(filename):
+    return filename.lower().endswith(INLINE_EXTENSIONS)
+
+
+def _accel_location(path):
+    """
+    文件对应的nginx internal location，不在配置的目录中时返回None
+    """
+    for folder, location in current_app.config["X_ACCEL_REDIRECT_LOCATIONS"].items():
+        folder = os.path.abspath(folder)
+        if os.path.commonpath([folder, path]) == folder:
+            relative = os.path.relpath(path, folder).replace(os.sep, "/")
+            return location.rstrip("/") + "/" + quote(relative)
+    return None
+
+
+def send_upload(
+    folder,
+    filename,
+    category,
+    as_attachment=None,
+    download_name=None,
+    mimetype=None,
+    etag=None,
+):
+    """
+    返回上传目录中的文件
+
+    Args:
+        folder: 文件所在目录
+        filename: 相对于目录的文件名（来自URL，会检查目录遍历）
+        category: 缓存类别（UPLOAD_CACHE_CONTROL 的键）
+        as_attachment: 是否作为附件下载，默认按扩展名决定
+        download_name: 下载时的文件名，默认为文件名
+        mimetype: Content-Type，默认按扩展名确定
+        etag: 强ETag，默认由sha256或大小和修改时间生成
+
+    Raises:
+        NotFound: 文件不存在
+    """
+    from utils.blob_store import content_sha256
+
+    path = safe_join(folder, filename)
+    if path is None or not os.path.isfile(path):
+        raise NotFound()
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    basename = os.path.basename(path)
+    download_name = download_name or basename
+
+    # 文件名含sha256的文件内容不会变化
+    sha256 = content_sha256(basename)
+    if etag is None:
+        etag = sha256 or f"{stat.st_size:x}-{stat.st_mtime_ns:x}"
+    if sha256:
+        category = IMMUTABLE_CATEGORY
+    if as_attachment is None:
+        as_attachment = not is_inline(download_name)
+
+    response = send_file(
+        path,
+        mimetype=mimetype or content_type(download_name),
+        as_attachment=as_attachment,
+        download_name=download_name,
+        conditional=True,
+        etag=etag,
+    )
+    policies = current_app.config["UPLOAD_CACHE_CONTROL"]
+    response.headers["Cache-Control"] = policies.get(category, policies["default"])
+
+    # 由nginx发送文件内容（nginx同样处理Range），304等无响应体的情况直接返回
+    if current_app.config["X_ACCEL_REDIRECT"] and response.status_code in (200, 206):
+        location = _accel_location(path)
+        if location:
+            response.close()
+            headers = response.headers.copy()
+            for header in ("Content-Length", "Content-Range"):
+                headers.pop(header, None)
+            headers["X-Accel-Redirect"] = location
+            response = current_app.response_class(status=200, headers=headers)
+    return response
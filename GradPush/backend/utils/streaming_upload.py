@@ -0,0 +1,492 @@
+# -*- coding: utf-8 -*-
+"""
+流式上传
+
+上传的文件边接收边写入临时文件并计算sha256，超过大小限制时立即中止，
+保存时将临时文件原子重命名到目标路径，不会留下写了一半的文件：
+- 视图在读取 request.form / request.files 之前调用 limit_uploads() 设置大小限制，
+  multipart解析器每写入一块数据即检查（StreamingUploadRequest），
+  超限的文件不会完整写入磁盘
+- 大文件使用断点续传（ResumableUploadStore，接口见 blueprints/upload_bp.py）：
+  先创建上传会话，再按 Upload-Offset 分块追加，中断后查询已接收的字节数继续上传，
+  上传完成后在创建/更新申请时通过 uploadIds 引用
+
+配置项：
+- UPLOAD_TEMP_FOLDER: 临时文件和断点续传会话目录（与 UPLOAD_FOLDER 在同一文件系统时重命名为原子操作）
+- UPLOAD_CHUNK_SIZE: 断点续传建议的分块大小
+- UPLOAD_SESSION_TTL_HOURS: 断点续传会话的保留时间
+"""
+
+import errno
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from flask import Request, current_app, request
+from werkzeug.exceptions import RequestEntityTooLarge
+from utils.file_lock import file_lock
+
+# 复制和读取请求体的块大小
+CHUNK_SIZE = 1024 * 1024
+
+# 表单中非文件字段和multipart分隔符的预留字节数
+FORM_OVERHEAD = 1024 * 1024
+
+_UPLOAD_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+class UploadTooLarge(RequestEntityTooLarge):
+    """
+    上传的文件超过大小限制（HTTP 413）
+    """
+
+    def __init__(self, message):
+        super().__init__(description=message)
+        self.message = message
+
+
+class UploadError(Exception):
+    """
+    断点续传会话不存在、偏移不一致或内容校验失败
+
+    Args:
+        message: 错误信息
+        status: HTTP状态码
+        offset: 服务端已接收的字节数（偏移不一致时返回给客户端）
+    """
+
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.offset = offset
+
+
+class UploadPolicy:
+    """
+    一次请求中上传文件的大小限制
+
+    Args:
+        max_file_size: 单个文件的最大字节数（None为不限制）
+        max_total_size: 所有文件合计的最大字节数（None为不限制）
+        file_message: 超过单个文件限制时的提示，{filename} 替换为文件名
+        total_message: 超过总大小限制时的提示
+    """
+
+    def __init__(
+        self,
+        max_file_size=None,
+        max_total_size=None,
+        file_message="单个文件大小超过限制: {filename}",
+        total_message="总文件大小超过限制",
+    ):
+        self.max_file_size = max_file_size
+        self.max_total_size = max_total_size
+        self.file_message = file_message
+        self.total_message = total_message
+        self.total_size = 0
+
+    def consume(self, filename, file_size, amount):
+        """
+        计入新接收的 amount 字节（file_size 为该文件已接收的总字节数）
+
+        Raises:
+            UploadTooLarge: 超过单个文件或总大小限制
+        """
+        if self.max_file_size is not None and file_size > self.max_file_size:
+            raise UploadTooLarge(self.file_message.format(filename=filename))
+        self.total_size += amount
+        if self.max_total_size is not None and self.total_size > self.max_total_size:
+            raise UploadTooLarge(self.total_message)
+
+
+def move_atomic(source, target):
+    """
+    将文件重命名到目标路径；跨文件系统时先复制到目标目录的临时文件再重命名
+    """
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    try:
+        os.replace(source, target)
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(target), prefix=".tmp-")
+    try:
+        with open(source, "rb") as src, os.fdopen(fd, "wb") as dst:
+            shutil.copyfileobj(src, dst, CHUNK_SIZE)
+        os.replace(temp_path, target)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    os.remove(source)
+
+
+class HashingTempFile:
+    """
+    边写入边计算sha256的临时文件
+
+    multipart解析器向其中写入文件内容，解析完成后作为 FileStorage.stream 供视图使用；
+    未调用 commit() 保存的临时文件在请求结束关闭时删除。
+    """
+
+    def __init__(self, folder, policy=None, filename=None):
+        os.makedirs(folder, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(dir=folder, prefix=".upload-")
+        self._file = os.fdopen(fd, "w+b")
+        self._digest = hashlib.sha256()
+        self.policy = policy
+        self.filename = filename
+        self.size = 0
+        self.committed = False
+
+    def write(self, data):
+        size = self.size + len(data)
+        if self.policy is not None:
+            self.policy.consume(self.filename, size, len(data))
+        self._digest.update(data)
+        self._file.write(data)
+        self.size = size
+        return len(data)
+
+    @property
+    def sha256(self):
+        return self._digest.hexdigest()
+
+    def __getattr__(self, name):
+        # read、readline、seek、tell等方法由底层文件提供
+        return getattr(self._file, name)
+
+    def __iter__(self):
+        return iter(self._file)
+
+    def commit(self, target):
+        """
+        将临时文件原子重命名到目标路径
+        """
+        self._file.close()
+        move_atomic(self.path, target)
+        self.committed = True
+
+    def close(self):
+        self._file.close()
+        if not self.committed:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+
+class StreamingUploadRequest(Request):
+    """
+    设置了 upload_policy 的请求，multipart中的文件直接写入 HashingTempFile
+    """
+
+    upload_policy = None
+    _upload_streams = ()
+
+    def _get_file_stream(
+        self, total_content_length, content_type, filename=None, content_length=None
+    ):
+        if self.upload_policy is None:
+            return super()._get_file_stream(
+                total_content_length, content_type, filename, content_length
+            )
+        stream = HashingTempFile(
+            current_app.config["UPLOAD_TEMP_FOLDER"], self.upload_policy, filename
+        )
+        # 解析中途超限时文件尚未加入 request.files，由 close() 统一清理
+        self._upload_streams = [*self._upload_streams, stream]
+        return stream
+
+    def close(self):
+        super().close()
+        for stream in self._upload_streams:
+            stream.close()
+
+
+def limit_uploads(policy):
+    """
+    为当前请求设置上传大小限制（需在读取 request.form / request.files 之前调用）
+
+    Raises:
+        UploadTooLarge: 请求体的 Content-Length 已超过总大小限制
+    """
+    if (
+        policy.max_total_size is not None
+        and request.content_length is not None
+        and request.content_length > policy.max_total_size + FORM_OVERHEAD
+    ):
+        raise UploadTooLarge(policy.total_message)
+    request.upload_policy = policy
+
+
+def spool_upload(file_storage):
+    """
+    返回已写入临时文件并计算了sha256的上传文件
+
+    通过 limit_uploads 解析的文件直接返回解析时写入的临时文件，
+    否则将其复制到新的临时文件；调用方负责 commit() 或 close()。
+    """
+    stream = file_storage.stream
+    if isinstance(stream, HashingTempFile):
+        return stream
+
+    # 未通过 limit_uploads 解析的文件，复制时计算哈希
+    folder = current_app.config["UPLOAD_TEMP_FOLDER"]
+    hashing = HashingTempFile(folder, filename=file_storage.filename)
+    try:
+        shutil.copyfileobj(stream, hashing, CHUNK_SIZE)
+    except BaseException:
+        hashing.close()
+        raise
+    return hashing
+
+
+def store_upload(file_storage, target):
+    """
+    保存上传的文件到目标路径
+
+    Returns:
+        dict: size（字节数）、sha256
+    """
+    stream = spool_upload(file_storage)
+    try:
+        stream.commit(target)
+    finally:
+        stream.close()
+    return {"size": stream.size, "sha256": stream.sha256}
+
+
+class ResumableUploadStore:
+    """
+    断点续传会话
+
+    每个会话对应 <folder>/<上传ID>.json（文件名、声明的大小和sha256、所属用户）
+    和 <folder>/<上传ID>.part（已接收的数据），已接收的字节数即 .part 文件的大小，
+    多个工作进程都可以继续同一个会话：追加、完成和取消时持有 <上传ID>.lock 的文件锁，
+    在锁内重新读取已接收的字节数，超时重试等并发的相同偏移请求只有一个能写入。
+    """
+
+    def __init__(self, app=None):
+        self.folder = None
+        self.ttl = 24 * 3600
+        # 本进程中各会话的哈希状态：上传ID → (已哈希的字节数, sha256对象)
+        self._hashers = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.folder = os.path.join(app.config["UPLOAD_TEMP_FOLDER"], "sessions")
+        self.ttl = app.config.get("UPLOAD_SESSION_TTL_HOURS", 24) * 3600
+        os.makedirs(self.folder, exist_ok=True)
+        app.extensions["resumable_uploads"] = self
+
+    def _paths(self, upload_id):
+        if not _UPLOAD_ID_PATTERN.match(upload_id or ""):
+            raise UploadError("上传会话不存在", 404)
+        base = os.path.join(self.folder, upload_id)
+        return f"{base}.json", f"{base}.part"
+
+    def _upload_lock(self, upload_id):
+        # 锁文件由 prune 随会话一起清理
+        self._paths(upload_id)
+        return file_lock(os.path.join(self.folder, f"{upload_id}.lock"))
+
+    def _forget(self, upload_id):
+        with self._lock:
+            self._hashers.pop(upload_id, None)
+
+    def _write_meta(self, upload_id, meta):
+        meta_path, _ = self._paths(upload_id)
+        temp_path = f"{meta_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(temp_path, meta_path)
+
+    def create(self, filename, size, owner, content_type=None, sha256=None):
+        """
+        创建上传会话
+
+        Args:
+            filename: 原始文件名
+            size: 文件大小（字节）
+            owner: 所属用户ID，只有该用户可以继续上传和使用
+            content_type: 文件类型
+            sha256: 客户端计算的sha256（可选，上传完成后校验）
+        """
+        self.prune()
+        upload_id = uuid.uuid4().hex
+        meta = {
+            "id": upload_id,
+            "filename": filename,
+            "size": size,
+            "contentType": content_type,
+            "expectedSha256": sha256.lower() if sha256 else None,
+            "sha256": None,
+            "owner": owner,
+            "createdAt": time.time(),
+        }
+        _, part_path = self._paths(upload_id)
+        open(part_path, "wb").close()
+        self._write_meta(upload_id, meta)
+        meta["offset"] = 0
+        return meta
+
+    def load(self, upload_id, owner):
+        """
+        读取会话，offset 为已接收的字节数
+
+        Raises:
+            UploadError: 会话不存在或不属于该用户
+        """
+        meta_path, part_path = self._paths(upload_id)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            meta["offset"] = os.path.getsize(part_path)
+        except (OSError, ValueError):
+            raise UploadError("上传会话不存在", 404)
+        if meta.get("owner") != owner:
+            raise UploadError("上传会话不存在", 404)
+        return meta
+
+    def _hasher(self, upload_id, part_path, offset):
+        with self._lock:
+            state = self._hashers.get(upload_id)
+        if state is not None and state[0] == offset:
+            return state[1]
+        # 会话由其他进程接收过数据，重新计算已接收部分的哈希
+        digest = hashlib.sha256()
+        with open(part_path, "rb") as source:
+            remaining = offset
+            while remaining > 0:
+                chunk = source.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                digest.update(chunk)
+                remaining -= len(chunk)
+        return digest
+
+    def append(self, upload_id, owner, offset, stream):
+        """
+        从 offset 处追加数据（读取 stream 直到结束），返回更新后的会话
+
+        中途断开时已写入的数据保留，客户端查询 offset 后继续上传。
+
+        Raises:
+            UploadError: 偏移与已接收的字节数不一致（409）、超过声明的大小（413）、
+                         sha256校验失败（422，会话被删除）
+        """
+        with self._upload_lock(upload_id):
+            meta = self.load(upload_id, owner)
+            if meta["sha256"]:
+                raise UploadError("文件已上传完成", 409, offset=meta["offset"])
+            if offset != meta["offset"]:
+                raise UploadError("上传偏移不一致", 409, offset=meta["offset"])
+
+            _, part_path = self._paths(upload_id)
+            digest = self._hasher(upload_id, part_path, offset)
+            received = offset
+            try:
+                with open(part_path, "ab") as output:
+                    while True:
+                        chunk = stream.read(CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        if received + len(chunk) > meta["size"]:
+                            raise UploadError(
+                                "上传的数据超过声明的文件大小", 413, offset=received
+                            )
+                        output.write(chunk)
+                        digest.update(chunk)
+                        received += len(chunk)
+            finally:
+                with self._lock:
+                    self._hashers[upload_id] = (received, digest)
+
+            meta["offset"] = received
+            if received == meta["size"]:
+                sha256 = digest.hexdigest()
+                expected = meta.get("expectedSha256")
+                if expected and expected != sha256:
+                    self._remove(upload_id)
+                    raise UploadError("文件校验失败，请重新上传", 422)
+                meta["sha256"] = sha256
+                self._write_meta(
+                    upload_id, {k: v for k, v in meta.items() if k != "offset"}
+                )
+                with self._lock:
+                    self._hashers.pop(upload_id, None)
+            return meta
+
+    def claim(self, upload_id, owner, target):
+        """
+        将已完成的上传移动到目标路径并结束会话
+
+        Returns:
+            dict: 会话信息（filename、size、contentType、sha256）
+
+        Raises:
+            UploadError: 会话不存在或尚未上传完成
+        """
+        with self._upload_lock(upload_id):
+            meta = self.load(upload_id, owner)
+            if not meta["sha256"]:
+                raise UploadError(f"文件尚未上传完成: {meta['filename']}", 409)
+            meta_path, part_path = self._paths(upload_id)
+            move_atomic(part_path, target)
+            os.remove(meta_path)
+        self._forget(upload_id)
+        return meta
+
+    def delete(self, upload_id, owner):
+        """
+        取消上传会话
+        """
+        with self._upload_lock(upload_id):
+            self.load(upload_id, owner)
+            self._remove(upload_id)
+
+    def _remove(self, upload_id):
+        for path in self._paths(upload_id):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self._forget(upload_id)
+
+    def prune(self):
+        """
+        删除超过保留时间未收到数据的会话
+        """
+        expire_time = time.time() - self.ttl
+        sessions = {}
+        for name in os.listdir(self.folder):
+            path = os.path.join(self.folder, name)
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                continue
+            # 同一会话的 .json、.part 和写了一半的临时文件按最后修改时间一起清理
+            upload_id = name.split(".", 1)[0]
+            paths, latest = sessions.get(upload_id, ([], 0))
+            sessions[upload_id] = (paths + [path], max(latest, mtime))
+
+        for upload_id, (paths, latest) in sessions.items():
+            if latest >= expire_time:
+                continue
+            for path in paths:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._forget(upload_id)
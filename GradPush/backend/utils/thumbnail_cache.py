@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+"""
+缩略图缓存
+
+审核页面中的证明材料多为数MB的手机照片，预览列表改为加载缩小后的图片：
+- 按尺寸预设（THUMBNAIL_PRESETS）用Pillow生成WebP（浏览器支持时）或JPEG缩略图，
+  按EXIF方向旋转，最长边不超过预设尺寸
+- 缓存键为文件内容的sha256（内容寻址的附件直接取自文件名，旧附件使用路径、大小和修改时间），
+  同一内容只生成一次，文件内容变化后自动使用新的缩略图
+- 首次请求时生成，或在申请保存后由后台线程预先生成WebP缩略图（warm）
+- 缓存目录总大小超过 THUMBNAIL_CACHE_MAX_SIZE 时按最近访问时间删除最久未使用的缩略图
+- 安装PyMuPDF时同样为PDF生成第一页的预览图，未安装时不生成
+
+配置项：
+- THUMBNAIL_FOLDER: 缩略图缓存目录
+- THUMBNAIL_PRESETS: 尺寸预设名称 → 最长边像素
+- THUMBNAIL_WARM_PRESETS: 保存申请后预先生成的预设
+- THUMBNAIL_CACHE_MAX_SIZE: 缓存目录的最大字节数
+- THUMBNAIL_WORKERS: 预先生成缩略图的线程数
+"""
+
+import hashlib
+import io
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageOps
+
+# 可生成缩略图的图片扩展名
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".webp", ".bmp")
+
+# 输出格式 → (Pillow格式名, MIME类型, 保存参数)
+FORMATS = {
+    "webp": ("WEBP", "image/webp", {"quality": 80, "method": 4}),
+    "jpeg": (
+        "JPEG",
+        "image/jpeg",
+        {"quality": 85, "optimize": True, "progressive": True},
+    ),
+}
+
+# 预先生成的格式（审核页面使用的浏览器都支持WebP）
+WARM_FORMAT = "webp"
+
+# 超过上限后清理到上限的该比例，避免每次写入都清理
+EVICT_RATIO = 0.9
+
+# 生成同一缩略图时使用的锁数量（按缓存键分配）
+_LOCK_STRIPES = 64
+
+
+def _render_pdf_page(path, size):
+    """
+    将PDF第一页渲染为图片，未安装PyMuPDF时返回None
+    """
+    try:
+        import fitz
+    except ImportError:
+        return None
+
+    with fitz.open(path) as document:
+        if document.page_count == 0:
+            return None
+        page = document.load_page(0)
+        # 按最长边缩放渲染，避免先渲染整页大图
+        zoom = size / max(page.rect.width, page.rect.height, 1)
+        pixmap = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+        return Image.open(io.BytesIO(pixmap.tobytes("png")))
+
+
+class ThumbnailCache:
+    """
+    磁盘缩略图缓存
+    """
+
+    def __init__(self, app=None):
+        self.folder = None
+        self.presets = {}
+        self.warm_presets = ()
+        self.max_size = 0
+        self.logger = None
+        self._executor = None
+        self._size = None
+        self._size_lock = threading.Lock()
+        self._locks = [threading.Lock() for _ in range(_LOCK_STRIPES)]
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.folder = app.config["THUMBNAIL_FOLDER"]
+        self.presets = dict(app.config.get("THUMBNAIL_PRESETS", {}))
+        self.warm_presets = tuple(app.config.get("THUMBNAIL_WARM_PRESETS", ()))
+        self.max_size = app.config.get("THUMBNAIL_CACHE_MAX_SIZE", 0)
+        # 后台线程中没有应用上下文，直接使用应用的日志记录器
+        self.logger = app.logger
+        self._executor = ThreadPoolExecutor(
+            max_workers=app.config.get("THUMBNAIL_WORKERS", 1),
+            thread_name_prefix="thumbnail",
+        )
+        os.makedirs(self.folder, exist_ok=True)
+        app.extensions["thumbnail_cache"] = self
+
+    @staticmethod
+    def supports(filename):
+        """
+        是否可以为该文件生成缩略图（PDF需要安装PyMuPDF）
+        """
+        ext = os.path.splitext(filename)[1].lower()
+        return ext in IMAGE_EXTENSIONS or ext == ".pdf"
+
+    @staticmethod
+    def choose_format(accept_mimetypes):
+        """
+        浏览器明确支持WebP时使用WebP，否则使用JPEG
+        """
+        for mimetype, quality in accept_mimetypes:
+            if mimetype == "image/webp" and quality > 0:
+                return "webp"
+        return "jpeg"
+
+    @staticmethod
+    def source_key(source_path, content_hash=None):
+        """
+        缓存键：文件内容的sha256，未知时由路径、大小和修改时间计算
+        """
+        if content_hash:
+            return content_hash
+        stat = os.stat(source_path)
+        identity = f"{os.path.abspath(source_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+        return hashlib.sha256(identity.encode("utf-8")).hexdigest()
+
+    def _cache_path(self, key, preset, fmt):
+        return os.path.join(self.folder, key[:2], f"{key}-{preset}.{fmt}")
+
+    def get(self, source_path, preset, fmt="jpeg", content_hash=None):
+        """
+        获取缩略图路径，不存在时生成
+
+        Returns:
+            str: 缩略图路径；文件无法生成缩略图时返回None
+
+        Raises:
+            KeyError: 尺寸预设不存在
+            FileNotFoundError: 源文件不存在
+        """
+        size = self.presets[preset]
+        key = self.source_key(source_path, content_hash)
+        path = self._cache_path(key, preset, fmt)
+        if self._touch(path):
+            return path
+
+        with self._locks[int(key[:8], 16) % _LOCK_STRIPES]:
+            # 其他线程可能已经生成
+            if self._touch(path):
+                return path
+            try:
+                image = self._render(source_path, size)
+            except (OSError, ValueError, Image.DecompressionBombError) as e:
+                self.logger.warning("生成缩略图失败 %s: %s", source_path, e)
+                return None
+            if image is None:
+                return None
+            written = self._write(image, path, fmt)
+
+        self._account(written)
+        return path
+
+    def _touch(self, path):
+        # 命中时更新修改时间，作为清理时的最近访问时间
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    @staticmethod
+    def _render(source_path, size):
+        if source_path.lower().endswith(".pdf"):
+            image = _render_pdf_page(source_path, size)
+            if image is None:
+                return None
+        else:
+            with Image.open(source_path) as source:
+                # JPEG解码时直接按接近的比例缩小，大幅减少解码大照片的时间和内存
+                source.draft("RGB", (size, size))
+                image = ImageOps.exif_transpose(source)
+
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+        image.thumbnail((size, size), Image.LANCZOS)
+        return image
+
+    @staticmethod
+    def _write(image, path, fmt):
+        pil_format, _, options = FORMATS[fmt]
+        if pil_format == "JPEG" and image.mode == "RGBA":
+            # JPEG不支持透明通道，透明部分填充为白色
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+
+        folder = os.path.dirname(path)
+        os.makedirs(folder, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=folder, prefix=".thumb-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                image.save(f, pil_format, **options)
+            os.replace(temp_path, path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        return os.path.getsize(path)
+
+    @staticmethod
+    def mimetype(fmt):
+        return FORMATS[fmt][1]
+
+    def warm(self, sources):
+        """
+        在后台线程中为文件预先生成 THUMBNAIL_WARM_PRESETS 中的缩略图
+
+        Args:
+            sources: [(源文件路径, 内容sha256或None)]
+        """
+        if self._executor is None or not self.warm_presets:
+            return
+        sources = [
+            (path, content_hash)
+            for path, content_hash in sources
+            if self.supports(path)
+        ]
+        if sources:
+            self._executor.submit(self._warm, sources)
+
+    def _warm(self, sources):
+        for path, content_hash in sources:
+            for preset in self.warm_presets:
+                try:
+                    self.get(path, preset, WARM_FORMAT, content_hash)
+                except Exception:
+                    self.logger.exception("预先生成缩略图失败: %s", path)
+
+    def _scan(self):
+        entries = []
+        for root, _, names in os.walk(self.folder):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _account(self, written):
+        """
+        记录新写入的字节数，超过上限时清理
+        """
+        if not self.max_size:
+            return
+        with self._size_lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._scan())
+            else:
+                self._size += written
+            if self._size > self.max_size:
+                self._size = self._evict()
+
+    def _evict(self):
+        # 其他进程也会写入缓存目录，以目录中的实际文件为准
+        entries = sorted(self._scan())
+        total = sum(size for _, size, _ in entries)
+        target = self.max_size * EVICT_RATIO
+        removed = 0
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        self.logger.info("缩略图缓存超过上限，删除最久未使用的%d个文件", removed)
+        return total
@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+"""
+上传文件增量备份（内容寻址存储）
+
+每次备份为uploads目录生成一份快照清单（路径、大小、修改时间、sha256），
+文件内容按sha256保存在对象目录中，相同内容只保存一次：
+- 大小和修改时间与上一份清单相同的文件直接沿用上次的sha256，不重新读取
+- 只有新增或修改过的文件才会计算哈希，对象不存在时才复制到对象目录
+- 每份清单都是完整的文件列表，可将uploads目录恢复到任意一次备份时的状态
+- 删除快照后清理不再被任何清单引用的对象
+
+目录结构：
+    <root>/objects/<sha256前两位>/<sha256>
+    <root>/manifests/<快照ID>.json
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+from datetime import datetime
+
+# 读取文件的块大小
+CHUNK_SIZE = 1024 * 1024
+
+_SNAPSHOT_ID_PATTERN = re.compile(r"^[\w.-]+$")
+
+
+class UploadStoreError(Exception):
+    """
+    快照不存在或对象缺失
+    """
+
+
+def walk_files(directory):
+    """
+    列出目录下的所有文件，返回 [(文件路径, 相对路径)]（按相对路径排序）
+    """
+    files = []
+    if directory and os.path.isdir(directory):
+        for root, _, names in os.walk(directory):
+            for name in names:
+                path = os.path.join(root, name)
+                relative = os.path.relpath(path, directory).replace(os.sep, "/")
+                files.append((path, relative))
+    files.sort(key=lambda item: item[1])
+    return files
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as source:
+        for chunk in iter(lambda: source.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _write_json_atomic(path, data):
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as output:
+            json.dump(data, output, ensure_ascii=False)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _copy_atomic(source, target):
+    """
+    复制到同目录的临时文件后重命名，避免留下不完整的文件
+    """
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(target), prefix=".tmp-")
+    try:
+        with open(source, "rb") as src, os.fdopen(fd, "wb") as dst:
+            shutil.copyfileobj(src, dst, CHUNK_SIZE)
+        os.replace(temp_path, target)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def manifest_summary(manifest):
+    """
+    清单的统计信息
+    """
+    return {
+        "id": manifest["id"],
+        "createdAt": manifest["createdAt"],
+        "files": len(manifest["files"]),
+        "bytes": sum(entry["size"] for entry in manifest["files"]),
+    }
+
+
+class UploadStore:
+    """
+    上传文件的内容寻址存储
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.objects_dir = os.path.join(root, "objects")
+        self.manifests_dir = os.path.join(root, "manifests")
+
+    def object_path(self, sha256):
+        return os.path.join(self.objects_dir, sha256[:2], sha256)
+
+    def _manifest_path(self, snapshot_id):
+        if not _SNAPSHOT_ID_PATTERN.match(snapshot_id or ""):
+            raise UploadStoreError(f"无效的快照ID: {snapshot_id}")
+        return os.path.join(self.manifests_dir, f"{snapshot_id}.json")
+
+    def snapshot_ids(self):
+        """
+        所有快照ID（按时间先后排序）
+        """
+        if not os.path.isdir(self.manifests_dir):
+            return []
+        return sorted(
+            name[:-5]
+            for name in os.listdir(self.manifests_dir)
+            if name.endswith(".json") and not name.startswith(".")
+        )
+
+    def load_manifest(self, snapshot_id):
+        path = self._manifest_path(snapshot_id)
+        if not os.path.exists(path):
+            raise UploadStoreError(f"快照不存在: {snapshot_id}")
+        with open(path, "r", encoding="utf-8") as source:
+            return json.load(source)
+
+    def list_snapshots(self):
+        """
+        所有快照的统计信息（最新的在前）
+        """
+        return [
+            manifest_summary(self.load_manifest(snapshot_id))
+            for snapshot_id in reversed(self.snapshot_ids())
+        ]
+
+    def snapshot(self, uploads_dir, snapshot_id, progress=None):
+        """
+        为uploads目录创建快照，只保存新增或修改过的文件
+
+        Args:
+            uploads_dir: uploads目录
+            snapshot_id: 快照ID（与备份文件名对应）
+            progress: 进度回调 progress(已处理文件数, 文件总数)
+
+        Returns:
+            tuple: (快照清单, 报告)，报告包含文件数、总大小、新增对象数和新增字节数
+        """
+        manifest_path = self._manifest_path(snapshot_id)
+        os.makedirs(self.manifests_dir, exist_ok=True)
+
+        previous = {}
+        snapshot_ids = self.snapshot_ids()
+        if snapshot_ids:
+            previous = {
+                entry["path"]: entry
+                for entry in self.load_manifest(snapshot_ids[-1])["files"]
+            }
+
+        files = walk_files(uploads_dir)
+        entries = []
+        hashed_files = new_objects = new_bytes = 0
+        for done, (path, relative) in enumerate(files, start=1):
+            stat = os.stat(path)
+            entry = previous.get(relative)
+            if (
+                entry
+                and entry["size"] == stat.st_size
+                and entry["mtime"] == stat.st_mtime_ns
+                and os.path.exists(self.object_path(entry["sha256"]))
+            ):
+                # 大小和修改时间未变，沿用上次的哈希
+                sha256 = entry["sha256"]
+            else:
+                sha256 = _file_sha256(path)
+                hashed_files += 1
+                object_path = self.object_path(sha256)
+                if not os.path.exists(object_path):
+                    _copy_atomic(path, object_path)
+                    new_objects += 1
+                    new_bytes += stat.st_size
+
+            entries.append(
+                {
+                    "path": relative,
+                    "size": stat.st_size,
+                    "mtime": stat.st_mtime_ns,
+                    "sha256": sha256,
+                }
+            )
+            if progress and (done % 100 == 0 or done == len(files)):
+                progress(done, len(files))
+
+        manifest = {
+            "id": snapshot_id,
+            "createdAt": datetime.now().isoformat(timespec="seconds"),
+            "files": entries,
+        }
+        _write_json_atomic(manifest_path, manifest)
+
+        report = manifest_summary(manifest)
+        report.update(
+            hashedFiles=hashed_files, newObjects=new_objects, newBytes=new_bytes
+        )
+        return manifest, report
+
+    def restore(self, manifest, uploads_dir, progress=None):
+        """
+        将uploads目录恢复为快照清单中的状态
+
+        清单中没有的文件会被删除，大小和修改时间与清单一致的文件保持不动。
+
+        Returns:
+            报告：文件总数、复制的文件数和删除的文件数
+        """
+        entries = manifest["files"]
+        missing = [
+            entry["path"]
+            for entry in entries
+            if not os.path.exists(self.object_path(entry["sha256"]))
+        ]
+        if missing:
+            raise UploadStoreError(
+                f"快照 {manifest['id']} 缺少{len(missing)}个文件对象，"
+                f"如：{', '.join(missing[:5])}"
+            )
+
+        root = os.path.realpath(uploads_dir)
+        os.makedirs(root, exist_ok=True)
+        wanted = {entry["path"] for entry in entries}
+
+        removed = 0
+        for path, relative in walk_files(root):
+            if relative not in wanted:
+                os.remove(path)
+                removed += 1
+
+        copied = 0
+        for done, entry in enumerate(entries, start=1):
+            target = os.path.realpath(os.path.join(root, entry["path"]))
+            # 防止路径穿越
+            if not target.startswith(root + os.sep):
+                continue
+            try:
+                stat = os.stat(target)
+                unchanged = (
+                    stat.st_size == entry["size"] and stat.st_mtime_ns == entry["mtime"]
+                )
+            except FileNotFoundError:
+                unchanged = False
+            if not unchanged:
+                _copy_atomic(self.object_path(entry["sha256"]), target)
+                os.utime(target, ns=(entry["mtime"], entry["mtime"]))
+                copied += 1
+            if progress and (done % 100 == 0 or done == len(entries)):
+                progress(done, len(entries))
+
+        return {"files": len(entries), "copied": copied, "removed": removed}
+
+    def delete_snapshot(self, snapshot_id):
+        """
+        删除快照清单（对象由 prune 清理）
+        """
+        path = self._manifest_path(snapshot_id)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def prune(self):
+        """
+        删除不再被任何快照引用的对象
+
+        Returns:
+            tuple: (删除的对象数, 释放的字节数)
+        """
+        referenced = set()
+        for snapshot_id in self.snapshot_ids():
+            referenced.update(
+                entry["sha256"] for entry in self.load_manifest(snapshot_id)["files"]
+            )
+
+        removed = freed = 0
+        for path, relative in walk_files(self.objects_dir):
+            name = os.path.basename(relative)
+            # 跳过正在写入的临时文件
+            if name.startswith(".") or name in referenced:
+                continue
+            freed += os.path.getsize(path)
+            os.remove(path)
+            removed += 1
+        return removed, freed
@@ -0,0 +1,427 @@
+# -*- coding: utf-8 -*-
+"""
+用户批量导入模块
+
+从Excel文件批量导入用户：
+- 使用openpyxl只读模式逐行流式读取，不把整个工作表加载到内存
+- 预先一次性加载已有用户名、学号和组织名称，逐行处理时不再查询数据库
+- 默认密码只哈希一次，所有新用户共用该哈希值
+- 新用户和学生记录分批使用 insert() 批量插入，已有用户分批使用 update() 批量更新
+- 每行的错误单独记录，不影响其他行的导入
+
+所有函数都不提交事务，由调用方提交。
+"""
+
+import openpyxl
+from sqlalchemy import insert, update
+from extensions import db, password_hasher
+from models import User, Student
+from utils.org_cache import get_org_snapshot
+
+# 新用户的默认密码
+DEFAULT_PASSWORD = "123456"
+
+# 每批插入/更新的记录数量
+IMPORT_CHUNK_SIZE = 500
+
+REQUIRED_HEADERS = ["用户名", "姓名", "角色", "状态"]
+OPTIONAL_HEADERS = [
+    "学院",
+    "系",
+    "专业",
+    "邮箱",
+    "电话",
+    "性别",
+    "CET4成绩",
+    "CET6成绩",
+    "绩点",
+    "转换分数",
+]
+
+VALID_ROLES = ["admin", "teacher", "student"]
+VALID_STATUSES = ["enabled", "disabled", "active"]
+
+
+class UserImportError(ValueError):
+    """
+    文件格式错误（如缺少必填表头），整个文件无法导入
+    """
+
+
+class RowError(Exception):
+    """
+    单行数据错误，记录后跳过该行
+    """
+
+
+def _cell_text(value):
+    """
+    将单元格的值转换为字符串（Excel中的学号等常被存为数字）
+    """
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def _cell_number(value, convert):
+    """
+    将单元格的值转换为数字，无法转换时返回None
+    """
+    if value is None or value == "":
+        return None
+    try:
+        return convert(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _name_index(names):
+    """
+    构建 名称 → ID 的反向映射，同名时取ID最小的记录
+    """
+    index = {}
+    for org_id in sorted(names):
+        index.setdefault(names[org_id], org_id)
+    return index
+
+
+def _read_header(header_row):
+    """
+    读取表头，返回 表头名称 → 列下标 的映射
+    """
+    header_to_index = {}
+    for index, header in enumerate(header_row or ()):
+        header = _cell_text(header)
+        if header:
+            header_to_index[header] = index
+
+    missing_headers = [h for h in REQUIRED_HEADERS if h not in header_to_index]
+    if missing_headers:
+        raise UserImportError(f"缺少必填表头：{','.join(missing_headers)}")
+    return header_to_index
+
+
+class _UserImporter:
+    """
+    一次导入过程的状态：预加载的查找表和待写入的记录
+    """
+
+    def __init__(self, default_password, chunk_size):
+        self.chunk_size = chunk_size
+
+        # 默认密码只哈希一次（后台任务中等待计算，不因登录高峰被拒绝）
+        self.password_hash = password_hasher.hash(default_password, wait=True)
+
+        # 预加载组织名称 → ID
+        org = get_org_snapshot()
+        self.faculty_ids = _name_index(org.faculty_names)
+        self.department_ids = _name_index(org.department_names)
+        self.major_ids = _name_index(org.major_names)
+
+        # 预加载已有用户和学生记录
+        self.users = {
+            row.username: row
+            for row in db.session.query(
+                User.id,
+                User.username,
+                User.role,
+                User.faculty_id,
+                User.department_id,
+                User.major_id,
+            )
+        }
+        self.student_ids = dict(db.session.query(Student.student_id, Student.id))
+
+        # 本次导入中已处理的用户名 → 行号（检测文件内重复）
+        self.seen_usernames = {}
+
+        # 待写入的记录
+        self.new_students = []
+        self.new_users = []
+        self.user_updates = []
+        self.student_updates = []
+
+        self.success_count = 0
+        self.row_errors = []
+
+    def _org_id(self, org_ids, name, label):
+        org_id = org_ids.get(name)
+        if org_id is None:
+            raise RowError(f"{label} '{name}' 不存在")
+        return org_id
+
+    def _resolve_org(self, org_ids, name, label, current):
+        """
+        更新已有用户时解析组织ID：
+        有名称时按名称查找，空字符串表示清空，未提供时保留原有值
+        """
+        if name:
+            return self._org_id(org_ids, name, label)
+        if name == "":
+            return None
+        return current
+
+    def process_row(self, row_number, values):
+        username = values["用户名"]
+        name = values["姓名"]
+        role = values["角色"]
+        status = values["状态"]
+
+        # 验证必填字段
+        if not username or not name or not role or not status:
+            raise RowError("用户名、姓名、角色和状态为必填字段")
+
+        first_row = self.seen_usernames.get(username)
+        if first_row is not None:
+            raise RowError(f"用户名 '{username}' 与第{first_row}行重复")
+
+        student_values = {
+            "gender": values["性别"],
+            "cet4_score": _cell_number(values["CET4成绩"], int),
+            "cet6_score": _cell_number(values["CET6成绩"], int),
+            "gpa": _cell_number(values["绩点"], float),
+            "academic_score": _cell_number(values["转换分数"], float),
+        }
+
+        existing_user = self.users.get(username)
+        if existing_user:
+            self._update_user(existing_user, values, student_values)
+        else:
+            self._create_user(values, student_values)
+        # 只有成功的行才占用用户名，校验失败的行不影响后续同名行
+        self.seen_usernames[username] = row_number
+        self.success_count += 1
+
+    def _update_user(self, existing_user, values, student_values):
+        """
+        更新已有用户（角色不变，状态不做校验）
+        """
+        faculty_id = self._resolve_org(
+            self.faculty_ids, values["学院"], "学院", existing_user.faculty_id
+        )
+        department_id = self._resolve_org(
+            self.department_ids, values["系"], "系", existing_user.department_id
+        )
+        major_id = self._resolve_org(
+            self.major_ids, values["专业"], "专业", existing_user.major_id
+        )
+
+        status = values["状态"]
+        # 将enabled转换为active以与数据库模型保持一致
+        if status == "enabled":
+            status = "active"
+
+        user_update = {
+            "id": existing_user.id,
+            "name": values["姓名"],
+            "faculty_id": faculty_id,
+            "department_id": department_id,
+            "major_id": major_id,
+            "email": values["邮箱"] or "",
+            "phone": values["电话"] or "",
+            "status": status,
+        }
+
+        if existing_user.role == "student":
+            username = existing_user.username
+            student_id = self.student_ids.get(username)
+            if student_id:
+                # 更新学生信息，并与User.before_save一样同步姓名和组织信息
+                student_update = {
+                    "id": student_id,
+                    "student_name": values["姓名"],
+                    **student_values,
+                }
+                if faculty_id:
+                    student_update["faculty_id"] = faculty_id
+                if department_id:
+                    student_update["department_id"] = department_id
+                if major_id:
+                    student_update["major_id"] = major_id
+                self.student_updates.append(student_update)
+            else:
+                # 学生记录不存在，创建新的学生记录
+                if not department_id or not major_id:
+                    raise RowError("学生用户必须填写学院、系和专业")
+                self.new_students.append(
+                    {
+                        "student_id": username,
+                        "student_name": values["姓名"],
+                        "faculty_id": faculty_id,
+                        "department_id": department_id,
+                        "major_id": major_id,
+                        **student_values,
+                    }
+                )
+                self.student_ids[username] = None
+                user_update["student_id"] = username
+
+        self.user_updates.append(user_update)
+
+    def _create_user(self, values, student_values):
+        """
+        创建新用户，学生角色同时创建学生记录
+        """
+        username = values["用户名"]
+        role = values["角色"]
+        status = values["状态"]
+
+        # 验证角色
+        if role not in VALID_ROLES:
+            raise RowError(f"角色 '{role}' 无效，应为 admin/teacher/student")
+
+        # 验证状态并统一转换为数据库使用的值
+        if status not in VALID_STATUSES:
+            raise RowError(f"状态 '{status}' 无效，应为 enabled/disabled/active")
+        if status == "enabled":
+            status = "active"
+
+        faculty_id = department_id = major_id = None
+        if values["学院"]:
+            faculty_id = self._org_id(self.faculty_ids, values["学院"], "学院")
+        if values["系"]:
+            department_id = self._org_id(self.department_ids, values["系"], "系")
+        if values["专业"]:
+            major_id = self._org_id(self.major_ids, values["专业"], "专业")
+
+        # 学生角色验证
+        if role == "student" and (not faculty_id or not department_id or not major_id):
+            raise RowError("学生用户必须填写学院、系和专业")
+
+        new_user = {
+            "username": username,
+            "password": self.password_hash,
+            "name": values["姓名"],
+            "role": role,
+            "faculty_id": faculty_id,
+            "department_id": department_id,
+            "major_id": major_id,
+            "student_id": None,
+            "email": values["邮箱"] or "",
+            "phone": values["电话"] or "",
+            "status": status,
+        }
+
+        # 学生角色需要创建学生记录（已存在对应的学生记录时不重复创建）
+        if role == "student" and username not in self.student_ids:
+            self.new_students.append(
+                {
+                    "student_id": username,
+                    "student_name": values["姓名"],
+                    "faculty_id": faculty_id,
+                    "department_id": department_id,
+                    "major_id": major_id,
+                    **student_values,
+                }
+            )
+            self.student_ids[username] = None
+            new_user["student_id"] = username
+
+        self.new_users.append(new_user)
+
+    def flush(self, force=False):
+        """
+        将待写入的记录分批写入数据库
+
+        :param force: 为False时仅在积累满一批后写入
+        """
+        pending = max(
+            len(self.new_students),
+            len(self.new_users),
+            len(self.user_updates),
+            len(self.student_updates),
+        )
+        if not pending or (not force and pending < self.chunk_size):
+            return
+
+        # 学生记录需先于引用它的用户写入
+        if self.new_students:
+            db.session.execute(insert(Student), self.new_students)
+        if self.student_updates:
+            db.session.execute(update(Student), self.student_updates)
+        if self.new_users:
+            db.session.execute(insert(User), self.new_users)
+        if self.user_updates:
+            db.session.execute(update(User), self.user_updates)
+
+        self.new_students = []
+        self.new_users = []
+        self.user_updates = []
+        self.student_updates = []
+
+
+def import_users_from_excel(
+    file, default_password=DEFAULT_PASSWORD, chunk_size=IMPORT_CHUNK_SIZE, progress=None
+):
+    """
+    从Excel文件批量导入用户（不提交事务）
+
+    Args:
+        file: Excel文件（路径或文件对象）
+        default_password: 新用户的默认密码
+        chunk_size: 每批写入的记录数量
+        progress: 进度回调 progress(已处理行数, 总行数)，总行数未知时为None
+
+    Returns:
+        导入报告：success_count、error_count、errors（错误描述列表）
+        和 row_errors（每行的行号、用户名和错误信息）
+
+    Raises:
+        UserImportError: 文件缺少必填表头
+    """
+    workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    try:
+        worksheet = workbook.active
+        total_rows = worksheet.max_row - 1 if worksheet.max_row else None
+        rows = worksheet.iter_rows(values_only=True)
+        header_to_index = _read_header(next(rows, None))
+        importer = _UserImporter(default_password, chunk_size)
+
+        columns = [
+            (header, header_to_index.get(header))
+            for header in REQUIRED_HEADERS + OPTIONAL_HEADERS
+        ]
+        numeric_headers = {"CET4成绩", "CET6成绩", "绩点", "转换分数"}
+
+        for row_number, row in enumerate(rows, start=2):
+            # 跳过空行
+            if not row or all(value is None for value in row):
+                continue
+
+            values = {}
+            for header, index in columns:
+                value = row[index] if index is not None and index < len(row) else None
+                values[header] = (
+                    value if header in numeric_headers else _cell_text(value)
+                )
+
+            try:
+                importer.process_row(row_number, values)
+            except Exception as e:
+                message = str(e) if isinstance(e, RowError) else f"导入失败 - {e}"
+                importer.row_errors.append(
+                    {
+                        "row": row_number,
+                        "username": values["用户名"],
+                        "message": message,
+                    }
+                )
+
+            importer.flush()
+            if progress is not None:
+                progress(row_number - 1, total_rows)
+
+        importer.flush(force=True)
+    finally:
+        workbook.close()
+
+    return {
+        "success_count": importer.success_count,
+        "error_count": len(importer.row_errors),
+        "errors": [
+            f"第{error['row']}行：{error['message']}" for error in importer.row_errors
+        ],
+        "row_errors": importer.row_errors,
+    }
@@ -1,6 +1,9 @@
 import { defineStore } from 'pinia'
 import { ref, computed } from 'vue'
-import api from '../utils/api.js'
+import api, { RESUMABLE_UPLOAD_THRESHOLD, uploadFileResumable } from '../utils/api.js'
+
+// 分页加载申请列表时每页的数量（后端上限为500）
+const APPLICATIONS_PAGE_SIZE = 500
 
 export const useApplicationsStore = defineStore('applications', () => {
   // 辅助函数：字段名转换
@@ -24,7 +27,8 @@ export const useApplicationsStore = defineStore('applications', () => {
       'appliedAt': 'applied_at',
       'createdAt': 'created_at',
       'updatedAt': 'updated_at',
-      'dynamicCoefficients': 'dynamic_coefficients'
+      'dynamicCoefficients': 'dynamic_coefficients',
+      'uploadIds': 'upload_ids'
     };
     
     // 创建反向映射：后端下划线命名 -> 前端驼峰式命名
@@ -116,8 +120,16 @@ export const useApplicationsStore = defineStore('applications', () => {
       if (filters.reviewedStartDate) queryParams.append('reviewedStartDate', filters.reviewedStartDate)
       if (filters.reviewedEndDate) queryParams.append('reviewedEndDate', filters.reviewedEndDate)
 
-      const queryString = queryParams.toString() ? `?${queryParams.toString()}` : ''
-      const data = await api.apiRequest(`/applications${queryString}`)
+      // 按游标分页加载，每个请求最多返回一页
+      const data = []
+      let cursor = null
+      queryParams.set('limit', APPLICATIONS_PAGE_SIZE)
+      do {
+        if (cursor) queryParams.set('cursor', cursor)
+        const page = await api.apiRequest(`/applications?${queryParams.toString()}`)
+        data.push(...page.applications)
+        cursor = page.hasMore ? page.nextCursor : null
+      } while (cursor)
       applications.value = data
       return data
     } catch (err) {
@@ -186,6 +198,17 @@ export const useApplicationsStore = defineStore('applications', () => {
     }
   }
 
+  // 分块上传超过阈值的新文件，返回上传ID列表
+  const uploadLargeFiles = async (files) => {
+    const uploadIds = []
+    for (const file of files) {
+      if (file instanceof File && file.size > RESUMABLE_UPLOAD_THRESHOLD) {
+        uploadIds.push(await uploadFileResumable(file))
+      }
+    }
+    return uploadIds
+  }
+
   // 添加新申请
   const addApplication = async (application) => {
     loading.value = true
@@ -209,6 +232,8 @@ export const useApplicationsStore = defineStore('applications', () => {
       }
       // 保存原始files数组用于单独处理File实例
       const files = application.files || []
+      // 大文件先分块上传（支持断点续传），申请中通过上传ID引用
+      applicationData.uploadIds = await uploadLargeFiles(files)
 
       // 使用辅助函数转换字段名
       const transformedData = transformFieldNames(applicationData)
@@ -219,7 +244,7 @@ export const useApplicationsStore = defineStore('applications', () => {
       // 添加文件到FormData - 只添加新上传的浏览器File对象
       // 从后端加载的文件（非File实例）不会被添加，后端会保留这些文件
       files.forEach((file) => {
-        if (file instanceof File) {
+        if (file instanceof File && file.size <= RESUMABLE_UPLOAD_THRESHOLD) {
           formData.append('files', file)
         }
       })
@@ -338,6 +363,8 @@ export const useApplicationsStore = defineStore('applications', () => {
       }
       // 保存原始files数组用于单独处理File实例
       const files = applicationData.files || []
+      // 大文件先分块上传（支持断点续传），申请中通过上传ID引用
+      data.uploadIds = await uploadLargeFiles(files)
 
       // 使用辅助函数转换字段名
       const transformedData = transformFieldNames(data)
@@ -348,7 +375,7 @@ export const useApplicationsStore = defineStore('applications', () => {
       // 添加文件到FormData - 只添加新上传的浏览器File对象
       // 从后端加载的文件（非File实例）不会被添加，后端会保留这些文件
       files.forEach((file, index) => {
-        if (file instanceof File) {
+        if (file instanceof File && file.size <= RESUMABLE_UPLOAD_THRESHOLD) {
           formData.append(`files[${index}]`, file)
         }
       })
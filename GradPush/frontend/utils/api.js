@@ -53,6 +53,12 @@ export function getFileFullUrl(fileUrl) {
   return `${FILE_BASE_URL}/${cleanedUrl}`;
 }
 
+// 获取证明材料图片的缩略图URL（preset: small / medium / large，非附件路径返回原URL）
+export function getThumbnailUrl(fileUrl, preset = 'small') {
+  const fullUrl = getFileFullUrl(fileUrl);
+  return fullUrl.replace('/uploads/files/', `/uploads/thumbnails/${preset}/`);
+}
+
 // 封装API请求（支持JSON和文件上传）
 async function apiRequest(endpoint, method = 'GET', data = null, token = null, timeout = 10000) {
   const url = buildUrl(API_BASE_URL, endpoint);
@@ -111,10 +117,109 @@ async function apiRequest(endpoint, method = 'GET', data = null, token = null, t
   }
 }
 
+// 轮询后台任务直到结束（导入、备份、恢复、成绩重算等接口返回202和任务ID）
+// 任务成功时返回任务结果，失败或取消时抛出错误
+export async function waitForJob(jobId, { interval = 1000, onProgress = null } = {}) {
+  while (true) {
+    const { job } = await apiRequest(`/jobs/${jobId}`);
+
+    if (onProgress && job.progress) {
+      onProgress(job.progress);
+    }
+
+    if (job.status === 'succeeded') {
+      return job.result;
+    }
+    if (job.status === 'failed') {
+      throw new Error(job.error || '任务执行失败');
+    }
+    if (job.status === 'cancelled') {
+      throw new Error('任务已取消');
+    }
+
+    await new Promise(resolve => setTimeout(resolve, interval));
+  }
+}
+
+// 超过该大小的文件使用分块上传（支持断点续传）
+export const RESUMABLE_UPLOAD_THRESHOLD = 4 * 1024 * 1024;
+
+// 分块上传单个文件，返回上传ID（创建/更新申请时通过 uploadIds 引用）
+// 网络中断时自动重试；页面刷新后再次上传同一文件，从服务端已接收的字节数继续
+export async function uploadFileResumable(file, { onProgress = null, retries = 5 } = {}) {
+  const storageKey = `upload:${file.name}:${file.size}:${file.lastModified}`;
+  let upload = null;
+
+  const savedId = localStorage.getItem(storageKey);
+  if (savedId) {
+    try {
+      upload = await apiRequest(`/uploads/${savedId}`);
+    } catch (error) {
+      localStorage.removeItem(storageKey);
+    }
+  }
+  if (!upload) {
+    upload = await apiRequest('/uploads', 'POST', {
+      filename: file.name,
+      size: file.size,
+      type: file.type
+    });
+    localStorage.setItem(storageKey, upload.uploadId);
+  }
+
+  let offset = upload.offset;
+  let failures = 0;
+  while (offset < file.size) {
+    try {
+      const response = await fetch(buildUrl(API_BASE_URL, `/uploads/${upload.uploadId}`), {
+        method: 'PATCH',
+        headers: {
+          'Upload-Offset': String(offset),
+          'Content-Type': 'application/offset+octet-stream'
+        },
+        body: file.slice(offset, offset + upload.chunkSize),
+        credentials: 'include'
+      });
+      const data = await response.json();
+
+      // 服务端已接收的字节数与本地不一致（如上一块已写入但响应丢失），从服务端偏移继续
+      if (response.status === 409 && data.offset !== undefined) {
+        offset = data.offset;
+        continue;
+      }
+      if (!response.ok) {
+        localStorage.removeItem(storageKey);
+        throw new Error(data.message || '文件上传失败');
+      }
+
+      offset = data.offset;
+      failures = 0;
+      if (onProgress) {
+        onProgress(offset, file.size);
+      }
+    } catch (error) {
+      // fetch 在网络中断时抛出 TypeError，等待后重试
+      if (error instanceof TypeError && failures < retries) {
+        failures += 1;
+        await new Promise(resolve => setTimeout(resolve, 1000 * 2 ** failures));
+        continue;
+      }
+      throw error;
+    }
+  }
+
+  localStorage.removeItem(storageKey);
+  return upload.uploadId;
+}
+
 // 导出API函数
 export default {
   // 基础请求方法
   apiRequest,
+  // 后台任务相关
+  getJob: (jobId) => apiRequest(`/jobs/${jobId}`),
+  cancelJob: (jobId) => apiRequest(`/jobs/${jobId}/cancel`, 'POST'),
+  waitForJob,
   // 认证相关
   login: (data) => apiRequest('/login', 'POST', data),
   register: (data) => apiRequest('/register', 'POST', data),
@@ -258,6 +363,7 @@ export default {
   recalculateComprehensiveScores: (params) => {
     const queryParams = params ? new URLSearchParams(params).toString() : '';
     const endpoint = `/students/recalculate-comprehensive-scores${queryParams ? `?${queryParams}` : ''}`;
-    return apiRequest(endpoint, 'POST');
+    // 重算在后台任务中执行，等待任务完成后返回结果
+    return apiRequest(endpoint, 'POST').then(data => (data.jobId ? waitForJob(data.jobId) : data));
   }
 };
\ No newline at end of file